@@ -3,43 +3,58 @@ import carla
 import numpy as np
 from PIL import Image
 
+from writer import sensor_array, encode_frame, resize_frame, modality_of
+
 SpawnActor = carla.command.SpawnActor
 SetAutopilot = carla.command.SetAutopilot
 SetVehicleLightState = carla.command.SetVehicleLightState
 FutureActor = carla.command.FutureActor
 
+CAM_BLUEPRINTS = {
+    'rgb': 'sensor.camera.rgb',
+    'dep': 'sensor.camera.depth',
+    'isg': 'sensor.camera.instance_segmentation',
+    'ofl': 'sensor.camera.optical_flow',
+}
+
 
 class Operator:
     def __init__(self, sync_world, spawn_point):
         self.sync_world = sync_world
         self.spawn_point = spawn_point
-        bp_lib = sync_world.world.get_blueprint_library()
-        self.blueprint = bp_lib.filter('vehicle')[1]
-        self.cam_blueprints = [bp_lib.find('sensor.camera.rgb'),
-                               bp_lib.find('sensor.camera.depth'),
-                               bp_lib.find('sensor.camera.instance_segmentation'),
-                               bp_lib.find('sensor.camera.optical_flow')]
-
-        for blueprint in self.cam_blueprints:
-            blueprint.set_attribute('image_size_x', str(sync_world.img_w))
-            blueprint.set_attribute('image_size_y', str(sync_world.img_h))
-            blueprint.set_attribute('fov', str(sync_world.fov))
-
-        self.cam_names = ['rgb', 'dep', 'isg', 'ofl']
-        self._cam_cc = [carla.ColorConverter.Raw,
-                        carla.ColorConverter.Depth,
-                        carla.ColorConverter.Raw,
-                        carla.ColorConverter.Raw]
+        assets = sync_world.assets
+        self.blueprint = assets.blueprint_library(sync_world.world).filter('vehicle')[1]
+        if sync_world.needs_hero:
+            self.blueprint.set_attribute('role_name', 'hero')
+
+        # one sensor per camera of the rig and modality, all spawned in one batch and attached to the operator
+        self.cam_names = []  # e.g. 'rgb' for the default rig, 'left/rgb' for a camera named left
+        self.cam_blueprints = []
+        self.cam_transforms = []
+        self._cam_cc = []
+        for camera in sync_world.rig:
+            transform = carla.Transform(carla.Location(x=camera.x, y=camera.y, z=camera.z),
+                                        carla.Rotation(pitch=camera.pitch, yaw=camera.yaw, roll=camera.roll))
+            for modality in camera.modalities:
+                blueprint = assets.blueprint(sync_world.world, CAM_BLUEPRINTS[modality])
+                blueprint.set_attribute('image_size_x', str(camera.img_w))
+                blueprint.set_attribute('image_size_y', str(camera.img_h))
+                blueprint.set_attribute('fov', str(camera.fov))
+                self.cam_names.append(camera.output_name(modality))
+                self.cam_blueprints.append(blueprint)
+                self.cam_transforms.append(transform)
+                self._cam_cc.append(carla.ColorConverter.Depth if modality == 'dep' else carla.ColorConverter.Raw)
+
         self.actor = None
         self.cams = []
-        self.cam_transform = self.sync_world.cam_transform
+        self.first_frame = None  # first recorded frame, set by SyncWorld.tick, frame indices of the sink are relative to it
 
     def get_spawn_cmd(self):
         return SpawnActor(self.blueprint, self.spawn_point)\
             .then(SetAutopilot(FutureActor, True, self.sync_world.tm_port))
 
     def get_spawn_cam_cmds(self):
-        return [SpawnActor(cam, self.cam_transform, self.actor) for cam in self.cam_blueprints]
+        return [SpawnActor(cam, transform, self.actor) for cam, transform in zip(self.cam_blueprints, self.cam_transforms)]
 
     def stop(self):
         for cam in self.cams:
@@ -50,22 +65,68 @@ class Operator:
     # source: https://github.com/carla-simulator/carla/blob/0.9.11/PythonAPI/examples/sensor_synchronization.py#L41
     def save_cam_data(self, *cam_data):
         for cam_name, cam_cc, data in zip(self.cam_names, self._cam_cc, cam_data):
-            path_dir = os.path.join(self.sync_world.dataset_path, cam_name)
-            path = os.path.join(path_dir, '%08d.png' % data.frame)
+            if data is None:
+                # not captured in this frame, see SyncWorld.periods
+                continue
+            frame = data.frame + self.sync_world.frame_offset
+            frame_index = frame - self.first_frame
 
-            if cam_name == 'dep':
-                # https://github.com/carla-simulator/carla/blob/0.9.13/LibCarla/source/carla/image/ColorConverter.h#L28-L42
-                data.save_to_disk(path, cam_cc)
+            if not self.sync_world.outputs:
+                self.save_frame(cam_name, cam_cc, data, frame, frame_index, self.sync_world.sink, self.sync_world.raw_arrays)
                 continue
-            elif cam_name == 'ofl':
-                data = data.get_color_coded_flow()
+            # rendered at the largest resolution, written at every resolution of the sample
+            for output in self.sync_world.outputs:
+                self.save_frame(cam_name, cam_cc, data, frame, frame_index, output.sink, output.raw_arrays, output.sizes[cam_name])
+
+    def save_frame(self, cam_name, cam_cc, data, frame, frame_index, sink, raw_arrays, size=None):
+        writer = self.sync_world.writer
+        timer = self.sync_world.timer
+        resize = None
+        if size is not None and size != (data.height, data.width):
+            resize = (*size, self.sync_world.resample)
+
+        if raw_arrays is not None and raw_arrays.handles(cam_name):
+            # no color coding and no compression
+            with timer.measure('raw_' + cam_name):
+                raw = sensor_array(cam_name, data)
+                raw_arrays.write(cam_name, frame_index, raw if resize is None else resize_frame(cam_name, raw, *resize))
+            return
+
+        sink.expect(cam_name, frame_index)
+        codec = self.sync_world.codecs.get(modality_of(cam_name))
+
+        if writer is not None:
+            # conversion, resizing and encoding happen in the writer processes
+            with timer.measure('submit_' + cam_name):
+                writer.submit(cam_name, frame_index, frame, sensor_array(cam_name, data), sink, resize, codec)
+            return
+
+        with timer.measure('save_' + cam_name):
+            if resize is not None or codec is not None:
+                raw = sensor_array(cam_name, data)
+                raw = raw if resize is None else resize_frame(cam_name, raw, *resize)
+                ext = codec.ext if codec is not None else 'png'
+                sink.write(cam_name, frame_index, frame, encode_frame(cam_name, raw, codec), ext)
+            elif sink.direct:
+                self.save_image(cam_name, cam_cc, data, sink.path(cam_name, frame))
+            else:
+                sink.write(cam_name, frame_index, frame, encode_frame(cam_name, sensor_array(cam_name, data)))
+
+    @staticmethod
+    def save_image(cam_name, cam_cc, data, path):
+        if modality_of(cam_name) == 'dep':
+            # https://github.com/carla-simulator/carla/blob/0.9.13/LibCarla/source/carla/image/ColorConverter.h#L28-L42
+            data.save_to_disk(path, cam_cc)
+            return
+        elif modality_of(cam_name) == 'ofl':
+            data = data.get_color_coded_flow()
 
-            img = np.frombuffer(data.raw_data, dtype=np.dtype("uint8"))
-            img = np.reshape(img, (data.height, data.width, 4))
-            img = img[..., 2::-1]  # BGRA2RGB
+        img = np.frombuffer(data.raw_data, dtype=np.dtype("uint8"))
+        img = np.reshape(img, (data.height, data.width, 4))
+        img = img[..., 2::-1]  # BGRA2RGB
 
-            os.makedirs(path_dir, exist_ok=True)
-            Image.fromarray(img).save(path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        Image.fromarray(img).save(path)
 
     def get_speed(self):
         vel = self.actor.get_velocity()
@@ -1,3 +1,8 @@
+HYBRID_RADIUS = 50.0  # defaults of CARLA 0.9.13
+ACTIVE_DISTANCE = 2000.0
+RESPAWN_LOWER_BOUND = 25.0
+
+
 class TrafficManager:
     def __init__(self, sync_world):
         self.tm = sync_world.client.get_trafficmanager(sync_world.tm_port)
@@ -5,6 +10,15 @@ class TrafficManager:
         self.tm.set_global_distance_to_leading_vehicle(1.0)
         self.tm.global_percentage_speed_difference(sync_world.speed_diff)
 
+        # physics only for the vehicles within hybrid_radius of the ego vehicle (role_name hero), dormant vehicles
+        # respawn around it. Both are set every sample, the traffic manager keeps them if the world is reused
+        self.tm.set_hybrid_physics_mode(sync_world.hybrid_physics)
+        if sync_world.hybrid_physics:
+            self.tm.set_hybrid_physics_radius(sync_world.hybrid_radius)
+        self.tm.set_respawn_dormant_vehicles(sync_world.respawn_dormant)
+        if sync_world.respawn_dormant:
+            self.tm.set_boundaries_respawn_dormant_vehicles(RESPAWN_LOWER_BOUND, sync_world.active_distance)
+
         # make traffic manager deterministic
         self.tm.set_random_device_seed(sync_world.seed)
         self.tm.set_synchronous_mode(True)
@@ -10,7 +10,7 @@ FutureActor = carla.command.FutureActor
 
 class Vehicle:
     def __init__(self, sync_world, spawn_point):
-        self.blueprint = get_random_vehicle_bp(get_bp_vehicles(sync_world.world, 'vehicle.*'))
+        self.blueprint = get_random_vehicle_bp(sync_world.assets, sync_world.world)
         self.actor = None
         self.spawn_point = spawn_point
         self.tm_port = sync_world.tm_port
@@ -23,8 +23,8 @@ class Vehicle:
         self.actor.destroy()
 
 
-def get_random_vehicle_spawn_points(world, amount):
-    spawn_points = world.get_map().get_spawn_points()
+def get_random_vehicle_spawn_points(spawn_points, amount):
+    spawn_points = list(spawn_points)
     random.shuffle(spawn_points)
 
     if amount > len(spawn_points):
@@ -35,8 +35,8 @@ def get_random_vehicle_spawn_points(world, amount):
     return spawn_points[:amount]
 
 
-def get_bp_vehicles(world, filterv):
-    bp_vehicles = world.get_blueprint_library().filter(filterv)
+def get_bp_vehicles(bp_lib, filterv):
+    bp_vehicles = bp_lib.filter(filterv)
     # avoid spawning vehicles prone to accidents
     bp_vehicles = [x for x in bp_vehicles if int(x.get_attribute('number_of_wheels')) == 4]
     bp_vehicles = [x for x in bp_vehicles if not x.id.endswith('microlino')]
@@ -52,8 +52,8 @@ def get_bp_vehicles(world, filterv):
     return bp_vehicles
 
 
-def get_random_vehicle_bp(bp_vehicles):
-    vehicle_bp = random.choice(bp_vehicles)
+def get_random_vehicle_bp(assets, world):
+    vehicle_bp = assets.blueprint(world, random.choice(assets.vehicle_blueprint_ids(world)))
 
     if vehicle_bp.has_attribute('color'):
         color = random.choice(vehicle_bp.get_attribute('color').recommended_values)
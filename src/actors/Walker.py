@@ -5,10 +5,12 @@ SpawnActor = carla.command.SpawnActor
 
 
 class Walker:
-    def __init__(self, sync_world, spawn_point):
+    def __init__(self, sync_world, spawn_point, destination):
         self.world = sync_world.world
+        self.assets = sync_world.assets
         self.blueprint, self.speed = get_random_walker_bp(
-            self.world.get_blueprint_library().filter('walker.pedestrian.*'),
+            self.assets,
+            self.world,
             sync_world.running_factor,
             sync_world.standing_factor
         )
@@ -16,22 +18,18 @@ class Walker:
         self.actor = None
         self.controller = None
         self.spawn_point = spawn_point
+        self.destination = destination
 
     def get_spawn_cmd(self):
         return SpawnActor(self.blueprint, self.spawn_point)
 
     def get_spawn_controller_cmd(self):
         return SpawnActor(
-            self.world.get_blueprint_library().find('controller.ai.walker'),
+            self.assets.blueprint(self.world, 'controller.ai.walker'),
             carla.Transform(),
             self.actor
         )
 
-    def start(self):
-        self.controller.start()
-        self.controller.go_to_location(self.world.get_random_location_from_navigation())
-        self.controller.set_max_speed(float(self.speed))
-
     def stop(self):
         if self.controller is not None:
             self.controller.stop()
@@ -39,8 +37,8 @@ class Walker:
         self.actor.destroy()
 
 
-def get_random_walker_bp(bp_walkers, running_factor, standing_factor):
-    blueprint = random.choice(bp_walkers)
+def get_random_walker_bp(assets, world, running_factor, standing_factor):
+    blueprint = assets.blueprint(world, random.choice(assets.walker_blueprint_ids(world)))
 
     # set as not invincible
     if blueprint.has_attribute('is_invincible'):
@@ -0,0 +1,276 @@
+"""
+Annotations derived from the actor states and the cameras of a sample, computed for all actors of a frame (or of many
+frames) in one NumPy pass and written to <sample>/annotations.npz:
+
+    frames                  [F] frame ids
+    actor_ids               [A] actor ids, in the order of the actor table (the ego vehicle first)
+    ego_location            [F, A, 3] position of the actors in the frame of the ego vehicle (x forward, y right, z up)
+    ego_heading             [F, A] yaw of the actors relative to the ego vehicle in degrees
+    ego_velocity            [F, A, 3] velocity of the actors relative to the ego vehicle, in its frame
+    <camera>/corners        [F, A, 8, 2] image coordinates (u, v) of the bounding box corners, NaN behind the camera
+    <camera>/depth          [F, A] distance of the box center along the optical axis
+    <camera>/box            [F, A, 4] 2D box (u_min, v_min, u_max, v_max) clipped to the image, NaN if not in view
+    <camera>/in_view        [F, A] fraction of the unclipped 2D box inside the image
+    <camera>/visible_pixels [F, A] pixels of the actor in the instance segmentation, -1 without instance segmentation
+
+<camera>/ is left out for the single camera of a sample without rig. The client computes them while generating with
+--annotations inline, existing samples are annotated with a process pool:
+
+    python3 annotations.py /mnt/dataset/default4 --jobs 16
+
+The bounding boxes come from the header of actors.traj, samples without them (written with --actor-format csv or
+before the boxes were recorded) take them from the bounding_boxes.json of the asset cache, see --boxes.
+"""
+import os
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from dataset import get_params_data, is_sample_done
+from frame_codecs import split_instances
+from geometry import rotation_vectors
+from rig import rig_from_info
+from writer import resize_frame, sensor_array
+
+ANNOTATIONS_NAME = 'annotations.npz'
+
+# signs of the 8 corners of a box
+CORNERS = np.array([[x, y, z] for x in (-1, 1) for y in (-1, 1) for z in (-1, 1)], dtype=np.float32)
+# columns of trajectory.STATE_COLUMNS
+FORWARD, RIGHT, UP, ROTATION, LOCATION, VELOCITY = slice(0, 3), slice(3, 6), slice(6, 9), slice(9, 12), slice(12, 15), slice(15, 18)
+# frames annotated at once by annotate_sample, bounds the memory of the corner arrays
+CHUNK_FRAMES = 64
+
+
+def rotation_matrices(states):
+    # [..., 3, 3] with the forward, right and up vectors as columns, maps actor to world coordinates
+    return np.stack([states[..., FORWARD], states[..., RIGHT], states[..., UP]], axis=-1)
+
+
+def focal_length(camera):
+    return camera.img_w / (2.0 * np.tan(np.radians(camera.fov) / 2.0))
+
+
+def visible_pixels(instance_ids, actor_ids):
+    """Pixels of every actor in an image of instance ids, which are the lower 16 bits of the actor ids."""
+    counts = np.bincount(instance_ids.ravel(), minlength=1 << 16)
+    return counts[np.asarray(actor_ids) & 0xffff].astype(np.int32)
+
+
+def sensor_instance_ids(rig, cam_names, cam_data):
+    # {camera name: [H, W] instance ids} of the raw instance segmentation buffers, at the resolution of the rig cameras
+    instance_ids = {}
+    for camera in rig:
+        name = camera.output_name('isg')
+        if cam_data is None or name not in cam_names or cam_data[cam_names.index(name)] is None:
+            continue
+        raw = resize_frame(name, sensor_array(name, cam_data[cam_names.index(name)]), camera.img_h, camera.img_w)
+        instance_ids[camera.name] = raw[..., 1].astype(np.uint16) | (raw[..., 0].astype(np.uint16) << 8)
+    return instance_ids
+
+
+def annotate(states, boxes, rig, pixels=None):
+    """
+    Annotations of the frames of states [F, A, len(STATE_COLUMNS)] (ego vehicle first), boxes [A, 6] and the cameras
+    of the rig. pixels maps '<camera>/visible_pixels' to the [F, A] counts of the cameras with instance segmentation.
+    """
+    states = np.asarray(states, dtype=np.float32)
+    ego = states[:, 0]
+    ego_rot = rotation_matrices(ego)  # [F, 3, 3]
+    rot = rotation_matrices(states)  # [F, A, 3, 3]
+    loc = states[..., LOCATION]
+
+    # x_ego = R_ego^T (x_world - t_ego)
+    annotations = {
+        'ego_location': np.einsum('fji,faj->fai', ego_rot, loc - ego[:, None, LOCATION]),
+        'ego_velocity': np.einsum('fji,faj->fai', ego_rot, states[..., VELOCITY] - ego[:, None, VELOCITY]),
+    }
+    heading = np.einsum('fji,faj->fai', ego_rot, states[..., FORWARD])
+    annotations['ego_heading'] = np.degrees(np.arctan2(heading[..., 1], heading[..., 0]))
+
+    # corners and box centers in world coordinates, [F, A, 9, 3] with the center last
+    local = np.concatenate([boxes[:, None, :3] + CORNERS * boxes[:, None, 3:], boxes[:, None, :3]], axis=1)
+    points = loc[:, :, None] + np.einsum('faij,akj->faki', rot, local)
+
+    for camera in rig:
+        # the cameras are attached to the ego vehicle
+        cam_fwd, cam_rgt, cam_upp = rotation_vectors([camera.pitch, camera.yaw, camera.roll])
+        cam_rot = ego_rot @ np.stack([cam_fwd, cam_rgt, cam_upp], axis=-1)
+        cam_loc = ego[:, LOCATION] + ego_rot @ np.array([camera.x, camera.y, camera.z], dtype=np.float32)
+        # (forward, right, up) in the camera frame
+        cam_points = np.einsum('fji,fakj->faki', cam_rot, points - cam_loc[:, None, None])
+
+        depth = cam_points[..., 0]
+        in_front = depth > 1e-3
+        f = focal_length(camera)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            u = np.where(in_front, camera.img_w / 2.0 + f * cam_points[..., 1] / depth, np.nan)
+            v = np.where(in_front, camera.img_h / 2.0 - f * cam_points[..., 2] / depth, np.nan)
+        corners = np.stack([u[..., :8], v[..., :8]], axis=-1)
+
+        # 2D box of the corners in front of the camera
+        front = in_front[..., :8]
+        u_min, u_max = np.where(front, u[..., :8], np.inf).min(axis=-1), np.where(front, u[..., :8], -np.inf).max(axis=-1)
+        v_min, v_max = np.where(front, v[..., :8], np.inf).min(axis=-1), np.where(front, v[..., :8], -np.inf).max(axis=-1)
+        box = np.stack([np.clip(u_min, 0, camera.img_w), np.clip(v_min, 0, camera.img_h),
+                        np.clip(u_max, 0, camera.img_w), np.clip(v_max, 0, camera.img_h)], axis=-1)
+        any_front = front.any(axis=-1)
+        area = np.where(any_front, (u_max - u_min) * (v_max - v_min), 0.0)
+        clipped_area = np.where(any_front, (box[..., 2] - box[..., 0]) * (box[..., 3] - box[..., 1]), 0.0)
+        in_view = np.divide(clipped_area, area, out=np.zeros_like(area), where=area > 0)
+        box[in_view <= 0] = np.nan
+
+        annotations[camera.output_name('corners')] = corners
+        annotations[camera.output_name('depth')] = depth[..., 8]
+        annotations[camera.output_name('box')] = box
+        annotations[camera.output_name('in_view')] = in_view
+        name = camera.output_name('visible_pixels')
+        if pixels is not None and name in pixels:
+            annotations[name] = np.asarray(pixels[name], dtype=np.int32)
+        else:
+            annotations[name] = np.full(states.shape[:2], -1, dtype=np.int32)
+
+    return {key: value.astype(np.float32) if value.dtype == np.float64 else value for key, value in annotations.items()}
+
+
+def save_annotations(path, frames, actor_ids, annotations):
+    tmp_path = path + '.tmp.npz'
+    np.savez_compressed(tmp_path, frames=np.asarray(frames, dtype=np.int64), actor_ids=np.asarray(actor_ids, dtype=np.int64),
+                        **annotations)
+    os.replace(tmp_path, path)
+
+
+class AnnotationStage:
+    """Annotates the frames while a sample is generated and writes the annotations when it is done."""
+
+    def __init__(self, rig, actor_ids, boxes):
+        self.rig = rig
+        self.actor_ids = list(actor_ids)
+        self.boxes = boxes
+        self._frames = []
+        self._annotations = []
+
+    def add(self, frame, states, instance_ids=None):
+        # instance_ids: {camera name: [H, W] instance ids at the resolution of the camera}
+        pixels = {camera.output_name('visible_pixels'): visible_pixels(instance_ids[camera.name], self.actor_ids)[None]
+                  for camera in self.rig if instance_ids and camera.name in instance_ids}
+        self._frames.append(frame)
+        self._annotations.append(annotate(states[None], self.boxes, self.rig, pixels))
+
+    def save(self, sample_path):
+        annotations = {key: np.concatenate([frame[key] for frame in self._annotations])
+                       for key in (self._annotations[0] if self._annotations else [])}
+        save_annotations(os.path.join(sample_path, ANNOTATIONS_NAME), self._frames, self.actor_ids, annotations)
+
+
+def load_boxes(path):
+    # {type id: [6]} of a bounding_boxes.json of the asset cache
+    with open(path, mode='r') as json_file:
+        return json.load(json_file)
+
+
+def annotate_sample(sample_path, info=None, boxes=None):
+    """
+    Annotates a written sample, reading the actor states and the instance segmentation from disk. boxes: [A, 6] or
+    {type id: [6]}, used if actors.traj has no bounding boxes.
+    """
+    from reader import SampleReader
+    sample = SampleReader(sample_path, info)
+    try:
+        if 'actors' not in sample.modalities:
+            raise ValueError('%s has no actor states' % sample_path)
+        trajectory = getattr(sample, 'trajectory', None)
+        if trajectory is not None:
+            actor_ids, type_ids = trajectory.actor_ids, [actor['type_id'] for actor in trajectory.actors]
+        else:
+            # actor CSVs, the static columns of the first frame
+            rows = sample.read_bytes('actors', 0).decode('utf-8').splitlines()[1:]
+            actor_ids, type_ids = [int(row.split(',')[0]) for row in rows], [row.split(',')[1] for row in rows]
+
+        if trajectory is not None and trajectory.boxes is not None:
+            boxes = trajectory.boxes
+        elif isinstance(boxes, dict):
+            boxes = np.array([boxes[type_id] for type_id in type_ids], dtype=np.float32)
+        if boxes is None:
+            raise ValueError('%s has no bounding boxes, pass the bounding_boxes.json of the asset cache' % sample_path)
+
+        rig = rig_from_info(sample.info)
+        # the frames with actor states, -1 visible pixels in those without instance segmentation
+        actor_indices = sample.capture_indices('actors')
+        chunks = []
+        for start in range(0, len(actor_indices), CHUNK_FRAMES):
+            indices = actor_indices[start:start + CHUNK_FRAMES]
+            states = np.stack([sample.read_frame('actors', index) for index in indices])
+            pixels = {}
+            for camera in rig:
+                name = camera.output_name('isg')
+                if name in sample.modalities:
+                    pixels[camera.output_name('visible_pixels')] = np.stack(
+                        [visible_pixels(split_instances(sample.read_frame(name, index))[1], actor_ids)
+                         if index % sample.periods[name] == 0 else np.full(len(actor_ids), -1, dtype=np.int32)
+                         for index in indices])
+            chunks.append(annotate(states, boxes, rig, pixels))
+        annotations = {key: np.concatenate([chunk[key] for chunk in chunks]) for key in chunks[0]}
+        save_annotations(os.path.join(sample_path, ANNOTATIONS_NAME), sample.frames[actor_indices], actor_ids, annotations)
+    finally:
+        sample.close()
+
+
+def _annotate_task(task):
+    sample_path, boxes, force = task
+    if not is_sample_done(sample_path) or (not force and os.path.exists(os.path.join(sample_path, ANNOTATIONS_NAME))):
+        return sample_path, None
+    try:
+        annotate_sample(sample_path, boxes=boxes)
+    except (OSError, ValueError, KeyError) as e:
+        return sample_path, str(e)
+    return sample_path, ''
+
+
+def main():
+    argparser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    argparser.add_argument('path', nargs='+', help='dataset folders that contain a params.csv or sample folders')
+    argparser.add_argument(
+        '-j', '--jobs',
+        metavar='N',
+        default=None,
+        type=int,
+        help='number of annotating processes (default: number of CPUs)')
+    argparser.add_argument(
+        '--boxes',
+        metavar='PATH',
+        default=None,
+        help='bounding_boxes.json of the asset cache (<dataset-path>/.asset_cache/<server version>/) for the samples '
+             'whose actors.traj has no bounding boxes')
+    argparser.add_argument(
+        '--force',
+        action='store_true',
+        help='annotate the samples that already have annotations again')
+    args = argparser.parse_args()
+
+    boxes = load_boxes(args.boxes) if args.boxes else None
+    sample_paths = []
+    for path in args.path:
+        if os.path.exists(os.path.join(path, 'params.csv')):
+            n_rows, params = get_params_data(os.path.join(path, 'params.csv'))
+            sample_paths += [os.path.join(path, params['split'][i], params['map'][i], params['hash'][i]) for i in range(n_rows)]
+        else:
+            sample_paths.append(path)
+
+    start = time.time()
+    n_done, n_failed = 0, 0
+    with ProcessPoolExecutor(args.jobs) as pool:
+        for sample_path, error in pool.map(_annotate_task, [(path, boxes, args.force) for path in sample_paths], chunksize=4):
+            if error:
+                n_failed += 1
+                print('%s: %s' % (sample_path, error))
+            elif error is not None:
+                n_done += 1
+    print('Annotated %d samples in %.1f s, %d failed' % (n_done, time.time() - start, n_failed))
+
+
+if __name__ == '__main__':
+    main()
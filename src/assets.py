@@ -0,0 +1,136 @@
+import os
+import json
+import random
+import logging
+
+import carla
+import numpy as np
+
+from actors.Vehicle import get_bp_vehicles
+
+
+class AssetCache:
+    """
+    Caches what the spawning queries from the server, keyed by server version and map: the ids of the usable
+    vehicle and walker blueprints, their bounding boxes, the spawn points and a pool of navigation locations. The data is kept in memory
+    across samples and, if path is set, in <path>/<server version>/ across runs.
+
+    The blueprint library itself is fetched once per process, blueprints are handed out as copies.
+    """
+
+    # navigation locations fetched at once, the pool grows by as many if a sample needs more
+    NAVIGATION_POOL = 1000
+    # pedestrians seed of the navigation queries, the pool of a map is the same for every worker and run
+    NAVIGATION_SEED = 0
+
+    def __init__(self, client, path=None):
+        self.client = client
+        self.path = path
+        self._version = None
+        self._blueprint_library = None
+        self._data = {}  # file name -> dict
+
+    @property
+    def version(self):
+        if self._version is None:
+            self._version = self.client.get_server_version()
+        return self._version
+
+    def blueprint_library(self, world):
+        if self._blueprint_library is None:
+            self._blueprint_library = world.get_blueprint_library()
+        return self._blueprint_library
+
+    def blueprint(self, world, bp_id):
+        # filter returns copies, so setting attributes does not change the cached library
+        return self.blueprint_library(world).filter(bp_id)[0]
+
+    def vehicle_blueprint_ids(self, world):
+        data = self._load('blueprints')
+        if 'vehicles' not in data:
+            data['vehicles'] = [bp.id for bp in get_bp_vehicles(self.blueprint_library(world), 'vehicle.*')]
+            self._save('blueprints')
+        return data['vehicles']
+
+    def walker_blueprint_ids(self, world):
+        data = self._load('blueprints')
+        if 'walkers' not in data:
+            # in library order, like the former random.choice on the filtered library
+            data['walkers'] = [bp.id for bp in self.blueprint_library(world).filter('walker.pedestrian.*')]
+            self._save('blueprints')
+        return data['walkers']
+
+    def bounding_boxes(self, actors):
+        """
+        Returns the bounding boxes of the actors as array of shape [actors, 6]: center relative to the actor (x, y, z)
+        and extent (x, y, z) in metres. The box of a blueprint is asked from the first actor of it.
+        """
+        data = self._load('bounding_boxes')
+        missing = [a for a in actors if a.type_id not in data]
+        for a in missing:
+            box = a.bounding_box
+            data[a.type_id] = [box.location.x, box.location.y, box.location.z, box.extent.x, box.extent.y, box.extent.z]
+        if missing:
+            self._save('bounding_boxes')
+        return np.array([data[a.type_id] for a in actors], dtype=np.float32).reshape(len(actors), 6)
+
+    def spawn_points(self, world, map_name):
+        data = self._load(map_name)
+        if 'spawn_points' not in data:
+            data['spawn_points'] = [[tf.location.x, tf.location.y, tf.location.z, tf.rotation.pitch, tf.rotation.yaw, tf.rotation.roll]
+                                    for tf in world.get_map().get_spawn_points()]
+            self._save(map_name)
+        return [carla.Transform(carla.Location(x, y, z), carla.Rotation(pitch, yaw, roll))
+                for x, y, z, pitch, yaw, roll in data['spawn_points']]
+
+    def navigation_points(self, world, map_name, n):
+        """
+        Returns the navigation locations of the map for a sample with n walkers: the first NAVIGATION_POOL locations,
+        or as many multiples of it as n needs. The locations only depend on the map and n.
+        """
+        size = max(1, -(-n // self.NAVIGATION_POOL)) * self.NAVIGATION_POOL
+        if len(self._load(map_name).get('navigation_pool', [])) < size:
+            # another worker may have fetched them since
+            self._data.pop(map_name)
+        data = self._load(map_name)
+        points = data.get('navigation_pool', [])
+        if len(points) < size:
+            # the queries start over from the fixed seed, so a larger pool begins with the smaller one
+            logging.info('Fetching %d navigation locations of %s' % (size, map_name))
+            world.set_pedestrians_seed(self.NAVIGATION_SEED)
+            points = []
+            for _ in range(size):
+                loc = world.get_random_location_from_navigation()
+                points.append([loc.x, loc.y, loc.z])
+            data['navigation_pool'] = points
+            self._save(map_name)
+        return [carla.Location(x, y, z) for x, y, z in points[:size]]
+
+    def _file(self, name):
+        return os.path.join(self.path, self.version, name + '.json')
+
+    def _load(self, name):
+        if name not in self._data:
+            self._data[name] = {}
+            if self.path:
+                try:
+                    with open(self._file(name), mode='r') as json_file:
+                        self._data[name] = json.load(json_file)
+                except (OSError, ValueError):
+                    pass
+        return self._data[name]
+
+    def _save(self, name):
+        if not self.path:
+            return
+        path = self._file(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = '%s.%d.tmp' % (path, os.getpid())
+        with open(tmp_path, mode='w') as json_file:
+            json.dump(self._data[name], json_file)
+        os.replace(tmp_path, path)
+
+
+def navigation_rng(seed):
+    # picks from the navigation pool without touching the global random state of the spawning
+    return random.Random('navigation-%d' % seed)
@@ -0,0 +1,270 @@
+"""
+Measures the client side hot path (SyncWorld.tick, save_cam_data, actor and sample info writing) against the
+offline CARLA stand-in in fake_carla/, or against a live server with --live.
+
+    python3 benchmark.py
+    python3 benchmark.py --configs 128x128x350 1920x1080x1000 --frames 100 --writers 4 --json bench.json
+
+--traffic both measures every configuration with and without the traffic manager hybrid physics mode, respawning of
+dormant vehicles and --active-distance and prints the ticks/s of both. The stand-in ignores these options, measure
+them with --live.
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import logging
+
+import numpy as np
+
+DEFAULT_CONFIGS = ['128x128x350', '640x480x500', '1920x1080x1000']
+
+
+def parse_config(value):
+    # WIDTHxHEIGHTxACTORS, the actors are split evenly between vehicles and walkers
+    img_w, img_h, n_actors = (int(x) for x in value.split('x'))
+    n_vehicles = n_actors // 2 + n_actors % 2
+    return img_w, img_h, n_vehicles, n_actors - n_vehicles
+
+
+def percentiles(values):
+    values = np.array(values) * 1000
+    return {
+        'mean_ms': round(float(values.mean()), 3),
+        'p50_ms': round(float(np.percentile(values, 50)), 3),
+        'p95_ms': round(float(np.percentile(values, 95)), 3),
+        'max_ms': round(float(values.max()), 3),
+    }
+
+
+def folder_size(path):
+    n_files, n_bytes = 0, 0
+    for root, _, files in os.walk(path):
+        n_files += len(files)
+        n_bytes += sum(os.path.getsize(os.path.join(root, f)) for f in files)
+    return n_files, n_bytes
+
+
+def run_config(client, config, frames, writer, actor_format, tm_port, map_name, output_backend='files', assets=None,
+               traffic=None, extraction='snapshot'):
+    # traffic: SyncWorld attributes of the traffic options, e.g. {'hybrid_physics': True, 'hybrid_radius': 50.0}
+    import carla
+    from client import write_sample_info, write_actor_info
+    from syncworld import SyncWorld
+    from trajectory import TrajectoryWriter
+    from sinks import create_sink
+
+    img_w, img_h, n_vehicles, n_walkers = parse_config(config)
+    fps = 25
+    sample_path = tempfile.mkdtemp(prefix='carla-bench-')
+    timings = {stage: [] for stage in ['setup', 'tick', 'save_cam_data', 'actors', 'sample_info', 'teardown']}
+
+    world = client.get_world()
+    settings = world.get_settings()
+    settings.synchronous_mode = True
+    settings.fixed_delta_seconds = 1.0 / fps
+    world.apply_settings(settings)
+    random.seed(1)
+
+    cam_transform = carla.Transform(carla.Location(x=1.5, z=2.4), carla.Rotation())
+    sync_world = SyncWorld(client, sample_path, map_name, 1, fps, img_h, img_w, 90.0, cam_transform,
+                           n_vehicles, n_walkers, 'ClearNoon', 0.0, tm_port, writer)
+    sync_world.sink = create_sink(output_backend, sample_path)
+    sync_world.extraction = extraction
+    if assets is not None:
+        sync_world.assets = assets
+    for name, value in (traffic or {}).items():
+        setattr(sync_world, name, value)
+    if writer is not None:
+        writer.reset_stats()
+    try:
+        start = time.perf_counter()
+        sync_world.__enter__()
+        timings['setup'].append(time.perf_counter() - start)
+        actor_path = os.path.join(sample_path, 'actors')
+        os.makedirs(actor_path, exist_ok=True)
+        trajectory = TrajectoryWriter(os.path.join(sample_path, 'actors.traj'), sync_world.actor_table, boxes=sync_world.actor_boxes)
+
+        run_start = time.perf_counter()
+        for frame_index in range(frames):
+            start = time.perf_counter()
+            meta_data, actor_data, cam_data, snapshot = sync_world.tick(10.0, frame_index)
+            timings['tick'].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            sync_world.write_frame_info(meta_data)
+            sync_world.op.save_cam_data(*cam_data)
+            timings['save_cam_data'].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            if actor_format == 'csv':
+                write_actor_info(actor_path, sync_world.frame, sync_world.actor_table, actor_data)
+            else:
+                trajectory.append(sync_world.frame, actor_data)
+            timings['actors'].append(time.perf_counter() - start)
+        trajectory.close()
+
+        start = time.perf_counter()
+        sync_world.__exit__(None, None, None)
+        timings['teardown'].append(time.perf_counter() - start)
+        run_time = time.perf_counter() - run_start
+
+        start = time.perf_counter()
+        write_sample_info(sample_path, {'frames': frames, 'time': run_time}, finish=True)
+        timings['sample_info'].append(time.perf_counter() - start)
+
+        n_files, n_bytes = folder_size(sample_path)
+        result = {
+            'config': config,
+            'frames': frames,
+            'actors': len(sync_world.actor_ids),
+            'fps': round(frames / run_time, 2),
+            'ticks_per_s': round(frames / sum(timings['tick']), 2),
+            'traffic': sync_world.traffic_settings(),
+            'extraction': extraction,
+            'files': n_files,
+            'bytes': n_bytes,
+            'bytes_per_frame': n_bytes // frames,
+            'stages': {stage: percentiles(values) for stage, values in timings.items() if values},
+            'timings': sync_world.timer.summary(),
+        }
+        if writer is not None:
+            result['writer'] = writer.stats()
+        return result
+    finally:
+        shutil.rmtree(sample_path, ignore_errors=True)
+
+
+def print_result(result):
+    print('%s: %d actors, %.2f frames/s, %.2f ticks/s, %d files, %.1f kB/frame%s' % (
+        result['config'], result['actors'], result['fps'], result['ticks_per_s'], result['files'],
+        result['bytes_per_frame'] / 1024, ', hybrid physics' if result['traffic']['hybrid_physics'] else ''))
+    for stage, stats in result['stages'].items():
+        print('    %-14s mean %9.3f ms   p50 %9.3f ms   p95 %9.3f ms   max %9.3f ms' % (
+            stage, stats['mean_ms'], stats['p50_ms'], stats['p95_ms'], stats['max_ms']))
+    if 'writer' in result:
+        print('    writer         %s' % result['writer'])
+
+
+def main():
+    argparser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    argparser.add_argument(
+        '-c', '--configs',
+        metavar='WxHxN',
+        nargs='+',
+        default=DEFAULT_CONFIGS,
+        help='resolutions and actor counts to measure (default: %s)' % ' '.join(DEFAULT_CONFIGS))
+    argparser.add_argument(
+        '-n', '--frames',
+        metavar='N',
+        default=50,
+        type=int,
+        help='frames per configuration (default: 50)')
+    argparser.add_argument(
+        '-w', '--writers',
+        metavar='W',
+        default=0,
+        type=int,
+        help='number of writer processes, 0 encodes in the main process (default: 0)')
+    argparser.add_argument(
+        '--actor-format',
+        default='traj',
+        choices=['traj', 'csv'],
+        help='format of the actor states (default: traj)')
+    argparser.add_argument(
+        '--output-backend',
+        default='files',
+        choices=['files', 'shards'],
+        help='output backend of the camera frames (default: files)')
+    argparser.add_argument(
+        '--map',
+        default='Town01_Opt',
+        help='map to load (default: Town01_Opt)')
+    argparser.add_argument(
+        '--live',
+        metavar='HOST:PORT',
+        default=None,
+        help='measure against a running CARLA server instead of the offline stand-in')
+    argparser.add_argument(
+        '--tm-port',
+        metavar='P',
+        default=8000,
+        type=int,
+        help='port to communicate with TM (default: 8000)')
+    argparser.add_argument(
+        '--traffic',
+        default='off',
+        choices=['off', 'on', 'both'],
+        help='traffic manager hybrid physics mode, respawning of dormant vehicles and --active-distance (default: off)')
+    argparser.add_argument(
+        '--hybrid-radius',
+        metavar='METRES',
+        default=50.0,
+        type=float,
+        help='radius of the hybrid physics mode around the ego vehicle (default: 50)')
+    argparser.add_argument(
+        '--active-distance',
+        metavar='METRES',
+        default=2000.0,
+        type=float,
+        help='distance from the ego vehicle at which actors become dormant, large maps only (default: 2000)')
+    argparser.add_argument(
+        '--extraction',
+        default='snapshot',
+        choices=['snapshot', 'actor'],
+        help='how the actor states are read, see client.py --extraction; extract_actors in the stage timings '
+             '(default: snapshot)')
+    argparser.add_argument(
+        '--json',
+        metavar='PATH',
+        default=None,
+        help='write the results to a JSON file')
+    args = argparser.parse_args()
+
+    logging.basicConfig(format='%(levelname)s: %(message)s', level=logging.WARNING)
+    if args.live is None:
+        sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fake_carla'))
+    import carla
+    from writer import AsyncFrameWriter
+    from assets import AssetCache
+
+    host, port = (args.live or 'localhost:2000').split(':')
+    client = carla.Client(host, int(port))
+    client.set_timeout(60.0)
+    original_settings = client.get_world().get_settings()
+
+    writer = AsyncFrameWriter(args.writers) if args.writers > 0 else None
+    assets = AssetCache(client)  # like the client, the setup of later configurations uses the cached assets
+    traffic_on = {'hybrid_physics': True, 'hybrid_radius': args.hybrid_radius, 'respawn_dormant': True,
+                  'active_distance': args.active_distance}
+    traffic_modes = {'off': [None], 'on': [traffic_on], 'both': [None, traffic_on]}[args.traffic]
+    results = []
+    try:
+        for config in args.configs:
+            for traffic in traffic_modes:
+                result = run_config(client, config, args.frames, writer, args.actor_format, args.tm_port, args.map,
+                                    args.output_backend, assets, traffic, args.extraction)
+                print_result(result)
+                results.append(result)
+    finally:
+        client.get_world().apply_settings(original_settings)
+        if writer is not None:
+            writer.close()
+
+    if args.traffic == 'both':
+        print('%-16s %7s %14s %14s %8s' % ('config', 'actors', 'ticks/s off', 'ticks/s on', 'speedup'))
+        for off, on in zip(results[::2], results[1::2]):
+            print('%-16s %7d %14.2f %14.2f %7.2fx' % (off['config'], off['actors'], off['ticks_per_s'], on['ticks_per_s'],
+                                                     on['ticks_per_s'] / off['ticks_per_s']))
+
+    if args.json:
+        with open(args.json, mode='w') as json_file:
+            json.dump({'server': 'live' if args.live else 'fake', 'writers': args.writers, 'results': results}, json_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""
+Checks that both ways of reading the actor states (client.py --extraction snapshot|actor) give the same states. A
+sample is spawned in the offline CARLA stand-in in fake_carla/, or on a live server with --live, and both are compared
+in every frame:
+
+    python3 check_extraction.py
+    python3 check_extraction.py --live localhost:2000 --vehicles 100 --walkers 100 --frames 100
+
+Exits with 1 at the first frame whose states differ.
+"""
+import os
+import sys
+import random
+import shutil
+import argparse
+import tempfile
+import logging
+
+import numpy as np
+
+
+def check(client, map_name, n_vehicles, n_walkers, frames, tm_port, rtol=1e-5, atol=1e-4):
+    # returns the largest absolute difference of the two extraction modes, raises AssertionError if they differ
+    import carla
+    from syncworld import SyncWorld
+
+    fps = 25
+    sample_path = tempfile.mkdtemp(prefix='carla-extraction-')
+    world = client.get_world()
+    settings = world.get_settings()
+    settings.synchronous_mode = True
+    settings.fixed_delta_seconds = 1.0 / fps
+    world.apply_settings(settings)
+    random.seed(1)
+
+    cam_transform = carla.Transform(carla.Location(x=1.5, z=2.4), carla.Rotation())
+    sync_world = SyncWorld(client, sample_path, map_name, 1, fps, 32, 32, 90.0, cam_transform,
+                           n_vehicles, n_walkers, 'ClearNoon', 0.0, tm_port)
+    max_error = 0.0
+    try:
+        with sync_world:
+            for _ in range(frames):
+                sync_world.tick(10.0)
+                snapshot = sync_world.world.get_snapshot()
+                states_snapshot = sync_world.extract_actor_states_snapshot(snapshot, np.empty_like(sync_world.actor_states))
+                states_actor = sync_world.extract_actor_states(np.empty_like(sync_world.actor_states))
+                error = np.abs(states_snapshot - states_actor).max(initial=0.0)
+                max_error = max(max_error, float(error))
+                assert np.allclose(states_snapshot, states_actor, rtol=rtol, atol=atol), \
+                    'The extraction modes differ in frame %d (max abs error: %g)' % (sync_world.frame, error)
+    finally:
+        shutil.rmtree(sample_path, ignore_errors=True)
+    return max_error
+
+
+def main():
+    argparser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    argparser.add_argument(
+        '-n', '--frames',
+        metavar='N',
+        default=50,
+        type=int,
+        help='frames to compare (default: 50)')
+    argparser.add_argument(
+        '--vehicles',
+        metavar='N',
+        default=50,
+        type=int,
+        help='number of vehicles (default: 50)')
+    argparser.add_argument(
+        '--walkers',
+        metavar='N',
+        default=50,
+        type=int,
+        help='number of walkers (default: 50)')
+    argparser.add_argument(
+        '--map',
+        default='Town01_Opt',
+        help='map to load (default: Town01_Opt)')
+    argparser.add_argument(
+        '--live',
+        metavar='HOST:PORT',
+        default=None,
+        help='check against a running CARLA server instead of the offline stand-in')
+    argparser.add_argument(
+        '--tm-port',
+        metavar='P',
+        default=8000,
+        type=int,
+        help='port to communicate with TM (default: 8000)')
+    args = argparser.parse_args()
+
+    logging.basicConfig(format='%(levelname)s: %(message)s', level=logging.WARNING)
+    if args.live is None:
+        sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fake_carla'))
+    import carla
+
+    host, port = (args.live or 'localhost:2000').split(':')
+    client = carla.Client(host, int(port))
+    client.set_timeout(60.0)
+    original_settings = client.get_world().get_settings()
+    try:
+        max_error = check(client, args.map, args.vehicles, args.walkers, args.frames, args.tm_port)
+    except AssertionError as e:
+        sys.exit(str(e))
+    finally:
+        client.get_world().apply_settings(original_settings)
+    print('%d frames with %d vehicles and %d walkers agree (max abs error: %g)' % (
+        args.frames, args.vehicles, args.walkers, max_error))
+
+
+if __name__ == '__main__':
+    main()
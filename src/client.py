@@ -1,45 +1,35 @@
+import io
 import os.path
 import random
+import multiprocessing as mp
 import argparse
 import logging
 import shutil
+import tempfile
+import numpy as np
 
 import carla
 import csv
 import yaml
-import collections
 import time
 from pprint import pprint
 
+from actors.TrafficManager import ACTIVE_DISTANCE, HYBRID_RADIUS
+from assets import AssetCache
+from dataset import capture_periods, get_params_data, get_sample_path, is_sample_done, n_captures, row_hash, write_params
+from journal import ResumeError, read_journal, write_journal, remove_journal, state_digest
+from lease import Lease
+from monitor import SampleStuck, StuckMonitor, resample_seed
+from resolutions import ResolutionOutput, copy_shared_outputs, render_size, resized_params, resolution_dataset_path, scale_rig
+from annotations import LOCATION, AnnotationStage, annotate_sample, sensor_instance_ids
+from digests import DIGESTS_NAME, DigestWriter, state_buffer
+from frame_codecs import get_codec
+from rig import MODALITIES, default_rig, load_rig
 from syncworld import SyncWorld
-
-
-def get_params_data(path):
-    columns = collections.OrderedDict()
-    n_rows = 0
-
-    # read csv to dict
-    with open(path) as params_file:
-        reader = csv.reader(params_file)
-        headers = next(reader, None)
-        for header in headers:
-            columns[header] = []
-
-        for row in reader:
-            n_rows += 1
-            for header, value in zip(headers, row):
-                columns[header].append(value)
-
-    # fill missing parameters with the ones from the previous line
-    for header in columns:
-        prev_value = ''
-        for row, value in enumerate(columns[header]):
-            if value == '':
-                columns[header][row] = prev_value
-            else:
-                prev_value = value
-
-    return n_rows, columns
+from telemetry import RunStatus
+from sinks import create_sink, RawArrays
+from writer import AsyncFrameWriter
+from trajectory import TrajectoryWriter, STATIC_COLUMNS, STATE_COLUMNS
 
 
 def write_sample_info(path, data, finish=False):
@@ -57,122 +47,734 @@ def write_sample_info(path, data, finish=False):
         os.rename(si_path, os.path.join(path, 'sample_info.yml'))
 
 
-def write_actor_info(path, frame, data):
-    with open(os.path.join(path, '%08d.csv' % frame), mode='w') as csv_file:
+def write_instance_table(path, actor_table):
+    # the instance segmentation encodes the lower 16 bits of the actor id as instance id
+    with open(os.path.join(path, 'instances.csv'), mode='w', newline='') as csv_file:
         csv_writer = csv.writer(csv_file, delimiter=',')
-        csv_writer.writerows(data)
+        csv_writer.writerow(['instance_id', 'actor_id', 'type_id'])
+        csv_writer.writerows((a_id & 0xffff, a_id, type_id) for a_id, type_id, _ in actor_table)
 
 
-def main():
-    dataset_path = os.path.join(args.dataset_path, *args.params_file.split('.')[:-1])
-    os.makedirs(dataset_path, exist_ok=True)
-    shutil.copyfile(args.params_file, os.path.join(dataset_path, 'params.csv'))
-    client = carla.Client('localhost', 2000)
+def write_actor_info(path, frame, actor_table, actor_states):
+    with open(os.path.join(path, '%08d.csv' % frame), mode='w') as csv_file:
+        write_actor_csv(csv_file, actor_table, actor_states)
+
+
+def write_actor_csv(csv_file, actor_table, actor_states):
+    csv_writer = csv.writer(csv_file, delimiter=',')
+    csv_writer.writerow(STATIC_COLUMNS + STATE_COLUMNS)
+    csv_writer.writerows([*row, *values] for row, values in zip(actor_table, actor_states.tolist()))
+
+
+def get_sample_ticks(params, i):
+    # warmup and recorded ticks of a row
+    return (int(params['duration'][i]) + 3) * int(params['fps'][i])
+
+
+def parse_row(params, i):
+    return {
+        'split': params['split'][i],
+        'map_name': params['map'][i],
+        'hash': params['hash'][i],
+        'fps': int(params['fps'][i]),
+        'duration': int(params['duration'][i]),
+        'seed': int(params['seed'][i]),
+        'n_vehicles': int(params['n_vehicles'][i]),
+        'n_walkers': int(params['n_walkers'][i]),
+        'img_h': int(params['img_h'][i]),
+        'img_w': int(params['img_w'][i]),
+        'fov': float(params['fov'][i]),
+        'cam_x': float(params['cam_x'][i]),
+        'cam_y': float(params['cam_y'][i]),
+        'cam_z': float(params['cam_z'][i]),
+        'cam_pitch': float(params['cam_pitch'][i]),
+        'cam_yaw': float(params['cam_yaw'][i]),
+        'cam_roll': float(params['cam_roll'][i]),
+        'weather': params['weather'][i],
+        'speed_diff': float(params['speed_diff'][i]),
+        'rig': params['rig'][i] if 'rig' in params else '',
+        'hybrid_physics': bool(int(params['hybrid_physics'][i])) if 'hybrid_physics' in params else False,
+        'hybrid_radius': float(params['hybrid_radius'][i]) if 'hybrid_radius' in params else HYBRID_RADIUS,
+        'respawn_dormant': bool(int(params['respawn_dormant'][i])) if 'respawn_dormant' in params else False,
+        'active_distance': float(params['active_distance'][i]) if 'active_distance' in params else ACTIVE_DISTANCE,
+        'codecs': {modality: params['codec_' + modality][i] for modality in MODALITIES
+                   if 'codec_' + modality in params and params['codec_' + modality][i]},
+        'rates': {name: int(params['rate_' + name][i]) for name in MODALITIES + ['actors']
+                  if 'rate_' + name in params and params['rate_' + name][i]},
+    }
+
+
+def get_rig(row, options):
+    # cameras of a row: the rig file of its rig column or of --rig, otherwise the single camera of the camera columns
+    path = row['rig'] or options.rig
+    if not path:
+        return default_rig(row)
+    if not os.path.isabs(path) and not os.path.exists(path):
+        # relative to the params file
+        path = os.path.join(os.path.dirname(options.params_file), path)
+    return load_rig(path, row)
+
+
+def get_codecs(row, options):
+    # codec specs of the modalities: the codec_<modality> columns of the row, otherwise --codec
+    codecs = dict(options.codec or [])
+    codecs.update(row['codecs'])
+    return codecs
+
+
+def get_rates(row, options):
+    # captures per second of the modalities and the actors: the rate_<name> columns of the row, otherwise --rate
+    rates = dict(options.rate or [])
+    rates.update(row['rates'])
+    return rates
+
+
+def create_sync_world(client, world, writer, sample_path, row, tm_port, options, assets=None):
+    # options: the parsed command line arguments
+    random.seed(row['seed'])
+
+    # make simulation sync and deterministic
+    settings = world.get_settings()
+    settings.synchronous_mode = True
+    settings.fixed_delta_seconds = 1.0/row['fps']
+    settings.deterministic_ragdolls = True
+    settings.max_substep_delta_time = 0.01
+    settings.max_substeps = 10
+    world.apply_settings(settings)
+
+    cam_transform = carla.Transform(carla.Location(x=row['cam_x'], y=row['cam_y'], z=row['cam_z']),
+                                    carla.Rotation(pitch=row['cam_pitch'], yaw=row['cam_yaw'], roll=row['cam_roll']))
+    sync_world = SyncWorld(client, sample_path, row['map_name'], row['seed'], row['fps'], row['img_h'], row['img_w'], row['fov'], cam_transform,
+                           row['n_vehicles'], row['n_walkers'], row['weather'], row['speed_diff'], tm_port, writer)
+    sync_world.rig = get_rig(row, options)
+    sync_world.hybrid_physics = row['hybrid_physics']
+    sync_world.hybrid_radius = row['hybrid_radius']
+    sync_world.respawn_dormant = row['respawn_dormant']
+    sync_world.active_distance = row['active_distance']
+    sync_world.extraction = options.extraction
+    sync_world.reuse_world = options.reuse_world
+    if assets is not None:
+        sync_world.assets = assets
+    sync_world.sensor_capacity = options.sensor_buffer
+    sync_world.missing_frames = options.missing_frames
+    sync_world.sensor_retries = options.sensor_retries
+    sync_world.codecs = {modality: get_codec(spec, modality) for modality, spec in get_codecs(row, options).items()}
+    sync_world.periods = {name: period for name, period in capture_periods(row['fps'], get_rates(row, options)).items() if period > 1}
+    return sync_world
+
+
+def schedule_rows(params, rows, current_map=None):
+    # rows of the current map first, then grouped by map, so the server does not have to load another world after each sample
+    return sorted(rows, key=lambda i: (params['map'][i] != current_map, params['map'][i]))
+
+
+def get_map_name(world):
+    return world.get_map().name.split('/')[-1]
+
+
+def check_world_reuse(client, world, params, i, tm_port, n_ticks, options, assets=None):
+    # simulates row i after a fresh load and after a reset of the same world and compares the actor states
+    row = parse_row(params, i)
+    results = []
+    for reuse in [False, True]:
+        with tempfile.TemporaryDirectory() as tmp_path:
+            sync_world = create_sync_world(client, world, None, tmp_path, row, tm_port, options, assets)
+            sync_world.reuse_world = reuse
+            with sync_world:
+                states, meta_data = [], []
+                for _ in range(n_ticks):
+                    meta, actor_states, _, _ = sync_world.tick(1.0)
+                    states.append(actor_states.copy())
+                    meta_data.append(meta[1:])
+                results.append((np.stack(states), meta_data))
+
+    (fresh, fresh_meta), (reused, reused_meta) = results
+    if fresh.shape != reused.shape:
+        logging.error('World reuse check failed: %s actor states after a fresh load, %s after a reset' % (fresh.shape, reused.shape))
+        return False
+    error = np.abs(fresh - reused).max(axis=(1, 2))
+    diverged = np.flatnonzero(error > 1e-4)
+    if len(diverged) or fresh_meta != reused_meta:
+        first = int(diverged[0]) if len(diverged) else next(t for t, (a, b) in enumerate(zip(fresh_meta, reused_meta)) if a != b)
+        logging.error('World reuse check failed: tick %d/%d differs (max abs error %g)' % (first + 1, n_ticks, error[first]))
+        return False
+    logging.info('World reuse check passed: %d ticks of %s are identical (max abs error %g)' % (n_ticks, row['map_name'], error.max()))
+    return True
+
+
+def write_checkpoint(sync_world, trajectory, config, n_done, frame_id, actor_states, digests=None):
+    # waits until every output of the first n_done frames is written
+    if sync_world.writer is not None:
+        sync_world.writer.flush()
+    sync_world.sink.sync(n_done)
+    for output in sync_world.outputs[1:]:
+        output.sink.sync(n_done)
+    if trajectory is not None:
+        trajectory.flush()
+    if digests is not None:
+        digests.flush()
+    write_journal(sync_world.dataset_path, {
+        'config': config,
+        'frames': n_done,
+        'first_frame': sync_world.op.first_frame,
+        'last_frame': frame_id,
+        'frame_info_size': sync_world.flush_frame_info(),
+        'actor_ids': [a_id for a_id, _, _ in sync_world.actor_table],
+        'actor_types': [type_id for _, type_id, _ in sync_world.actor_table],
+        'state_digest': state_digest(actor_states),
+    })
+
+
+def resume_sample(sync_world, journal):
+    # the outputs keep the actor ids and frame numbers of the first run
+    if [type_id for _, type_id, _ in sync_world.actor_table] != journal['actor_types']:
+        raise ResumeError('Spawned actors differ from the checkpoint')
+    sync_world.actor_table = [(a_id, type_id, attributes) for a_id, (_, type_id, attributes) in zip(journal['actor_ids'], sync_world.actor_table)]
+    sync_world.op.first_frame = journal['first_frame']
+    sync_world.open_frame_info(journal['frame_info_size'])
+
+
+def replay_sample(sync_world, journal, ignore_ticks, callback=None):
+    # simulates the warmup and the checkpointed frames again and checks that the world ends up in the same state
+    sync_world.fast_forward(ignore_ticks + journal['frames'], callback)
+    sync_world.frame_offset = journal['last_frame'] - sync_world.frame
+    actor_states = sync_world.read_actor_states(sync_world.world.get_snapshot())
+    if state_digest(actor_states) != journal['state_digest']:
+        raise ResumeError('Replayed actor states of frame %d differ from the checkpoint' % journal['last_frame'])
+    logging.info('Replayed %d frames, actor states match the checkpoint' % journal['frames'])
+    return ignore_ticks + journal['frames']
+
+
+def generate_sample(client, world, writer, dataset_path, params, i, n_samples, tm_port, options, lease=None, status=None,
+                    assets=None):
+    """
+    Generates the sample of row i, returns False if it exists already. options are the parsed command line arguments.
+
+    A checkpoint that cannot be resumed is dropped once and the sample is generated from scratch. A sample whose ego
+    vehicle got stuck is generated again with another seed up to options.stuck_resamples times (--stuck-action resample).
+    """
+    resamples = []  # the earlier attempts of the sample, whose ego vehicle got stuck
+    resume = True
+    while True:
+        try:
+            return record_sample(client, world, writer, dataset_path, params, i, n_samples, tm_port, options, lease, status,
+                                 assets, resamples, resume)
+        except ResumeError as e:
+            if not resume:
+                raise
+            logging.error('%s. Generating the sample from scratch ...' % e)
+            remove_journal(get_sample_path(dataset_path, params, i))
+            resume = False
+        except SampleStuck as e:
+            resamples.append(e.stuck)
+
+
+def open_checkpoint(sample_path, resolution_paths, config, frames, resume):
+    # the journal of the sample if it can be resumed, otherwise the outputs of the earlier run are removed
+    journal = read_journal(sample_path) if resume and os.path.exists(sample_path) else None
+    if journal is not None and journal['config'] != config:
+        logging.warning('Checkpoint of the sample was written with other output options %s' % journal['config'])
+        journal = None
+    if os.path.exists(sample_path):
+        if journal is None:
+            logging.warning('sample_info.yml does not exist, is incomplete or a resolution is missing. Overwriting sample ...')
+            shutil.rmtree(sample_path)
+        else:
+            logging.info('Resuming sample after frame %d/%d' % (journal['frames'], frames))
+    if journal is None:
+        for path in resolution_paths.values():
+            if os.path.exists(path):
+                shutil.rmtree(path)
+    return journal
+
+
+def start_sample(sync_world, journal, ignore_ticks, options, digests, on_tick):
+    # simulates the ticks before the first one to record: replays a resumed sample up to its checkpoint or runs the
+    # warmup without rendering. Returns that tick and the trajectory of a resumed sample
+    trajectory = None
+    first_tick = 0
+    if journal is not None:
+        # replay up to the last checkpoint without rendering
+        with sync_world.timer.measure('replay'):
+            first_tick = replay_sample(sync_world, journal, ignore_ticks, on_tick)
+        if options.actor_format == 'traj':
+            actors_period = sync_world.periods.get('actors', 1)
+            trajectory = TrajectoryWriter(os.path.join(sync_world.dataset_path, 'actors.traj'), sync_world.actor_table,
+                                          actors_period, sync_world.actor_boxes)
+            trajectory.resume(n_captures(journal['frames'], actors_period))
+        if digests is not None:
+            digests.resume(journal['frames'])
+    elif options.warmup == 'fast':
+        # settle the cars without rendering and transferring camera frames
+        with sync_world.timer.measure('fast_forward'):
+            sync_world.fast_forward(ignore_ticks, on_tick)
+        first_tick = ignore_ticks
+    if sync_world.periods and first_tick >= ignore_ticks:
+        sync_world.update_listeners(first_tick - ignore_ticks)
+    return first_tick, trajectory
+
+
+def finish_sample(sync_world, sample_path, hash_str, annotation, journal, start):
+    # writes the annotations and the stats of a recorded sample and marks it and its other resolutions as done
+    timer = sync_world.timer
+    if annotation is not None:
+        with timer.measure('annotations_save'):
+            if journal is None:
+                annotation.save(sample_path)
+            else:
+                # the frames before the checkpoint were annotated by the previous run, all of them are read from disk
+                with open(os.path.join(sample_path, '_sample_info.yml'), mode='r') as yml_file:
+                    annotate_sample(sample_path, yaml.safe_load(yml_file), sync_world.actor_boxes)
+
+    if sync_world.writer is not None:
+        logging.info('Writer stats: %s' % sync_world.writer.stats())
+        write_sample_info(sample_path, {'_writer': sync_world.writer.stats()})
+    write_sample_info(sample_path, {'_sensors': dict(sync_world.sensors.stats(), skipped_frames=sync_world.skipped_frames,
+                                                     skipped_captures=sync_world.skipped_captures)})
+    write_sample_info(sample_path, {'_timings': timer.summary()})
+    for output in sync_world.outputs[1:]:
+        # the other resolutions are finished first, so a complete sample_path means that all of them are complete
+        copy_shared_outputs(sample_path, output.sample_path)
+        with open(os.path.join(sample_path, '_sample_info.yml'), mode='r') as yml_file:
+            info = yaml.safe_load(yml_file)
+        info.update({'_hash': output.hash, 'img_h': output.img_h, 'img_w': output.img_w, '_rendered_from': hash_str,
+                     '_rig': [camera.to_dict() for camera in output.rig] if info['_rig'] else None, '_resolutions': None})
+        write_sample_info(output.sample_path, dict(info, time=time.time() - start), finish=True)
+    write_sample_info(sample_path, {'time': time.time() - start}, finish=True)
+    remove_journal(sample_path)
+    logging.info('Time to process: {}'.format(time.time() - start))
+
+
+def record_sample(client, world, writer, dataset_path, params, i, n_samples, tm_port, options, lease, status, assets,
+                  resamples, resume):
+    # one attempt of generate_sample, raises SampleStuck if the sample gets generated again with another seed
+    start = time.time()
+
+    row = parse_row(params, i)
+    if resamples:
+        row['seed'] = resample_seed(row['seed'], len(resamples))
+    split, map_name, hash_str = row['split'], row['map_name'], row['hash']
+    fps, duration, seed = row['fps'], row['duration'], row['seed']
+    n_vehicles, n_walkers = row['n_vehicles'], row['n_walkers']
+    img_h, img_w, fov = row['img_h'], row['img_w'], row['fov']
+    cam_x, cam_y, cam_z = row['cam_x'], row['cam_y'], row['cam_z']
+    cam_pitch, cam_yaw, cam_roll = row['cam_pitch'], row['cam_yaw'], row['cam_roll']
+    weather_name, speed_diff = row['weather'], row['speed_diff']
+    sample_path = get_sample_path(dataset_path, params, i)
+
+    print('')
+    logging.info('%d/%d Load world: %s' % (i+1, n_samples, [split, map_name, hash_str, fps, duration, seed, n_vehicles, n_walkers, weather_name, speed_diff,
+                                                            [img_h, img_w], fov, [cam_x, cam_y, cam_z], [cam_pitch, cam_yaw, cam_roll],
+                                                            sample_path]))
+
+    ignore_ticks = 3 * fps  # ignore first 3 seconds, because cars fall and settle at the beginning
+    frames = duration * fps  # amount of ticks that should be simulated/captured
+    checkpoint_every = options.checkpoint_every
+    if options.output_backend == 'shards' and checkpoint_every > 0:
+        # shards are only complete at their boundaries
+        checkpoint_every = -(-checkpoint_every // options.shard_size) * options.shard_size
+    if options.audit_frames:
+        # digests of the first frames only, nothing to checkpoint
+        frames = min(frames, options.audit_frames)
+        checkpoint_every = 0
+    config = {
+        'hash': hash_str,
+        'frames': frames,
+        'actor_format': options.actor_format,
+        'output_backend': options.output_backend,
+        'shard_size': options.shard_size,
+        'raw_depth': options.raw_depth,
+        'raw_flow': options.raw_flow,
+    }
+    if row['rig'] or options.rig:
+        config['rig'] = [camera.to_dict() for camera in get_rig(row, options)]
+    if get_codecs(row, options):
+        config['codecs'] = get_codecs(row, options)
+    if get_rates(row, options):
+        config['rates'] = get_rates(row, options)
+    if options.digests:
+        config['digests'] = True
+    if resamples:
+        config['seed'] = row['seed']
+    # the same frames written at other resolutions, each is a sample of its own
+    resolution_hashes, resolution_paths = {}, {}
+    for res_w, res_h in options.resolutions or []:
+        resolution_hashes[res_w, res_h] = row_hash(params, i, img_w=str(res_w), img_h=str(res_h))
+        resolution_paths[res_w, res_h] = os.path.join(resolution_dataset_path(dataset_path, res_w, res_h), split, map_name,
+                                                      resolution_hashes[res_w, res_h], '')
+    if resolution_paths:
+        config['resolutions'] = ['%dx%d' % size for size in resolution_paths]
+
+    if os.path.exists(sample_path) and is_sample_done(sample_path) and all(is_sample_done(path) for path in resolution_paths.values()):
+        logging.info('Such a sample already exists (seed from params). Skipping above sample and continue with next sample ...')
+        if status is not None:
+            status.sample_done(get_sample_ticks(params, i), skipped=True)
+        return False
+    journal = open_checkpoint(sample_path, resolution_paths, config, frames, resume and checkpoint_every > 0)
+
+    os.makedirs(os.path.dirname(sample_path), exist_ok=True)
+
+    actor_path = os.path.join(sample_path, 'actors')
+    if options.actor_format == 'csv' and options.output_backend == 'files':
+        os.makedirs(actor_path, exist_ok=True)
+    sync_world = create_sync_world(client, world, writer, sample_path, row, tm_port, options, assets)
+    rig = sync_world.rig
+    sync_world.sink = create_sink(options.output_backend, sample_path, options.shard_size)
+
+    def create_raw_arrays(path, output_rig):
+        if options.raw_depth == 'off' and not options.raw_flow:
+            return None
+        os.makedirs(path, exist_ok=True)
+        return RawArrays(path, frames, output_rig, None if options.raw_depth == 'off' else np.dtype(options.raw_depth),
+                         options.raw_flow, resume=journal is not None, periods=sync_world.periods)
+
+    sync_world.raw_arrays = create_raw_arrays(sample_path, rig)
+    if resolution_paths:
+        render_h, render_w = render_size(img_h, img_w, resolution_paths)
+        sync_world.rig = scale_rig(rig, render_h / img_h, render_w / img_w)
+        sync_world.resample = options.resample
+        sync_world.outputs = [ResolutionOutput(sample_path, hash_str, img_h, img_w, rig, sync_world.sink, sync_world.raw_arrays)]
+        for (res_w, res_h), path in resolution_paths.items():
+            output_rig = scale_rig(rig, res_h / img_h, res_w / img_w)
+            sync_world.outputs.append(ResolutionOutput(path, resolution_hashes[res_w, res_h], res_h, res_w, output_rig,
+                                                       create_sink(options.output_backend, path, options.shard_size),
+                                                       create_raw_arrays(path, output_rig)))
+        logging.info('Rendering at %dx%d for the resolutions %s' % (render_w, render_h, ', '.join(config['resolutions'])))
+    timer = sync_world.timer
+    if writer is not None:
+        writer.reset_stats(timer)
+    if status is not None:
+        status.timer = timer
+    with sync_world:
+        if journal is not None:
+            resume_sample(sync_world, journal)
+        write_instance_table(sample_path, sync_world.actor_table)
+
+        write_sample_info(sample_path, {
+            'split': split,
+            '_hash': hash_str,
+            '_actor_id': sync_world.actor_table[0][0],
+            'map_name': map_name,
+            'fps': fps,
+            'duration': duration,
+            'img_h': img_h,
+            'img_w': img_w,
+            'fov': fov,
+            'cam_pitch': cam_pitch,
+            'cam_yaw': cam_yaw,
+            'cam_roll': cam_roll,
+            'cam_x': cam_x,
+            'cam_y': cam_y,
+            'cam_z': cam_z,
+            'seed': int(params['seed'][i]),
+            '_seed_actual': seed,
+            '_resamples': list(resamples) or None,
+            'n_vehicles': n_vehicles,
+            'n_walkers': n_walkers,
+            '_n_vehicles_actual': len(sync_world.vehicles),
+            '_n_walkers_actual': len(sync_world.walkers),
+            'weather': weather_name,
+            'speed_diff': speed_diff,
+            '_actor_format': options.actor_format,
+            '_output_backend': options.output_backend,
+            '_raw_depth': options.raw_depth,
+            '_raw_flow': options.raw_flow,
+            '_codecs': config.get('codecs'),
+            '_rates': config.get('rates'),
+            '_world_reused': sync_world.world_reused,
+            '_traffic': sync_world.traffic_settings(),
+            '_warmup': options.warmup,
+            '_resumed_at': journal['frames'] if journal is not None else None,
+            '_rig': config.get('rig'),
+            '_resolutions': {'%dx%d' % (output.img_w, output.img_h): output.hash for output in sync_world.outputs[1:]} or None,
+        })
+
+        def on_tick():
+            if lease is not None:
+                lease.heartbeat()
+            if status is not None:
+                status.tick()
+
+        digests = None
+        if options.digests or options.audit_frames:
+            digests = DigestWriter(os.path.join(sample_path, DIGESTS_NAME), sync_world.op.cam_names + ['actors'])
+        monitor = None
+        if options.stuck_window > 0 and not options.audit_frames:
+            monitor = StuckMonitor(fps, options.stuck_window, options.stuck_progress, options.stuck_speed, options.stuck_red_light)
+        stuck = None
+        annotation = None
+        if options.annotations == 'inline' and not options.audit_frames:
+            annotation = AnnotationStage(rig, [a_id for a_id, _, _ in sync_world.actor_table], sync_world.actor_boxes)
+
+        actors_period = sync_world.periods.get('actors', 1)
+        first_tick, trajectory = start_sample(sync_world, journal, ignore_ticks, options, digests, on_tick)
+
+        for frame in range(first_tick, frames + ignore_ticks):
+            frame_start = time.perf_counter()
+            meta_data, actor_data, cam_data, snapshot = sync_world.tick(1.0, frame - ignore_ticks if frame >= ignore_ticks else None)
+            on_tick()
+
+            if frame < ignore_ticks:
+                timer.add('warmup_frame', time.perf_counter() - frame_start)
+                continue
+
+            frame_id = meta_data[0]
+            sync_world.write_frame_info(meta_data)
+            if digests is not None:
+                # of the raw buffers, before anything gets encoded
+                with timer.measure('digests'):
+                    for cam_name, data in zip(sync_world.op.cam_names, cam_data or []):
+                        if data is not None:
+                            digests.add(cam_name, data.raw_data)
+                    digests.add('actors', state_buffer(actor_data))
+                    digests.end_frame(frame_id)
+                if options.audit_frames:
+                    timer.add('frame', time.perf_counter() - frame_start)
+                    continue
+            actors_due = sync_world.is_due('actors', frame - ignore_ticks)
+            if annotation is not None and actors_due:
+                with timer.measure('annotations'):
+                    annotation.add(frame_id, actor_data, sensor_instance_ids(rig, sync_world.op.cam_names, cam_data))
+            if cam_data is not None:
+                sync_world.op.save_cam_data(*cam_data)
+            if actors_due:
+                with timer.measure('actors_write'):
+                    if options.actor_format == 'csv' and not sync_world.sink.direct:
+                        csv_file = io.StringIO()
+                        write_actor_csv(csv_file, sync_world.actor_table, actor_data)
+                        sync_world.sink.expect('actors', frame - ignore_ticks)
+                        sync_world.sink.write('actors', frame - ignore_ticks, frame_id, csv_file.getvalue().encode('utf-8'), 'csv')
+                    elif options.actor_format == 'csv':
+                        write_actor_info(actor_path, frame_id, sync_world.actor_table, actor_data)
+                    else:
+                        if trajectory is None:
+                            trajectory = TrajectoryWriter(os.path.join(sample_path, 'actors.traj'), sync_world.actor_table,
+                                                          actors_period, sync_world.actor_boxes)
+                        trajectory.append(frame_id, actor_data)
+
+            n_done = frame - ignore_ticks + 1
+            if checkpoint_every > 0 and n_done % checkpoint_every == 0 and n_done < frames:
+                with timer.measure('checkpoint'):
+                    write_checkpoint(sync_world, trajectory, config, n_done, frame_id, actor_data, digests)
+            timer.add('frame', time.perf_counter() - frame_start)
+
+            if monitor is not None and n_done < frames:
+                reason = monitor.update(meta_data[1], meta_data[3], actor_data[0, LOCATION])
+                if reason is not None:
+                    stuck = {'reason': reason, 'seed': seed, 'frames': n_done, 'saved_sim_s': round((frames - n_done) / fps, 2)}
+                    logging.warning('Ego vehicle is stuck after frame %d/%d: %s, %.1f s of simulation saved'
+                                    % (n_done, frames, reason, stuck['saved_sim_s']))
+                    break
+
+        if trajectory is not None:
+            trajectory.close()
+        if digests is not None:
+            digests.close()
+
+    if stuck is not None:
+        if status is not None:
+            status.sample_stuck(stuck['saved_sim_s'])
+        if options.stuck_action == 'resample' and len(resamples) < options.stuck_resamples:
+            if status is not None:
+                status.ticks_total += stuck['frames'] + ignore_ticks
+            logging.info('Generating the sample again with another seed (attempt %d/%d) ...'
+                         % (len(resamples) + 1, options.stuck_resamples))
+            for path in [sample_path, *resolution_paths.values()]:
+                if os.path.exists(path):
+                    shutil.rmtree(path)
+            raise SampleStuck(stuck)
+        # the sample keeps the frames up to here, manifest.py checks it against them
+        write_sample_info(sample_path, {'_aborted': stuck})
+
+    if options.audit_frames:
+        # the sample stays incomplete, a normal run overwrites it
+        logging.info('Wrote the digests of %d frames in %.1f s' % (frames, time.time() - start))
+        if status is not None:
+            status.sample_done(frames + ignore_ticks)
+        return True
+
+    finish_sample(sync_world, sample_path, hash_str, annotation, journal, start)
+    if status is not None:
+        status.sample_done(frames + ignore_ticks)
+    return True
+
+
+def run_worker(host, port, tm_port, rows, dataset_path, params, n_samples, lease_timeout=None):
+    client = carla.Client(host, port)
     client.set_timeout(10.0)
     world = client.get_world()
     original_settings = world.get_settings()  # makes server async after client disconnects
 
     pprint(sorted(client.get_available_maps()))
+    writer = AsyncFrameWriter(args.writers, args.writer_slots) if args.writers > 0 else None
+    # blueprints, spawn points and navigation locations, shared by all samples of this worker
+    assets = AssetCache(client, os.path.join(args.dataset_path, '.asset_cache') if args.asset_cache is None else args.asset_cache)
+    status = None
+    if args.status_file:
+        status_path = args.status_file
+        if args.servers:
+            # one file per worker, e.g. status.prom -> status.localhost_2000.prom
+            root, ext = os.path.splitext(args.status_file)
+            status_path = '%s.%s_%d%s' % (root, host, port, ext)
+        status = RunStatus(status_path, len(rows), sum(get_sample_ticks(params, i) for i in rows), '%s:%d' % (host, port))
     try:
-        n_samples, params = get_params_data(args.params_file)
-        if args.end_row > n_samples:
-            logging.error("Only %d samples are defined in %s, but end_row argument was %d" % (n_samples, args.params_file, args.end_row))
-            args.end_row = -1
-        if args.end_row == -1:
-            args.end_row = n_samples
-        for i in range(args.start_row-1, args.end_row):
-            start = time.time()
-
-            # initialize paramters
-            split = params['split'][i]
-            map_name = params['map'][i]
-            fps = int(params['fps'][i])
-            duration = int(params['duration'][i])
-            seed = int(params['seed'][i])
-            n_vehicles = int(params['n_vehicles'][i])
-            n_walkers = int(params['n_walkers'][i])
-            img_h, img_w = int(params['img_h'][i]), int(params['img_w'][i])
-            fov = float(params['fov'][i])
-            cam_x, cam_y, cam_z = float(params['cam_x'][i]), float(params['cam_y'][i]), float(params['cam_z'][i])
-            cam_pitch, cam_yaw, cam_roll = float(params['cam_pitch'][i]), float(params['cam_yaw'][i]), float(params['cam_roll'][i])
-            cam_transform = carla.Transform(carla.Location(x=cam_x, y=cam_y, z=cam_z),
-                                            carla.Rotation(pitch=cam_pitch, yaw=cam_yaw, roll=cam_roll))
-            weather_name = params['weather'][i]
-            speed_diff = float(params['speed_diff'][i])
-            hash_str = params['hash'][i]
-            sample_path = os.path.join(dataset_path, split, map_name, hash_str, '')
-
-            print('')
-            logging.info('%d/%d Load world: %s' % (i+1, n_samples, [split, map_name, hash_str, fps, duration, seed, n_vehicles, n_walkers, weather_name, speed_diff,
-                                                                    [img_h, img_w], fov, [cam_x, cam_y, cam_z], [cam_pitch, cam_yaw, cam_roll],
-                                                                    sample_path]))
-
-            if os.path.exists(sample_path):
-                if os.path.exists(os.path.join(sample_path, 'sample_info.yml')):
-                    logging.info('Such a sample already exists (seed from params). Skipping above sample and continue with next sample ...')
+        if args.check_world_reuse:
+            if not check_world_reuse(client, world, params, rows[0], tm_port, args.check_world_reuse, args, assets):
+                raise RuntimeError('World reuse is not deterministic')
+            return
+
+        current_map = get_map_name(world)
+        if lease_timeout is None:
+            for i in rows if args.keep_row_order else schedule_rows(params, rows, current_map):
+                generate_sample(client, world, writer, dataset_path, params, i, n_samples, tm_port, args, status=status, assets=assets)
+            return
+
+        # claim rows until every sample is done, rows of crashed workers get reclaimed after lease_timeout
+        owner = '%s:%d:%d:%d' % (host, port, tm_port, os.getpid())
+        audited = set()  # audited samples stay incomplete, each row is audited once per worker
+        while True:
+            pending = [i for i in rows if i not in audited and not is_sample_done(get_sample_path(dataset_path, params, i))]
+            if not pending:
+                break
+            if not args.keep_row_order:
+                pending = schedule_rows(params, pending, current_map)
+
+            claimed = False
+            for i in pending:
+                sample_path = get_sample_path(dataset_path, params, i)
+                lease = Lease(sample_path.rstrip(os.sep) + '.lease', owner, lease_timeout)
+                if not lease.acquire():
                     continue
-                else:
-                    logging.warning('sample_info.yml does not exist or is incomplete. Overwriting sample ...')
-                    shutil.rmtree(sample_path)
-
-            os.makedirs(os.path.dirname(sample_path), exist_ok=True)
-
-            actor_path = os.path.join(sample_path, 'actors')
-            os.makedirs(actor_path, exist_ok=True)
-
-            ignore_ticks = 3 * fps  # ignore first 3 seconds, because cars fall and settle at the beginning
-            frames = duration * fps  # amount of ticks that should be simulated/captured
-            random.seed(seed)
-
-            # make simulation sync and deterministic
-            settings = world.get_settings()
-            settings.synchronous_mode = True
-            settings.fixed_delta_seconds = 1.0/fps
-            settings.deterministic_ragdolls = True
-            settings.max_substep_delta_time = 0.01
-            settings.max_substeps = 10
-            world.apply_settings(settings)
-
-            with SyncWorld(client, sample_path, map_name, seed, fps, img_h, img_w, fov, cam_transform, n_vehicles, n_walkers, weather_name, speed_diff, args.tm_port) as sync_world:
-                write_sample_info(sample_path, {
-                    'split': split,
-                    '_hash': hash_str,
-                    '_actor_id': sync_world.op.actor.id,
-                    'map_name': map_name,
-                    'fps': fps,
-                    'duration': duration,
-                    'img_h': img_h,
-                    'img_w': img_w,
-                    'fov': fov,
-                    'cam_pitch': cam_pitch,
-                    'cam_yaw': cam_yaw,
-                    'cam_roll': cam_roll,
-                    'cam_x': cam_x,
-                    'cam_y': cam_y,
-                    'cam_z': cam_z,
-                    'seed': seed,
-                    'n_vehicles': n_vehicles,
-                    'n_walkers': n_walkers,
-                    '_n_vehicles_actual': len(sync_world.vehicles),
-                    '_n_walkers_actual': len(sync_world.walkers),
-                    'weather': weather_name,
-                    'speed_diff': speed_diff
-                })
-
-                for frame in range(frames + ignore_ticks):
-                    meta_data, actor_data, cam_data, snapshot = sync_world.tick(1.0)
-
-                    if frame < ignore_ticks:
-                        continue
-
-                    sync_world.meta_data.append(meta_data)
-                    sync_world.op.save_cam_data(*cam_data)
-                    write_actor_info(actor_path, sync_world.frame, actor_data)
-
-            write_sample_info(sample_path, {'time': time.time() - start}, finish=True)
-            logging.info('Time to process: {}'.format(time.time() - start))
+                claimed = True
+                try:
+                    generate_sample(client, world, writer, dataset_path, params, i, n_samples, tm_port, args, lease, status, assets)
+                finally:
+                    lease.release()
+                if args.audit_frames:
+                    audited.add(i)
+                # prefer rows of the map that is loaded now
+                current_map = params['map'][i]
+                break
+
+            if not claimed:
+                logging.info('%d samples are claimed by other workers, waiting ...' % len(pending))
+                time.sleep(min(lease_timeout / 4, 5.0))
     finally:
         world.apply_settings(original_settings)
+        if writer is not None:
+            writer.close()
+
+
+def parse_resolution(value):
+    # WIDTHxHEIGHT
+    try:
+        img_w, img_h = (int(x) for x in value.split('x'))
+    except ValueError:
+        raise argparse.ArgumentTypeError('%s is not a resolution like 256x128' % value)
+    return img_w, img_h
+
+
+def parse_codec(value):
+    # MODALITY=CODEC[:LEVEL]
+    modality, _, spec = value.partition('=')
+    if modality not in MODALITIES:
+        raise argparse.ArgumentTypeError('%s is not a modality of %s' % (modality, ', '.join(MODALITIES)))
+    try:
+        get_codec(spec, modality)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+    return modality, spec
+
+
+def parse_rate(value):
+    # MODALITY=RATE, actors for the actor states
+    name, _, rate = value.partition('=')
+    if name not in MODALITIES + ['actors']:
+        raise argparse.ArgumentTypeError('%s is not one of %s' % (name, ', '.join(MODALITIES + ['actors'])))
+    return name, int(rate)
+
+
+def parse_server(value):
+    host, port, *tm_port = value.split(':')
+    port = int(port)
+    tm_port = int(tm_port[0]) if tm_port else port + 6000
+    return host, port, tm_port
+
+
+def read_schedule(path, params):
+    """Returns the rows (0-indexing) of every worker of a schedule written by generate_params.py --plan."""
+    schedule = {}
+    with open(path, mode='rt', encoding='utf-8') as csv_file:
+        for entry in csv.DictReader(csv_file):
+            i = int(entry['row']) - 1
+            if i >= len(params['hash']) or params['hash'][i] != entry['hash']:
+                raise ValueError('%s does not belong to %s, row %s has another hash' % (path, args.params_file, entry['row']))
+            schedule.setdefault(int(entry['worker']), []).append(i)
+    return schedule
+
+
+def run_coordinator(servers, rows, dataset_path, params, n_samples, server_rows=None):
+    # one worker process per server, crashed workers get restarted like auto_restart.sh does for a single client
+    ctx = mp.get_context('fork')
+    tries = {server: 0 for server in servers}
+
+    def start(server):
+        worker_rows = rows if server_rows is None else server_rows[server]
+        process = ctx.Process(target=run_worker, args=(*server, worker_rows, dataset_path, params, n_samples, args.lease_timeout),
+                              name='%s:%d' % server[:2])
+        process.start()
+        return process
+
+    workers = {server: start(server) for server in servers}
+    while workers:
+        time.sleep(1.0)
+        for server, process in list(workers.items()):
+            if process.is_alive():
+                continue
+            del workers[server]
+            if process.exitcode == 0:
+                logging.info('Worker for %s:%d finished' % server[:2])
+            elif tries[server] < args.max_restarts:
+                tries[server] += 1
+                logging.warning('Worker for %s:%d exited with %s. Restarting (%d/%d) ...' % (*server[:2], process.exitcode, tries[server], args.max_restarts))
+                time.sleep(5)
+                workers[server] = start(server)
+            else:
+                logging.error('Worker for %s:%d failed %d times, giving up on this server' % (*server[:2], tries[server] + 1))
+
+
+def main():
+    dataset_path = os.path.join(args.dataset_path, *args.params_file.split('.')[:-1])
+    os.makedirs(dataset_path, exist_ok=True)
+    shutil.copyfile(args.params_file, os.path.join(dataset_path, 'params.csv'))
+
+    n_samples, params = get_params_data(args.params_file)
+    for img_w, img_h in args.resolutions or []:
+        resolution_path = resolution_dataset_path(dataset_path, img_w, img_h)
+        os.makedirs(resolution_path, exist_ok=True)
+        write_params(os.path.join(resolution_path, 'params.csv'), resized_params(params, img_w, img_h))
+    if args.end_row > n_samples:
+        logging.error("Only %d samples are defined in %s, but end_row argument was %d" % (n_samples, args.params_file, args.end_row))
+        args.end_row = -1
+    if args.end_row == -1:
+        args.end_row = n_samples
+    rows = list(range(args.start_row-1, args.end_row))
+
+    schedule = read_schedule(args.schedule, params) if args.schedule else None
+    selected = set(rows)
+    if args.servers:
+        servers = [parse_server(server) for server in args.servers.split(',')]
+        server_rows = None
+        if schedule is not None:
+            # the k-th server runs the rows of worker k
+            server_rows = {server: [i for i in schedule.get(k, []) if i in selected] for k, server in enumerate(servers)}
+            if len(schedule) > len(servers):
+                logging.warning('The schedule has %d workers, but only %d servers are given' % (len(schedule), len(servers)))
+        run_coordinator(servers, rows, dataset_path, params, n_samples, server_rows)
+    else:
+        if schedule is not None:
+            rows = [i for i in schedule.get(args.worker, []) if i in selected]
+        run_worker(args.host, args.port, args.tm_port, rows, dataset_path, params, n_samples)
 
 
 if __name__ == '__main__':
@@ -204,12 +806,247 @@ if __name__ == '__main__':
             default=10,
             type=int,
             help='duration in seconds the simulation should run for (default: 10)')
+        argparser.add_argument(
+            '--host',
+            metavar='H',
+            default='localhost',
+            type=str,
+            help='IP of the host server (default: localhost)')
+        argparser.add_argument(
+            '--port',
+            metavar='P',
+            default=2000,
+            type=int,
+            help='TCP port of the host server (default: 2000)')
+        argparser.add_argument(
+            '--servers',
+            metavar='HOST:PORT[:TM_PORT],...',
+            default=None,
+            type=str,
+            help='distribute the rows over several servers, one worker per server claims rows with lease files '
+                 '(TM_PORT defaults to PORT + 6000)')
+        argparser.add_argument(
+            '--lease-timeout',
+            metavar='T',
+            default=600.0,
+            type=float,
+            help='seconds after which a row claimed by an unresponsive worker gets reclaimed (default: 600)')
+        argparser.add_argument(
+            '--max-restarts',
+            metavar='N',
+            default=100,
+            type=int,
+            help='how often a crashed worker gets restarted with --servers (default: 100)')
+        argparser.add_argument(
+            '--rig',
+            metavar='PATH',
+            default=None,
+            type=str,
+            help='YAML file with several cameras (transform, fov, resolution, modalities) that are rendered in the same '
+                 'ticks, used for the rows without a rig column. Every camera writes to <sample>/<camera name>/')
+        argparser.add_argument(
+            '--codec',
+            metavar='MODALITY=CODEC',
+            nargs='+',
+            default=None,
+            type=parse_codec,
+            help='codec and level of the frames of a modality, e.g. rgb=jpeg:95 dep=png:1 isg=rle, see frame_codecs.py. '
+                 'codec_<modality> columns of the params file take precedence (default: PNG at the default level)')
+        argparser.add_argument(
+            '--rate',
+            metavar='NAME=RATE',
+            nargs='+',
+            default=None,
+            type=parse_rate,
+            help='captures per second of a modality or of the actors (a divisor of the fps), e.g. dep=5 isg=5. The others '
+                 'are captured every frame, rate_<name> columns of the params file take precedence (default: the fps)')
+        argparser.add_argument(
+            '--resolutions',
+            metavar='WxH',
+            nargs='+',
+            default=None,
+            type=parse_resolution,
+            help='also write every sample at these resolutions, rendered once at the largest resolution. Each resolution '
+                 'gets its own dataset folder <dataset>_<W>x<H> with the hashes generate_params.py gives the rows there')
+        argparser.add_argument(
+            '--resample',
+            default='area',
+            choices=['area', 'bilinear'],
+            help='filter of rgb and depth for --resolutions, segmentation and flow are sampled nearest neighbour (default: area)')
+        argparser.add_argument(
+            '--schedule',
+            metavar='PATH',
+            default=None,
+            type=str,
+            help='only generate the rows assigned to --worker by a schedule of generate_params.py --plan, '
+                 'with --servers the k-th server runs the rows of worker k')
+        argparser.add_argument(
+            '--worker',
+            metavar='K',
+            default=0,
+            type=int,
+            help='worker of the --schedule whose rows are generated (default: 0)')
+        argparser.add_argument(
+            '--keep-row-order',
+            action='store_true',
+            help='process the rows in the order of the params file instead of grouping them by map')
+        argparser.add_argument(
+            '--reuse-world',
+            action='store_true',
+            help='reset the world instead of reloading it, if consecutive samples use the same map')
+        argparser.add_argument(
+            '--check-world-reuse',
+            metavar='N',
+            default=0,
+            type=int,
+            help='simulate N ticks of the start row after a fresh load and after a reset of the world, compare them and exit')
         argparser.add_argument(
             '--tm-port',
             metavar='P',
             default=8000,
             type=int,
             help='port to communicate with TM (default: 8000)')
+        argparser.add_argument(
+            '-w', '--writers',
+            metavar='W',
+            default=0,
+            type=int,
+            help='number of processes that encode and save the camera frames, 0 encodes in the main process (default: 0)')
+        argparser.add_argument(
+            '--writer-slots',
+            metavar='N',
+            default=None,
+            type=int,
+            help='number of frames that can be queued for the writers before the simulation waits (default: 4 * writers)')
+        argparser.add_argument(
+            '--actor-format',
+            default='csv',
+            choices=['csv', 'traj'],
+            help='csv writes actors/%%08d.csv per frame, traj writes all actor states of a sample into actors.traj '
+                 '(default: csv)')
+        argparser.add_argument(
+            '--output-backend',
+            default='files',
+            choices=['files', 'shards'],
+            help='files writes one PNG per frame and modality, shards packs them into tar shards with an index (default: files)')
+        argparser.add_argument(
+            '--shard-size',
+            metavar='N',
+            default=1000,
+            type=int,
+            help='frames per shard of the shards backend (default: 1000)')
+        argparser.add_argument(
+            '--raw-depth',
+            default='off',
+            choices=['off', 'float16', 'float32'],
+            help='write depth in metres to dep.npy of shape [frames, H, W, 1] instead of PNGs (default: off)')
+        argparser.add_argument(
+            '--raw-flow',
+            action='store_true',
+            help='write the optical flow (u, v) to ofl.npy of shape [frames, H, W, 2] instead of color coded PNGs')
+        argparser.add_argument(
+            '--warmup',
+            default='render',
+            choices=['render', 'fast'],
+            help='render renders and discards the first 3 seconds of a sample, fast simulates them without rendering '
+                 '(not yet checked against a live server to give the same first frame) (default: render)')
+        argparser.add_argument(
+            '--checkpoint-every',
+            metavar='N',
+            default=250,
+            type=int,
+            help='record the progress of a sample every N frames, so a crashed sample resumes there instead of starting '
+                 'over. The shards backend rounds N up to whole shards, 0 disables resuming (default: 250)')
+        argparser.add_argument(
+            '--annotations',
+            default='off',
+            choices=['off', 'inline'],
+            help='write ego-relative poses, projected 3D and 2D boxes and the visible pixels of every actor to '
+                 '<sample>/annotations.npz while generating, annotations.py annotates existing samples (default: off)')
+        argparser.add_argument(
+            '--digests',
+            action='store_true',
+            help='write a digest of every raw camera buffer and of the actor states of every frame to <sample>/digests.bin '
+                 '(xxh3 if the xxhash package is installed, CRC-32 and Adler-32 otherwise), compare two runs with digests.py')
+        argparser.add_argument(
+            '--audit-frames',
+            metavar='N',
+            default=0,
+            type=int,
+            help='simulate only the first N frames of every sample and write nothing but their digests, to check with '
+                 'digests.py that a sample of another dataset path is reproduced. The samples stay incomplete (default: 0)')
+        argparser.add_argument(
+            '--stuck-window',
+            metavar='SECONDS',
+            default=0.0,
+            type=float,
+            help='stop a sample whose ego vehicle was slower than --stuck-speed or moved less than --stuck-progress '
+                 'during the last SECONDS seconds, not counting waits at red lights, 0 disables it (default: 0)')
+        argparser.add_argument(
+            '--stuck-progress',
+            metavar='METRES',
+            default=2.0,
+            type=float,
+            help='distance the ego vehicle has to move within --stuck-window (default: 2.0)')
+        argparser.add_argument(
+            '--stuck-speed',
+            metavar='KMH',
+            default=1.0,
+            type=float,
+            help='speed the ego vehicle has to exceed at least once within --stuck-window (default: 1.0)')
+        argparser.add_argument(
+            '--stuck-red-light',
+            metavar='SECONDS',
+            default=60.0,
+            type=float,
+            help='longest wait at a red light before the ego vehicle counts as stuck (default: 60)')
+        argparser.add_argument(
+            '--stuck-action',
+            default='abort',
+            choices=['abort', 'resample'],
+            help='abort finishes a stuck sample with the frames up to there and records why in sample_info.yml, resample '
+                 'generates it again with a seed derived from the row seed (default: abort)')
+        argparser.add_argument(
+            '--stuck-resamples',
+            metavar='N',
+            default=3,
+            type=int,
+            help='attempts of --stuck-action resample before the sample gets aborted (default: 3)')
+        argparser.add_argument(
+            '--asset-cache',
+            metavar='DIR',
+            default=None,
+            help='folder to keep the blueprints, spawn points and navigation locations of every map and server version '
+                 'across runs, an empty string keeps them in memory only (default: <dataset-path>/.asset_cache)')
+        argparser.add_argument(
+            '--sensor-buffer',
+            metavar='N',
+            default=8,
+            type=int,
+            help='frames buffered per camera before the oldest get dropped (default: 8)')
+        argparser.add_argument(
+            '--missing-frames',
+            default='abort',
+            choices=['retry', 'skip', 'abort'],
+            help='what to do if a camera frame does not arrive within the timeout: wait again up to --sensor-retries '
+                 'times, skip saving the frame or abort the sample (default: abort)')
+        argparser.add_argument(
+            '--sensor-retries',
+            metavar='N',
+            default=3,
+            type=int,
+            help='timeouts to wait for a missing frame with --missing-frames retry before aborting (default: 3)')
+        argparser.add_argument(
+            '--extraction',
+            default='snapshot',
+            choices=['snapshot', 'actor'],
+            help='snapshot reads the actor states from the world snapshot, actor queries every actor (default: snapshot)')
+        argparser.add_argument(
+            '--status-file',
+            metavar='PATH',
+            default=None,
+            type=str,
+            help='keep a Prometheus textfile with frames/s, finished samples and ETA of the run up to date')
         argparser.add_argument(
             '-f', '--params-file',
             metavar='F',
@@ -225,7 +1062,8 @@ if __name__ == '__main__':
 
         args = argparser.parse_args()
 
-        logging.basicConfig(format='%(levelname)s: %(message)s', level=logging.INFO)
+        logging.basicConfig(format='%(processName)s %(levelname)s: %(message)s' if args.servers else '%(levelname)s: %(message)s',
+                            level=logging.INFO)
         main()
     except KeyboardInterrupt:
         pass
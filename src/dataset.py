@@ -0,0 +1,75 @@
+import os
+import csv
+import hashlib
+import collections
+
+
+def get_params_data(path):
+    columns = collections.OrderedDict()
+    n_rows = 0
+
+    # read csv to dict
+    with open(path) as params_file:
+        reader = csv.reader(params_file)
+        headers = next(reader, None)
+        for header in headers:
+            columns[header] = []
+
+        for row in reader:
+            n_rows += 1
+            for header, value in zip(headers, row):
+                columns[header].append(value)
+
+    # fill missing parameters with the ones from the previous line
+    for header in columns:
+        prev_value = ''
+        for row, value in enumerate(columns[header]):
+            if value == '':
+                columns[header][row] = prev_value
+            else:
+                prev_value = value
+
+    return n_rows, columns
+
+
+def get_sample_path(dataset_path, params, i):
+    return os.path.join(dataset_path, params['split'][i], params['map'][i], params['hash'][i], '')
+
+
+def is_sample_done(sample_path):
+    return os.path.exists(os.path.join(sample_path, 'sample_info.yml'))
+
+
+def params_hash(values):
+    # hash of generate_params.py, values are the columns of a row after the hash
+    return hashlib.sha256(str([str(x) for x in values]).encode('utf-8')).hexdigest()
+
+
+def row_hash(params, i, **values):
+    """Hash of row i with some of its values replaced, e.g. row_hash(params, i, img_h='256', img_w='256')."""
+    return params_hash([values.get(header, params[header][i]) for header in params if header != 'hash'])
+
+
+def write_params(path, params):
+    headers = list(params)
+    tmp_path = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp_path, mode='w', newline='') as params_file:
+        writer = csv.writer(params_file)
+        writer.writerow(headers)
+        writer.writerows(zip(*[params[header] for header in headers]))
+    os.replace(tmp_path, path)
+
+
+def capture_periods(fps, rates):
+    """{modality: frames between two captures} of the capture rates (per second) of the modalities, e.g. {'dep': 5}."""
+    periods = {}
+    for name, rate in (rates or {}).items():
+        if rate <= 0 or int(fps) % int(rate):
+            raise ValueError('The capture rate %s of %s does not divide the fps %s' % (rate, name, fps))
+        periods[name] = int(fps) // int(rate)
+    return periods
+
+
+def n_captures(n_frames, period=1):
+    # captured frames of n_frames recorded frames, the first one is always captured
+    return (n_frames + period - 1) // period
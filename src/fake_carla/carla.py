@@ -0,0 +1,747 @@
+"""
+Offline stand-in for the subset of the CARLA 0.9.13 Python API that this project uses.
+
+It does not simulate anything: actors move on deterministic analytic paths and cameras deliver deterministic
+synthetic images of the requested resolution. It is meant to measure and regression-test the client side on a
+CPU-only machine. Use it by putting this folder in front of the python path:
+
+    PYTHONPATH=fake_carla python3 client.py -f params.csv -p /tmp/dataset
+"""
+import math
+import fnmatch
+import itertools
+
+import numpy as np
+
+SPAWN_POINTS = 1000  # spawn points per map, the real maps have 100 to 300
+MAPS = ['Town01', 'Town02', 'Town03', 'Town04', 'Town05', 'Town06', 'Town07', 'Town10HD']
+
+
+class Vector3D:
+    def __init__(self, x=0.0, y=0.0, z=0.0):
+        self.x, self.y, self.z = float(x), float(y), float(z)
+
+    def __repr__(self):
+        return '%s(x=%f, y=%f, z=%f)' % (type(self).__name__, self.x, self.y, self.z)
+
+
+class Location(Vector3D):
+    def distance(self, other):
+        return math.sqrt((self.x - other.x) ** 2 + (self.y - other.y) ** 2 + (self.z - other.z) ** 2)
+
+
+class Rotation:
+    def __init__(self, pitch=0.0, yaw=0.0, roll=0.0):
+        self.pitch, self.yaw, self.roll = float(pitch), float(yaw), float(roll)
+
+    def _sin_cos(self):
+        p, y, r = (math.radians(v) for v in (self.pitch, self.yaw, self.roll))
+        return math.sin(p), math.cos(p), math.sin(y), math.cos(y), math.sin(r), math.cos(r)
+
+    def get_forward_vector(self):
+        sp, cp, sy, cy, sr, cr = self._sin_cos()
+        return Vector3D(cy * cp, sy * cp, sp)
+
+    def get_right_vector(self):
+        sp, cp, sy, cy, sr, cr = self._sin_cos()
+        return Vector3D(cy * sp * sr - sy * cr, sy * sp * sr + cy * cr, -cp * sr)
+
+    def get_up_vector(self):
+        sp, cp, sy, cy, sr, cr = self._sin_cos()
+        return Vector3D(-cy * sp * cr - sy * sr, -sy * sp * cr + cy * sr, cp * cr)
+
+
+class Transform:
+    def __init__(self, location=None, rotation=None):
+        self.location = location if location is not None else Location()
+        self.rotation = rotation if rotation is not None else Rotation()
+
+    def get_forward_vector(self):
+        return self.rotation.get_forward_vector()
+
+    def get_right_vector(self):
+        return self.rotation.get_right_vector()
+
+    def get_up_vector(self):
+        return self.rotation.get_up_vector()
+
+
+class BoundingBox:
+    def __init__(self, location, extent):
+        self.location = location
+        self.extent = extent
+
+
+class TrafficLightState:
+    Red = 'Red'
+    Yellow = 'Yellow'
+    Green = 'Green'
+    Off = 'Off'
+    Unknown = 'Unknown'
+
+
+class ColorConverter:
+    Raw = 'Raw'
+    Depth = 'Depth'
+    LogarithmicDepth = 'LogarithmicDepth'
+    CityScapesPalette = 'CityScapesPalette'
+
+
+class WeatherParameters:
+    def __init__(self, name='Default'):
+        self.name = name
+
+
+for _name in ['Default', 'ClearNoon', 'CloudyNoon', 'WetNoon', 'WetCloudyNoon', 'SoftRainNoon', 'MidRainyNoon', 'HardRainNoon',
+              'ClearSunset', 'CloudySunset', 'WetSunset', 'WetCloudySunset', 'SoftRainSunset', 'MidRainSunset', 'HardRainSunset']:
+    setattr(WeatherParameters, _name, WeatherParameters(_name))
+
+
+class WorldSettings:
+    def __init__(self, **kwargs):
+        self.synchronous_mode = False
+        self.no_rendering_mode = False
+        self.fixed_delta_seconds = None
+        self.substepping = True
+        self.max_substep_delta_time = 0.01
+        self.max_substeps = 10
+        self.deterministic_ragdolls = False
+        self.actor_active_distance = 2000.0
+        self.__dict__.update(kwargs)
+
+    def copy(self):
+        return WorldSettings(**self.__dict__)
+
+
+# blueprints
+
+class ActorAttribute:
+    def __init__(self, value, recommended_values=()):
+        self.value = str(value)
+        self.recommended_values = list(recommended_values)
+
+    def __str__(self):
+        return self.value
+
+    def __int__(self):
+        return int(self.value)
+
+    def __float__(self):
+        return float(self.value)
+
+    def __eq__(self, other):
+        return self.value == str(other)
+
+    def as_int(self):
+        return int(self.value)
+
+    def as_float(self):
+        return float(self.value)
+
+
+class ActorBlueprint:
+    def __init__(self, bp_id, attributes):
+        self.id = bp_id
+        self._attributes = {key: ActorAttribute(*value) if isinstance(value, tuple) else ActorAttribute(value)
+                            for key, value in attributes.items()}
+
+    def copy(self):
+        bp = ActorBlueprint(self.id, {})
+        bp._attributes = {key: ActorAttribute(a.value, a.recommended_values) for key, a in self._attributes.items()}
+        return bp
+
+    def has_attribute(self, key):
+        return key in self._attributes
+
+    def get_attribute(self, key):
+        return self._attributes[key]
+
+    def set_attribute(self, key, value):
+        if key not in self._attributes:
+            self._attributes[key] = ActorAttribute(value)
+        self._attributes[key].value = str(value)
+
+    @property
+    def attributes(self):
+        return {key: a.value for key, a in self._attributes.items()}
+
+
+def _create_blueprints():
+    colors = ('255,0,0', ['255,0,0', '0,255,0', '0,0,255', '20,20,20'])
+    vehicles = ['audi.a2', 'audi.etron', 'audi.tt', 'bmw.grandtourer', 'carlamotors.carlacola', 'chevrolet.impala',
+                'citroen.c3', 'dodge.charger_police', 'ford.ambulance', 'ford.mustang', 'jeep.wrangler_rubicon',
+                'lincoln.mkz_2017', 'mercedes.coupe', 'mercedes.sprinter', 'micro.microlino', 'mini.cooper_s',
+                'nissan.micra', 'nissan.patrol', 'seat.leon', 'tesla.cybertruck', 'tesla.model3', 'toyota.prius',
+                'volkswagen.t2', 'carlamotors.firetruck']
+    blueprints = [ActorBlueprint('vehicle.' + v, {'number_of_wheels': '4', 'color': colors, 'role_name': 'autopilot'})
+                  for v in vehicles]
+    blueprints += [ActorBlueprint('vehicle.' + v, {'number_of_wheels': '2', 'role_name': 'autopilot'})
+                   for v in ['harley-davidson.low_rider', 'yamaha.yzf', 'bh.crossbike']]
+    blueprints += [ActorBlueprint('walker.pedestrian.%04d' % i, {'is_invincible': 'true', 'speed': ('1.4', ['0.0', '1.4', '2.8'])})
+                   for i in range(1, 42)]
+    camera = {'image_size_x': '800', 'image_size_y': '600', 'fov': '90', 'sensor_tick': '0.0'}
+    blueprints += [ActorBlueprint('sensor.camera.' + c, camera)
+                   for c in ['rgb', 'depth', 'instance_segmentation', 'semantic_segmentation', 'optical_flow']]
+    blueprints += [ActorBlueprint('controller.ai.walker', {})]
+    return blueprints
+
+
+class BlueprintLibrary:
+    def __init__(self, blueprints):
+        self._blueprints = [bp.copy() for bp in blueprints]
+
+    def filter(self, wildcard_pattern):
+        # like the real library, the pattern is matched against the id and the tags
+        return BlueprintLibrary([bp for bp in self._blueprints if fnmatch.fnmatch(bp.id, wildcard_pattern) or
+                                 any(fnmatch.fnmatch(tag, wildcard_pattern) for tag in bp.id.split('.'))])
+
+    def find(self, bp_id):
+        for bp in self._blueprints:
+            if bp.id == bp_id:
+                return bp
+        raise IndexError('blueprint %r not found' % bp_id)
+
+    def __getitem__(self, index):
+        return self._blueprints[index]
+
+    def __iter__(self):
+        return iter(self._blueprints)
+
+    def __len__(self):
+        return len(self._blueprints)
+
+
+# commands
+
+class _Command:
+    def __init__(self, *args):
+        self.args = args
+        self.then_cmds = []
+
+    def then(self, command):
+        self.then_cmds.append(command)
+        return self
+
+
+class command:
+    FutureActor = 0
+
+    class SpawnActor(_Command):
+        pass
+
+    class DestroyActor(_Command):
+        pass
+
+    class SetAutopilot(_Command):
+        pass
+
+    class SetVehicleLightState(_Command):
+        pass
+
+    class SetSimulatePhysics(_Command):
+        pass
+
+    class Response:
+        def __init__(self, actor_id, error=''):
+            self.actor_id = actor_id
+            self.error = error
+
+        def has_error(self):
+            return bool(self.error)
+
+
+# sensor data
+
+class Timestamp:
+    def __init__(self, frame, elapsed_seconds, delta_seconds):
+        self.frame = frame
+        self.elapsed_seconds = elapsed_seconds
+        self.delta_seconds = delta_seconds
+
+
+class Image:
+    def __init__(self, frame, timestamp, array, fov=90.0):
+        self.frame = frame
+        self.timestamp = timestamp
+        self.height, self.width = array.shape[:2]
+        self.fov = fov
+        self._array = array
+        self.raw_data = array.reshape(-1).view(np.uint8).data
+
+    def save_to_disk(self, path, color_converter=ColorConverter.Raw):
+        # an RGBA PNG like the client library, the depth converter writes the gray level with an opaque alpha
+        import os
+        from PIL import Image as PILImage
+
+        if color_converter == ColorConverter.Depth:
+            bgra = self._array.astype(np.float32)
+            depth = bgra[..., 2] + bgra[..., 1] * 256 + bgra[..., 0] * (256 * 256)
+            gray = (np.float32(255.0) * (depth / np.float32(256 * 256 * 256 - 1))).astype(np.uint8)
+            img = np.stack([gray, gray, gray, np.full_like(gray, 255)], axis=-1)
+        else:
+            img = self._array[..., [2, 1, 0, 3]]
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        PILImage.fromarray(np.ascontiguousarray(img), mode='RGBA').save(path)
+
+
+class OpticalFlowImage(Image):
+    def get_color_coded_flow(self):
+        # HSV color coding of PythonAPI/carla/source/libcarla/SensorData.cpp, in float32 like the C++ code
+        vx = self._array[..., 0].astype(np.float32)
+        vy = self._array[..., 1].astype(np.float32)
+        angle = np.float32(180.0) + np.arctan2(vy, vx) * np.float32(360.0 / (2.0 * 3.1415))
+        angle = np.fmod(np.where(angle < 0, angle + np.float32(360.0), angle), np.float32(360.0))
+        norm = np.sqrt(vx * vx + vy * vy)
+        a = np.float32(1.0) / np.log(np.float32(0.1 + 0.999))
+        v = np.clip(a * np.log(norm + np.float32(0.999)), 0.0, 1.0).astype(np.float32)
+        h_60 = angle * np.float32(1.0 / 60.0)
+        x = v * (np.float32(1.0) - np.abs(np.fmod(h_60, np.float32(2.0)) - np.float32(1.0)))
+        zero, one = np.zeros_like(v), np.ones_like(v)
+        cases = [h_60.astype(np.uint32) == i for i in range(6)]
+        r = np.select(cases, [v, x, zero, zero, x, v], one)
+        g = np.select(cases, [x, v, v, x, zero, zero], one)
+        b = np.select(cases, [zero, zero, x, v, v, x], one)
+        bgra = np.stack([b, g, r, zero], axis=-1) * np.float32(255.0)
+        return Image(self.frame, self.timestamp, bgra.astype(np.uint8), self.fov)
+
+
+# actors
+
+class Actor:
+    def __init__(self, server, actor_id, blueprint, transform, parent=None):
+        self._server = server
+        self.id = actor_id
+        self.type_id = blueprint.id
+        self.attributes = blueprint.attributes
+        self.parent = parent
+        self._spawn_transform = transform
+        self.is_alive = True
+
+    @property
+    def bounding_box(self):
+        extent = Vector3D(0.3, 0.3, 0.9) if self.type_id.startswith('walker') else Vector3D(2.3, 1.0, 0.8)
+        return BoundingBox(Location(0.0, 0.0, extent.z), extent)
+
+    def _snapshot(self):
+        return self._server.snapshot().find(self.id)
+
+    def get_transform(self):
+        return self._snapshot().get_transform()
+
+    def get_location(self):
+        return self.get_transform().location
+
+    def get_velocity(self):
+        return self._snapshot().get_velocity()
+
+    def get_acceleration(self):
+        return self._snapshot().get_acceleration()
+
+    def get_angular_velocity(self):
+        return self._snapshot().get_angular_velocity()
+
+    def destroy(self):
+        self._server.destroy(self.id)
+        self.is_alive = False
+        return True
+
+
+class Vehicle(Actor):
+    def is_at_traffic_light(self):
+        return (self._server.frame // 100) % 3 == 0
+
+    def get_traffic_light(self):
+        return TrafficLight(TrafficLightState.Red if (self._server.frame // 50) % 2 else TrafficLightState.Green)
+
+    def get_speed_limit(self):
+        return 30.0
+
+    def set_autopilot(self, enabled=True, tm_port=8000):
+        pass
+
+    def set_light_state(self, light_state):
+        pass
+
+
+class TrafficLight:
+    def __init__(self, state):
+        self.state = state
+
+
+class Walker(Actor):
+    pass
+
+
+class WalkerAIController(Actor):
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def go_to_location(self, location):
+        pass
+
+    def set_max_speed(self, speed=1.4):
+        pass
+
+
+class Sensor(Actor):
+    def __init__(self, server, actor_id, blueprint, transform, parent=None):
+        super().__init__(server, actor_id, blueprint, transform, parent)
+        self.width = int(blueprint.get_attribute('image_size_x').value)
+        self.height = int(blueprint.get_attribute('image_size_y').value)
+        self.fov = float(blueprint.get_attribute('fov').value)
+        self.sensor_tick = float(blueprint.get_attribute('sensor_tick').value)
+        self.kind = blueprint.id.split('.')[-1]
+        self._callback = None
+        self._last_capture = None
+        self._base = None
+
+    @property
+    def is_listening(self):
+        return self._callback is not None
+
+    def listen(self, callback):
+        self._callback = callback
+
+    def stop(self):
+        self._callback = None
+
+    def destroy(self):
+        self.stop()
+        return super().destroy()
+
+    def _render(self, frame, timestamp):
+        if self._last_capture is not None and timestamp.elapsed_seconds - self._last_capture < self.sensor_tick - 1e-6:
+            return
+        self._last_capture = timestamp.elapsed_seconds
+        if self._callback is None:
+            return
+
+        if self._base is None:
+            # smooth content with a little noise, so the frames compress like real ones
+            rng = np.random.default_rng(self.id)
+            yy, xx = np.mgrid[0:self.height, 0:self.width]
+            base = (xx * 255 // max(self.width - 1, 1)).astype(np.uint8)[..., None] + rng.integers(0, 8, (self.height, self.width, 4), dtype=np.uint8)
+            base[..., 3] = 255
+            self._base = base
+            self._rows = (yy / max(self.height - 1, 1)).astype(np.float32)
+
+        shift = frame % self.width
+        if self.kind == 'optical_flow':
+            flow = np.empty((self.height, self.width, 2), dtype=np.float32)
+            flow[..., 0] = np.float32(0.01 * (frame % 13)) - self._rows * 0.05
+            flow[..., 1] = self._rows * 0.02
+            self._callback(OpticalFlowImage(frame, timestamp, flow, self.fov))
+            return
+
+        if self.kind == 'instance_segmentation':
+            self._callback(Image(frame, timestamp, self._segmentation(frame), self.fov))
+            return
+
+        array = np.roll(self._base, shift, axis=1)
+        if self.kind == 'depth':
+            depth = (1.0 - self._rows) * 2000 + 50  # encoded in mm-like units, far at the top
+            depth = (depth * 1000).astype(np.uint32)
+            array[..., 2] = depth & 0xff
+            array[..., 1] = (depth >> 8) & 0xff
+            array[..., 0] = (depth >> 16) & 0xff
+        self._callback(Image(frame, timestamp, array, self.fov))
+
+    def _segmentation(self, frame):
+        # uniform regions like a real segmentation: buildings, road and boxes of some vehicles and pedestrians with
+        # the semantic tag in R and the actor id in G (low byte) and B (high byte)
+        array = np.zeros((self.height, self.width, 4), dtype=np.uint8)
+        array[..., 3] = 255
+        array[:self.height // 2, :, 2] = 1
+        array[self.height // 2:, :, 2] = 7
+        actors = sorted((a.id, a.type_id) for a in self._server.actors.values() if a.type_id.startswith(('vehicle', 'walker')))
+        box_h, box_w = max(self.height // 6, 1), max(self.width // 10, 1)
+        for n, (actor_id, type_id) in enumerate(actors[:8]):
+            x = (n * self.width // 8 + frame) % max(self.width - box_w, 1)
+            y = self.height // 2 + (n % 3) * box_h // 2
+            box = array[y:y + box_h, x:x + box_w]
+            box[..., 2] = 4 if type_id.startswith('walker') else 10
+            box[..., 1] = actor_id & 0xff
+            box[..., 0] = (actor_id >> 8) & 0xff
+        return array
+
+
+class ActorSnapshot:
+    def __init__(self, actor_id, values):
+        self.id = actor_id
+        self._values = values
+
+    def get_transform(self):
+        v = self._values
+        return Transform(Location(v[3], v[4], v[5]), Rotation(v[0], v[1], v[2]))
+
+    def get_velocity(self):
+        return Vector3D(*self._values[6:9])
+
+    def get_acceleration(self):
+        return Vector3D(*self._values[9:12])
+
+    def get_angular_velocity(self):
+        return Vector3D(*self._values[12:15])
+
+
+class WorldSnapshot:
+    def __init__(self, frame, timestamp, actor_ids, states):
+        self.frame = frame
+        self.timestamp = timestamp
+        self._index = {a_id: i for i, a_id in enumerate(actor_ids)}
+        self._states = states
+        self._values = None
+
+    def find(self, actor_id):
+        if actor_id not in self._index:
+            return None
+        if self._values is None:
+            self._values = self._states.tolist()
+        return ActorSnapshot(actor_id, self._values[self._index[actor_id]])
+
+    def has_actor(self, actor_id):
+        return actor_id in self._index
+
+    def __len__(self):
+        return len(self._index)
+
+    def __iter__(self):
+        return (self.find(a_id) for a_id in self._index)
+
+
+# server
+
+class _Server:
+    def __init__(self):
+        self.frame = 1
+        self.elapsed_seconds = 0.0
+        self.settings = WorldSettings()
+        self.map_name = 'Town10HD_Opt'
+        self.blueprints = _create_blueprints()
+        self.actor_ids = itertools.count(1)
+        self.actors = {}
+        self.weather = WeatherParameters.Default
+        self.nav_rng = np.random.default_rng(0)
+        self._snapshot = None
+        self.world = World(self)
+
+    def spawn(self, blueprint, transform, parent=None):
+        actor_id = next(self.actor_ids)
+        prefix = blueprint.id.split('.')[0]
+        cls = {'vehicle': Vehicle, 'walker': Walker, 'sensor': Sensor, 'controller': WalkerAIController}.get(prefix, Actor)
+        self.actors[actor_id] = cls(self, actor_id, blueprint, transform, parent)
+        self._snapshot = None
+        return self.actors[actor_id]
+
+    def destroy(self, actor_id):
+        self.actors.pop(actor_id, None)
+        self._snapshot = None
+
+    def load(self, map_name):
+        self.map_name = map_name
+        self.actors = {}
+        self._snapshot = None
+        self.world = World(self)
+        return self.world
+
+    def tick(self):
+        delta = self.settings.fixed_delta_seconds or 0.05
+        self.frame += 1
+        self.elapsed_seconds += delta
+        self._snapshot = None
+        timestamp = Timestamp(self.frame, self.elapsed_seconds, delta)
+        if not self.settings.no_rendering_mode:
+            for actor in list(self.actors.values()):
+                if isinstance(actor, Sensor):
+                    actor._render(self.frame, timestamp)
+        return self.frame
+
+    def snapshot(self):
+        if self._snapshot is None:
+            moving = [a for a in self.actors.values() if not isinstance(a, (Sensor, WalkerAIController))]
+            states = self._states(moving, self.elapsed_seconds)
+            timestamp = Timestamp(self.frame, self.elapsed_seconds, self.settings.fixed_delta_seconds or 0.05)
+            self._snapshot = WorldSnapshot(self.frame, timestamp, [a.id for a in moving], states)
+        return self._snapshot
+
+    @staticmethod
+    def _states(actors, t):
+        # [pitch, yaw, roll, x, y, z, vel, acc, angular velocity] of every actor along an analytic path
+        n = len(actors)
+        states = np.zeros((n, 15), dtype=np.float32)
+        if not n:
+            return states
+        ids = np.array([a.id for a in actors], dtype=np.float64)
+        spawn = np.array([[a._spawn_transform.location.x, a._spawn_transform.location.y, a._spawn_transform.location.z,
+                           a._spawn_transform.rotation.yaw] for a in actors], dtype=np.float64)
+        speed = np.array([1.4 if a.type_id.startswith('walker') else 5.0 + a.id % 7 for a in actors], dtype=np.float64)
+        omega = 0.05 + (ids % 5) * 0.01
+        yaw = np.radians(spawn[:, 3]) + np.sin(omega * t + ids)
+        yaw_rate = omega * np.cos(omega * t + ids)
+        # integral of the velocity is approximated by the straight line, accurate enough for a stand-in
+        states[:, 0] = 0.5 * np.sin(0.3 * t + ids)
+        states[:, 1] = np.degrees(yaw)
+        states[:, 2] = 0.2 * np.cos(0.3 * t + ids)
+        states[:, 3] = spawn[:, 0] + speed * t * np.cos(yaw)
+        states[:, 4] = spawn[:, 1] + speed * t * np.sin(yaw)
+        states[:, 5] = spawn[:, 2]
+        states[:, 6] = speed * np.cos(yaw)
+        states[:, 7] = speed * np.sin(yaw)
+        states[:, 9] = -speed * np.sin(yaw) * yaw_rate
+        states[:, 10] = speed * np.cos(yaw) * yaw_rate
+        states[:, 14] = np.degrees(yaw_rate)
+        return states
+
+
+_server = None
+
+
+def _get_server():
+    global _server
+    if _server is None:
+        _server = _Server()
+    return _server
+
+
+class Map:
+    def __init__(self, server):
+        self.name = 'Carla/Maps/' + server.map_name
+        self._seed = sum(map(ord, server.map_name))
+
+    def get_spawn_points(self):
+        rng = np.random.default_rng(self._seed)
+        points = rng.uniform(-200, 200, (SPAWN_POINTS, 2))
+        yaws = rng.choice([0.0, 90.0, 180.0, 270.0], SPAWN_POINTS)
+        return [Transform(Location(x, y, 0.6), Rotation(yaw=yaw)) for (x, y), yaw in zip(points.tolist(), yaws.tolist())]
+
+
+class World:
+    def __init__(self, server):
+        self._server = server
+        self.id = id(self)
+
+    def get_settings(self):
+        return self._server.settings.copy()
+
+    def apply_settings(self, settings):
+        self._server.settings = settings.copy()
+        return self._server.frame
+
+    def tick(self, seconds=10.0):
+        return self._server.tick()
+
+    def wait_for_tick(self, seconds=10.0):
+        return self.get_snapshot()
+
+    def get_snapshot(self):
+        return self._server.snapshot()
+
+    def get_map(self):
+        return Map(self._server)
+
+    def get_blueprint_library(self):
+        return BlueprintLibrary(self._server.blueprints)
+
+    def get_actor(self, actor_id):
+        return self._server.actors.get(actor_id)
+
+    def get_actors(self, actor_ids=None):
+        actors = self._server.actors.values()
+        if actor_ids is not None:
+            actors = [a for a in actors if a.id in set(actor_ids)]
+        return list(actors)
+
+    def get_random_location_from_navigation(self):
+        x, y = self._server.nav_rng.uniform(-200, 200, 2).tolist()
+        return Location(x, y, 1.0)
+
+    def set_pedestrians_cross_factor(self, percentage):
+        pass
+
+    def set_pedestrians_seed(self, seed):
+        self._server.nav_rng = np.random.default_rng(seed)
+
+    def set_weather(self, weather):
+        self._server.weather = weather
+
+    def get_weather(self):
+        return self._server.weather
+
+    def reset_all_traffic_lights(self):
+        pass
+
+
+class TrafficManager:
+    def __init__(self, port):
+        self.port = port
+
+    def get_port(self):
+        return self.port
+
+    def __getattr__(self, name):
+        # every setter of the real traffic manager is accepted and ignored
+        if name.startswith(('set_', 'global_', 'update_', 'vehicle_', 'distance_', 'auto_', 'ignore_')):
+            return lambda *args, **kwargs: None
+        raise AttributeError(name)
+
+
+class Client:
+    def __init__(self, host='localhost', port=2000, worker_threads=0):
+        self.host = host
+        self.port = port
+        self._server = _get_server()
+
+    def set_timeout(self, seconds):
+        pass
+
+    def get_client_version(self):
+        return '0.9.13-fake'
+
+    def get_server_version(self):
+        return '0.9.13-fake'
+
+    def get_world(self):
+        return self._server.world
+
+    def get_available_maps(self):
+        return ['/Game/Carla/Maps/%s%s' % (m, suffix) for m in MAPS for suffix in ['', '_Opt']]
+
+    def load_world(self, map_name, reset_settings=True):
+        if reset_settings:
+            self._server.settings = WorldSettings()
+        return self._server.load(map_name.split('/')[-1])
+
+    def reload_world(self, reset_settings=True):
+        return self.load_world(self._server.map_name, reset_settings)
+
+    def get_trafficmanager(self, port=8000):
+        return TrafficManager(port)
+
+    def apply_batch(self, commands, do_tick=False):
+        self.apply_batch_sync(commands, do_tick)
+
+    def apply_batch_sync(self, commands, do_tick=False):
+        responses = [self._apply(cmd) for cmd in commands]
+        if do_tick:
+            self._server.tick()
+        return responses
+
+    def _apply(self, cmd):
+        if isinstance(cmd, command.SpawnActor):
+            blueprint, transform, *parent = cmd.args
+            parent = parent[0] if parent else None
+            if isinstance(parent, int):
+                parent = self._server.actors.get(parent)
+            actor = self._server.spawn(blueprint, transform, parent)
+            return command.Response(actor.id)
+        if isinstance(cmd, command.DestroyActor):
+            actor_id = cmd.args[0]
+            actor_id = actor_id.id if isinstance(actor_id, Actor) else actor_id
+            if actor_id not in self._server.actors:
+                return command.Response(actor_id, 'actor %d not found' % actor_id)
+            self._server.destroy(actor_id)
+            return command.Response(actor_id)
+        return command.Response(0)
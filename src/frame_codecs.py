@@ -0,0 +1,332 @@
+"""
+Codecs of the camera frames. Every codec encodes the (H, W, 3) uint8 image that is saved as PNG by default (RGB, gray
+depth, color coded flow, instance segmentation with the semantic tag in R and the instance id in G and B), a codec is
+given as name[:level], e.g. png:1, webp, raw-zstd:3, jpeg:90.
+
+    png       PNG, level is the zlib level 0-9 (default: the PIL default)
+    webp      lossless WebP, level is the effort 0-6 (default: 4)
+    qoi       QOI, needs the qoi package
+    raw       uncompressed array with a small header
+    raw-zlib  raw, zlib compressed (level 0-9, default: 1)
+    raw-lz4   raw, LZ4 compressed, needs the lz4 package (level 0-16, default: 0)
+    raw-zstd  raw, zstd compressed, needs the zstandard package (level 1-22, default: 3)
+    rle       runs of equal pixels, zstd compressed if zstandard is installed and zlib otherwise, instance segmentation only
+    jpeg      JPEG, lossy, RGB only, level is the quality (default: 95)
+
+decode_frame detects the codec of a payload by its first bytes. Encode time, decode time and bytes per frame of the
+codecs on the frames of a sample:
+
+    python3 frame_codecs.py /mnt/dataset/default4/train/Town01_Opt/<hash> --codecs png png:1 webp raw-zlib rle
+"""
+import io
+import os
+import json
+import time
+import zlib
+import struct
+import argparse
+
+import numpy as np
+from PIL import Image
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+try:
+    import qoi
+except ImportError:
+    qoi = None
+
+# header of raw frames: magic, compression, height, width, channels
+RAW_HEADER = struct.Struct('<4s4sIII')
+RAW_MAGIC = b'RAW1'
+# header of the .isg files: magic, compression, height, width
+ISG_HEADER = struct.Struct('<4s4sII')
+ISG_MAGIC = b'ISG1'
+
+
+def compress(method, data, level=None):
+    if method == b'zstd':
+        return zstandard.ZstdCompressor(level=3 if level is None else level).compress(data)
+    if method == b'lz4 ':
+        return lz4.frame.compress(data, compression_level=0 if level is None else level)
+    if method == b'zlib':
+        return zlib.compress(data, 6 if level is None else level)
+    return bytes(data)
+
+
+def decompress(method, data):
+    if method == b'zstd':
+        if zstandard is None:
+            raise RuntimeError('Reading zstd compressed frames needs the zstandard package')
+        return zstandard.ZstdDecompressor().decompress(data)
+    if method == b'lz4 ':
+        if lz4 is None:
+            raise RuntimeError('Reading LZ4 compressed frames needs the lz4 package')
+        return lz4.frame.decompress(data)
+    if method == b'zlib':
+        return zlib.decompress(data)
+    return data
+
+
+class Codec:
+    name = None
+    ext = None
+    magic = None
+    lossless = True
+    modalities = None  # modalities the codec may be used for, None for all
+    requires = None  # name of the package the codec needs
+    default_level = None
+
+    def __init__(self, level=None):
+        self.level = self.default_level if level is None else level
+
+    @property
+    def spec(self):
+        return self.name if self.level is None else '%s:%d' % (self.name, self.level)
+
+    @classmethod
+    def available(cls):
+        return True
+
+    def encode(self, img):
+        raise NotImplementedError
+
+    def decode(self, payload):
+        raise NotImplementedError
+
+
+class PngCodec(Codec):
+    name = 'png'
+    ext = 'png'
+    magic = b'\x89PNG'
+
+    def encode(self, img):
+        buffer = io.BytesIO()
+        if self.level is None:
+            Image.fromarray(img).save(buffer, format='png')
+        else:
+            Image.fromarray(img).save(buffer, format='png', compress_level=self.level)
+        return buffer.getvalue()
+
+    def decode(self, payload):
+        # the default depth PNG is RGBA like carla.Image.save_to_disk, the alpha is opaque
+        return np.asarray(Image.open(io.BytesIO(payload)))[..., :3]
+
+
+class WebpCodec(PngCodec):
+    name = 'webp'
+    ext = 'webp'
+    magic = b'RIFF'
+    default_level = 4
+
+    def encode(self, img):
+        buffer = io.BytesIO()
+        Image.fromarray(img).save(buffer, format='webp', lossless=True, method=self.level)
+        return buffer.getvalue()
+
+
+class JpegCodec(PngCodec):
+    name = 'jpeg'
+    ext = 'jpg'
+    magic = b'\xff\xd8'
+    lossless = False
+    modalities = ('rgb',)
+    default_level = 95
+
+    def encode(self, img):
+        buffer = io.BytesIO()
+        Image.fromarray(img).save(buffer, format='jpeg', quality=self.level)
+        return buffer.getvalue()
+
+
+class QoiCodec(Codec):
+    name = 'qoi'
+    ext = 'qoi'
+    magic = b'qoif'
+    requires = 'qoi'
+
+    @classmethod
+    def available(cls):
+        return qoi is not None
+
+    def encode(self, img):
+        return qoi.encode(img)
+
+    def decode(self, payload):
+        if qoi is None:
+            raise RuntimeError('Reading QOI frames needs the qoi package')
+        return qoi.decode(payload)
+
+
+class RawCodec(Codec):
+    name = 'raw'
+    ext = 'raw'
+    magic = RAW_MAGIC
+    compression = b'none'
+
+    def encode(self, img):
+        data = compress(self.compression, np.ascontiguousarray(img).data, self.level)
+        return RAW_HEADER.pack(RAW_MAGIC, self.compression, *img.shape) + data
+
+    def decode(self, payload):
+        _, compression, img_h, img_w, channels = RAW_HEADER.unpack_from(payload)
+        data = decompress(compression, memoryview(payload)[RAW_HEADER.size:])
+        return np.frombuffer(data, dtype=np.uint8).reshape(img_h, img_w, channels)
+
+
+class RawZlibCodec(RawCodec):
+    name = 'raw-zlib'
+    compression = b'zlib'
+    default_level = 1
+
+
+class RawLz4Codec(RawCodec):
+    name = 'raw-lz4'
+    compression = b'lz4 '
+    requires = 'lz4'
+    default_level = 0
+
+    @classmethod
+    def available(cls):
+        return lz4 is not None
+
+
+class RawZstdCodec(RawCodec):
+    name = 'raw-zstd'
+    compression = b'zstd'
+    requires = 'zstandard'
+    default_level = 3
+
+    @classmethod
+    def available(cls):
+        return zstandard is not None
+
+
+class RleCodec(Codec):
+    """
+    Runs of equal (semantic tag, instance id) pixels in row-major order, their lengths followed by their values.
+    Segmentation images are mostly long runs, so this is smaller and faster to decode than PNG.
+    """
+    name = 'rle'
+    ext = 'isg'
+    magic = ISG_MAGIC
+    modalities = ('isg',)
+
+    def encode(self, img):
+        pixels = (img[..., 0].astype(np.uint32) | (img[..., 1].astype(np.uint32) << 8)
+                  | (img[..., 2].astype(np.uint32) << 16)).ravel()
+        starts = np.flatnonzero(np.r_[True, pixels[1:] != pixels[:-1]])
+        lengths = np.diff(np.r_[starts, pixels.size]).astype(np.uint32)
+        compression = b'zstd' if zstandard is not None else b'zlib'
+        data = compress(compression, lengths.tobytes() + pixels[starts].tobytes(), self.level)
+        return ISG_HEADER.pack(ISG_MAGIC, compression, img.shape[0], img.shape[1]) + data
+
+    def decode(self, payload):
+        _, compression, img_h, img_w = ISG_HEADER.unpack_from(payload)
+        runs = np.frombuffer(decompress(compression, memoryview(payload)[ISG_HEADER.size:]), dtype=np.uint32)
+        pixels = np.repeat(runs[runs.size // 2:], runs[:runs.size // 2]).reshape(img_h, img_w)
+        return np.stack([pixels & 0xff, (pixels >> 8) & 0xff, pixels >> 16], axis=-1).astype(np.uint8)
+
+
+CODECS = {codec.name: codec for codec in [PngCodec, WebpCodec, QoiCodec, RawCodec, RawZlibCodec, RawLz4Codec,
+                                          RawZstdCodec, RleCodec, JpegCodec]}
+
+
+def get_codec(spec, modality=None):
+    """Returns the codec of a name[:level] spec, raises ValueError if it is unknown or cannot encode the modality."""
+    name, _, level = spec.partition(':')
+    if name not in CODECS:
+        raise ValueError('Unknown codec %s, choose from %s' % (name, ', '.join(CODECS)))
+    cls = CODECS[name]
+    if not cls.available():
+        raise ValueError('The %s codec needs the %s package' % (name, cls.requires))
+    if modality is not None and cls.modalities is not None and modality not in cls.modalities:
+        raise ValueError('The %s codec can only be used for %s' % (name, ', '.join(cls.modalities)))
+    return cls(int(level) if level else None)
+
+
+def decode_frame(payload):
+    """Decodes a frame of any codec to the (H, W, 3) uint8 image."""
+    for cls in CODECS.values():
+        if payload[:len(cls.magic)] == cls.magic:
+            return cls().decode(payload)
+    raise ValueError('Unknown frame format %r' % bytes(payload[:4]))
+
+
+def split_instances(img):
+    """Returns the semantic tags (uint8) and the instance ids (uint16) of a decoded instance segmentation image."""
+    return img[..., 0], img[..., 1].astype(np.uint16) | (img[..., 2].astype(np.uint16) << 8)
+
+
+def benchmark(images, codec):
+    # mean encode and decode time and size of the frames, and whether every frame was decoded unchanged
+    encode_s, decode_s, sizes, exact = [], [], [], True
+    for img in images:
+        start = time.perf_counter()
+        payload = codec.encode(img)
+        encode_s.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        decoded = codec.decode(payload)
+        decode_s.append(time.perf_counter() - start)
+        sizes.append(len(payload))
+        exact = exact and np.array_equal(decoded, img)
+    return {
+        'bytes_per_frame': round(float(np.mean(sizes))),
+        'encode_ms': round(float(np.mean(encode_s)) * 1000, 3),
+        'decode_ms': round(float(np.mean(decode_s)) * 1000, 3),
+        'lossless': exact,
+    }
+
+
+if __name__ == '__main__':
+    from reader import SampleReader
+
+    argparser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    argparser.add_argument('sample_path', help='sample folder whose frames are encoded')
+    argparser.add_argument(
+        '-c', '--codecs',
+        metavar='SPEC',
+        nargs='+',
+        default=None,
+        help='codecs to measure (default: every codec at its default level that is installed)')
+    argparser.add_argument(
+        '-n', '--frames',
+        metavar='N',
+        default=10,
+        type=int,
+        help='frames per modality, spread evenly over the sample (default: 10)')
+    argparser.add_argument(
+        '--json',
+        metavar='PATH',
+        default=None,
+        help='write the results to a JSON file')
+    args = argparser.parse_args()
+
+    sample = SampleReader(args.sample_path)
+    codecs = [get_codec(spec) for spec in args.codecs or [name for name, cls in CODECS.items() if cls.available()]]
+    results = {}
+    print('%-12s %-12s %12s %10s %10s  %s' % ('modality', 'codec', 'bytes/frame', 'encode ms', 'decode ms', 'lossless'))
+    for name in sample.modalities:
+        if name == 'actors' or name in sample.arrays:
+            continue
+        modality = os.path.basename(name)
+        captured = sample.capture_indices(name)
+        indices = captured[np.unique(np.linspace(0, len(captured) - 1, args.frames).astype(int))]
+        images = [np.ascontiguousarray(sample.read_frame(name, int(index))) for index in indices]
+        for codec in codecs:
+            if codec.modalities is not None and modality not in codec.modalities:
+                continue
+            result = results.setdefault(name, {})[codec.spec] = benchmark(images, codec)
+            print('%-12s %-12s %12d %10.3f %10.3f  %s' % (name, codec.spec, result['bytes_per_frame'], result['encode_ms'],
+                                                          result['decode_ms'], result['lossless']))
+    sample.close()
+
+    if args.json is not None:
+        with open(args.json, mode='w') as json_file:
+            json.dump(results, json_file, indent=2)
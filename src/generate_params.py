@@ -1,9 +1,19 @@
+import os
 import csv
+import glob
+import heapq
 import random
-import sys
-import hashlib
+import argparse
+import logging
 
-from syncworld import WEATHER_PRESETS
+import numpy as np
+import yaml
+
+from actors.TrafficManager import ACTIVE_DISTANCE, HYBRID_RADIUS
+from dataset import get_params_data, get_sample_path, is_sample_done, params_hash
+
+
+TRAFFIC_COLUMNS = ['hybrid_physics', 'hybrid_radius', 'respawn_dormant', 'active_distance']
 
 
 class Split(object):
@@ -15,14 +25,14 @@ class Split(object):
         self.amt = amt
 
 
-if __name__ == '__main__':
+def generate(filename, traffic=None):
+    # traffic: values of the hybrid_physics, hybrid_radius, respawn_dormant and active_distance columns of every row,
+    # the columns are left out if it is None
+    from syncworld import WEATHER_PRESETS
+
     seed = 1234567
     random.seed(seed)
 
-    if len(sys.argv) != 2:
-        exit('Specify a parameter filename. E.g.: \n    python3 generate_params.py params')
-    filename = sys.argv[1] + '.csv'
-
     params = []
     splits = [
         Split('val', ['01', '02', '03', '04', '05', '06', '07'], 7),
@@ -55,14 +65,160 @@ if __name__ == '__main__':
             assert n_vehicles >= 20, "Spawning too few vehicles!"
 
             param = ['', split.name, map_, seed, fps, duration, n_vehicles, n_walkers, weather, speed_diff, img_h, img_w, fov, cam_pitch, cam_yaw, cam_roll, cam_x, cam_y, cam_z]
-            hash_str = str([str(x) for x in param[1:]]).encode('utf-8')
-            hash_str = hashlib.sha256(hash_str).hexdigest()
-            param[0] = hash_str
+            if traffic is not None:
+                param += [traffic[column] for column in TRAFFIC_COLUMNS]
+            param[0] = params_hash(param[1:])
             params.append(param)
 
-    # params.sort(key=lambda x: x[1])  # Sorting by Town name (server does not have to load another world after each sample)
+    # params.sort(key=lambda x: x[1])  # not needed anymore, client.py groups the rows by map (see schedule_rows)
 
     with open(filename, mode='wt', encoding='utf-8') as csv_file:
         writer = csv.writer(csv_file)
-        writer.writerow(['hash', 'split', 'map', 'seed', 'fps', 'duration', 'n_vehicles', 'n_walkers', 'weather', 'speed_diff', 'img_h', 'img_w', 'fov', 'cam_pitch', 'cam_yaw', 'cam_roll', 'cam_x', 'cam_y', 'cam_z'])
+        writer.writerow(['hash', 'split', 'map', 'seed', 'fps', 'duration', 'n_vehicles', 'n_walkers', 'weather', 'speed_diff', 'img_h', 'img_w', 'fov', 'cam_pitch', 'cam_yaw', 'cam_roll', 'cam_x', 'cam_y', 'cam_z']
+                        + (TRAFFIC_COLUMNS if traffic is not None else []))
         writer.writerows(params)
+
+
+def cost_features(samples, maps):
+    # seconds per sample ~ ticks * (cost per tick of the actors and the pixels) + setup time of the map
+    ticks = np.array([(float(s['duration']) + 3) * float(s['fps']) for s in samples])
+    vehicles = np.array([float(s['n_vehicles']) for s in samples])
+    walkers = np.array([float(s['n_walkers']) for s in samples])
+    pixels = np.array([float(s['img_h']) * float(s['img_w']) / 1e6 for s in samples])
+    one_hot = np.array([[s['map'] == m for m in maps] for s in samples], dtype=np.float64).reshape(-1, len(maps))
+    return np.column_stack([ticks, ticks * vehicles, ticks * walkers, ticks * pixels, one_hot])
+
+
+def load_history(folders):
+    """Returns the sample infos of the finished samples in folders with datasets or with the splits of one dataset."""
+    history = []
+    for folder in folders:
+        # [<dataset>/]<split>/<map>/<hash>/sample_info.yml, a recursive search would list every frame
+        for pattern in [('*', '*', '*'), ('*', '*', '*', '*')]:
+            for path in glob.glob(os.path.join(folder, *pattern, 'sample_info.yml')):
+                with open(path, mode='r') as yml_file:
+                    info = yaml.safe_load(yml_file)
+                # resumed samples only recorded the time after the restart, aborted ones the time up to the stuck
+                # frame, and the copies at other resolutions share the time of the sample they were rendered with
+                excluded = ('_resumed_at', '_aborted', '_rendered_from')
+                if info and 'time' in info and not any(info.get(key) for key in excluded):
+                    history.append(dict(info, map=info['map_name']))
+    return history
+
+
+def fit_cost_model(history, maps):
+    if len(history) < 5 + len(maps):
+        logging.warning('Only %d finished samples found, predicting the cost from the number of ticks and actors, '
+                        'the predicted times are relative' % len(history))
+        return None
+    features = cost_features(history, maps)
+    times = np.array([float(info['time']) for info in history])
+    coefficients, _, _, _ = np.linalg.lstsq(features, times, rcond=None)
+    logging.info('Fitted the cost model to %d samples, mean absolute error %.1f s'
+                 % (len(history), np.abs(features @ coefficients - times).mean()))
+    return coefficients
+
+
+def predict_costs(samples, maps, coefficients):
+    features = cost_features(samples, maps)
+    if coefficients is None:
+        # ticks, every 100 actors cost about as much as a tick without actors
+        return features[:, 0] + (features[:, 1] + features[:, 2]) / 100
+    return np.maximum(features @ coefficients, 1.0)
+
+
+def assign_rows(costs, n_workers):
+    """Longest processing time first: every row goes to the worker with the least predicted time so far."""
+    loads = [(0.0, worker) for worker in range(n_workers)]
+    assignment = [[] for _ in range(n_workers)]
+    for row in sorted(range(len(costs)), key=lambda i: (-costs[i], i)):
+        load, worker = heapq.heappop(loads)
+        assignment[worker].append(row)
+        heapq.heappush(loads, (load + costs[row], worker))
+    return [sorted(rows) for rows in assignment]
+
+
+def plan(name, n_workers, dataset_path, history_folders):
+    n_rows, params = get_params_data(name + '.csv')
+    samples = [{header: params[header][i] for header in params} for i in range(n_rows)]
+    history = load_history(history_folders)
+    maps = sorted({s['map'] for s in samples} | {info['map'] for info in history})
+    costs = predict_costs(samples, maps, fit_cost_model(history, maps))
+
+    # samples that are already done get skipped by the client, client.py writes <name>.csv to <dataset_path>/<name>
+    for i in range(n_rows):
+        if is_sample_done(get_sample_path(os.path.join(dataset_path, name), params, i)):
+            costs[i] = 0.0
+    assignment = assign_rows(costs, n_workers)
+
+    # the rows keep their hash and seed, the params file stays as it is
+    schedule_path = name + '.schedule.csv'
+    with open(schedule_path, mode='wt', encoding='utf-8') as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(['row', 'hash', 'worker', 'predicted_s'])
+        for worker, rows in enumerate(assignment):
+            for i in rows:
+                writer.writerow([i + 1, params['hash'][i], worker, round(float(costs[i]), 1)])
+
+    loads = [costs[rows].sum() for rows in assignment]
+    for worker, (rows, load) in enumerate(zip(assignment, loads)):
+        print('worker %d: %d rows, predicted %.2f h' % (worker, len(rows), load / 3600))
+    print('predicted makespan %.2f h (%.2f h with consecutive row ranges), schedule written to %s' % (
+        max(loads) / 3600, max(part.sum() for part in np.array_split(costs, n_workers)) / 3600, schedule_path))
+
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser(description='Generates the parameter file <name>.csv or, with --plan, assigns its rows to workers')
+    argparser.add_argument('name', help='name of the parameter file without .csv, e.g. params')
+    argparser.add_argument(
+        '--plan',
+        metavar='N',
+        type=int,
+        default=None,
+        help='assign the rows of the existing <name>.csv to N workers with balanced predicted runtimes and write '
+             '<name>.schedule.csv, run the workers with client.py --schedule <name>.schedule.csv --worker K')
+    argparser.add_argument(
+        '--history',
+        metavar='DIR',
+        nargs='+',
+        default=None,
+        help='folders with generated datasets, the time of their finished samples is used to fit the cost model '
+             '(default: --dataset-path)')
+    argparser.add_argument(
+        '--dataset-path',
+        metavar='PATH',
+        default='/mnt/dataset',
+        help='--dataset-path of client.py, to skip the samples that are already done (default: /mnt/dataset)')
+    argparser.add_argument(
+        '--hybrid-physics',
+        action='store_true',
+        help='traffic manager hybrid physics mode: only the vehicles within --hybrid-radius of the ego vehicle are '
+             'simulated with physics, the others are teleported along their paths')
+    argparser.add_argument(
+        '--hybrid-radius',
+        metavar='METRES',
+        default=HYBRID_RADIUS,
+        type=float,
+        help='radius of the hybrid physics mode around the ego vehicle (default: %.0f)' % HYBRID_RADIUS)
+    argparser.add_argument(
+        '--respawn-dormant',
+        action='store_true',
+        help='respawn dormant vehicles (farther than --active-distance) around the ego vehicle')
+    argparser.add_argument(
+        '--active-distance',
+        metavar='METRES',
+        default=ACTIVE_DISTANCE,
+        type=float,
+        help='vehicles and walkers farther from the ego vehicle become dormant, this only takes effect on large maps '
+             '(default: %.0f)' % ACTIVE_DISTANCE)
+    args = argparser.parse_args()
+    logging.basicConfig(format='%(levelname)s: %(message)s', level=logging.INFO)
+
+    if args.plan is None:
+        traffic = None
+        if args.hybrid_physics or args.respawn_dormant or args.active_distance != ACTIVE_DISTANCE:
+            traffic = {'hybrid_physics': int(args.hybrid_physics), 'hybrid_radius': args.hybrid_radius,
+                       'respawn_dormant': int(args.respawn_dormant), 'active_distance': args.active_distance}
+        generate(args.name + '.csv', traffic)
+    else:
+        plan(args.name, args.plan, args.dataset_path, args.history or [args.dataset_path])
@@ -0,0 +1,19 @@
+import numpy as np
+
+
+# vectorized port of carla.Rotation.get_forward_vector/get_right_vector/get_up_vector
+# https://github.com/carla-simulator/carla/blob/0.9.13/LibCarla/source/carla/geom/Math.cpp
+def rotation_vectors(rotations):
+    """
+    rotations: array of shape [..., 3] with pitch, yaw, roll in degrees
+    returns: forward, right and up vectors, each of shape [..., 3]
+    """
+    rad = np.asarray(rotations, dtype=np.float32) * np.float32(np.pi / 180.0)
+    cp, cy, cr = np.cos(rad[..., 0]), np.cos(rad[..., 1]), np.cos(rad[..., 2])
+    sp, sy, sr = np.sin(rad[..., 0]), np.sin(rad[..., 1]), np.sin(rad[..., 2])
+
+    fwd = np.stack([cy * cp, sy * cp, sp], axis=-1)
+    rgt = np.stack([cy * sp * sr - sy * cr, sy * sp * sr + cy * cr, -cp * sr], axis=-1)
+    upp = np.stack([-cy * sp * cr - sy * sr, -sy * sp * cr + cy * sr, cp * cr], axis=-1)
+
+    return fwd, rgt, upp
@@ -0,0 +1,42 @@
+import os
+import json
+import hashlib
+
+import numpy as np
+
+JOURNAL_NAME = 'progress.json'
+
+
+class ResumeError(RuntimeError):
+    pass
+
+
+def state_digest(actor_states):
+    return hashlib.sha1(np.ascontiguousarray(actor_states, dtype='<f4').tobytes()).hexdigest()
+
+
+def read_journal(sample_path):
+    """Returns the last checkpoint of an incomplete sample or None."""
+    try:
+        with open(os.path.join(sample_path, JOURNAL_NAME), mode='r') as journal_file:
+            return json.load(journal_file)
+    except (OSError, ValueError):
+        return None
+
+
+def write_journal(sample_path, checkpoint):
+    """
+    Records that every output of the frames [0, checkpoint['frames']) of a sample is written. The file is replaced
+    atomically, so after a crash it holds the previous or the new checkpoint, never a mix of both.
+    """
+    path = os.path.join(sample_path, JOURNAL_NAME)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, mode='w') as journal_file:
+        json.dump(checkpoint, journal_file)
+    os.replace(tmp_path, path)
+
+
+def remove_journal(sample_path):
+    path = os.path.join(sample_path, JOURNAL_NAME)
+    if os.path.exists(path):
+        os.remove(path)
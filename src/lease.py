@@ -0,0 +1,91 @@
+import os
+import time
+import uuid
+import logging
+
+
+class Lease:
+    """
+    Claims a sample for one worker with a lease file next to the sample folder.
+
+    The file is created with O_EXCL, so only one worker can hold it. The holder refreshes its mtime with
+    heartbeat(). A lease whose mtime is older than timeout belongs to a crashed worker and can be reclaimed.
+    """
+
+    def __init__(self, path, owner, timeout):
+        self.path = path
+        self.token = '%s %s' % (owner, uuid.uuid4().hex)
+        self.timeout = timeout
+        self.held = False
+        self._last_heartbeat = 0.0
+
+    def acquire(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        if self._create():
+            return True
+
+        try:
+            mtime = os.stat(self.path).st_mtime
+            token = self._read(self.path)
+        except FileNotFoundError:
+            return self._create()
+        if time.time() - mtime < self.timeout:
+            return False
+
+        # move the stale lease away, the rename is atomic so only one worker can succeed
+        stale_path = '%s.%s.stale' % (self.path, uuid.uuid4().hex)
+        try:
+            os.rename(self.path, stale_path)
+        except FileNotFoundError:
+            return False
+        if self._read(stale_path) != token:
+            # the lease was renewed in the meantime, put it back unless somebody else claimed it already
+            try:
+                os.link(stale_path, self.path)
+            except FileExistsError:
+                pass
+            os.unlink(stale_path)
+            return False
+        os.unlink(stale_path)
+
+        logging.warning('Reclaiming %s from %s (no heartbeat for %.0fs)' % (self.path, token, time.time() - mtime))
+        return self._create()
+
+    def heartbeat(self):
+        if not self.held or time.time() - self._last_heartbeat < self.timeout / 10:
+            return
+        try:
+            token = self._read(self.path)
+        except FileNotFoundError:
+            token = None
+        if token != self.token:
+            self.held = False
+            raise RuntimeError('Lost lease %s to %s' % (self.path, token))
+        os.utime(self.path)
+        self._last_heartbeat = time.time()
+
+    def release(self):
+        if not self.held:
+            return
+        self.held = False
+        try:
+            if self._read(self.path) == self.token:
+                os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+    def _create(self):
+        try:
+            fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, mode='w') as lease_file:
+            lease_file.write(self.token)
+        self.held = True
+        self._last_heartbeat = time.time()
+        return True
+
+    @staticmethod
+    def _read(path):
+        with open(path, mode='r') as lease_file:
+            return lease_file.read()
@@ -0,0 +1,287 @@
+"""
+Builds or updates a SQLite manifest of a generated dataset: status, frame counts per modality and optionally file
+checksums of every sample of the params.csv in the dataset folder. Only samples whose folder changed since the last
+run are scanned again, so it can run while the dataset is still being generated.
+
+    python3 manifest.py /mnt/dataset/default4
+    python3 manifest.py /mnt/dataset/default4 --checksums --jobs 16
+
+Status of a sample: complete, aborted (complete up to the frame its ego vehicle got stuck, see client.py
+--stuck-window), corrupt (sample_info.yml exists, but frames are missing), incomplete or missing.
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import yaml
+
+from dataset import capture_periods, get_params_data, n_captures
+from journal import JOURNAL_NAME
+from rig import rig_from_info, rig_outputs
+from trajectory import TrajectoryReader
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS samples (
+    hash TEXT PRIMARY KEY,
+    split TEXT,
+    map TEXT,
+    path TEXT,
+    status TEXT,
+    expected_frames INTEGER,
+    frames INTEGER,
+    problems TEXT,
+    info TEXT,
+    mtime_ns INTEGER,
+    checksums INTEGER,
+    scanned_at REAL
+);
+CREATE TABLE IF NOT EXISTS modalities (
+    hash TEXT,
+    name TEXT,
+    storage TEXT,
+    frames INTEGER,
+    bytes INTEGER,
+    PRIMARY KEY (hash, name)
+);
+CREATE TABLE IF NOT EXISTS files (
+    hash TEXT,
+    path TEXT,
+    size INTEGER,
+    sha1 TEXT,
+    PRIMARY KEY (hash, path)
+);
+'''
+
+
+def is_temporary(name):
+    return name.startswith('.') or name.endswith('.tmp')
+
+
+def sample_mtime(sample_path):
+    # newest mtime of the sample folder and its entries, new frames change the mtime of their modality folder, which
+    # is <camera>/<modality>/ in samples of a rig
+    mtime = os.stat(sample_path).st_mtime_ns
+    for entry in os.scandir(sample_path):
+        mtime = max(mtime, entry.stat().st_mtime_ns)
+        if entry.is_dir() and is_camera_folder(entry.path):
+            mtime = max(mtime, sample_mtime(entry.path))
+    return mtime
+
+
+def scan_folder(path):
+    # frames and bytes of a modality folder, either one file per frame or tar shards with a JSON index each
+    entries = [entry for entry in os.scandir(path) if entry.is_file() and not is_temporary(entry.name)]
+    indices = [entry for entry in entries if entry.name.endswith('.json')]
+    n_bytes = sum(entry.stat().st_size for entry in entries)
+    if indices:
+        frames = 0
+        for entry in indices:
+            with open(entry.path, mode='r') as index_file:
+                frames += len(json.load(index_file)['frames'])
+        return 'shards', frames, n_bytes
+    storage = os.path.splitext(entries[0].name)[1][1:] if entries else ''
+    return storage, len(entries), n_bytes
+
+
+def is_camera_folder(path):
+    # folder of a rig camera with modality folders and .npy files, modality folders only hold files
+    return any(entry.is_dir() or entry.name.endswith('.npy') for entry in os.scandir(path))
+
+
+def scan_modalities(sample_path, prefix=''):
+    modalities = {}
+    for entry in os.scandir(sample_path):
+        if is_temporary(entry.name):
+            continue
+        name, ext = os.path.splitext(entry.name)
+        name = prefix + name
+        if entry.is_dir() and not prefix and is_camera_folder(entry.path):
+            modalities.update(scan_modalities(entry.path, entry.name + '/'))
+        elif entry.is_dir():
+            modalities[prefix + entry.name] = scan_folder(entry.path)
+        elif ext == '.npy':
+            modalities[name] = ('npy', np.load(entry.path, mmap_mode='r').shape[0], entry.stat().st_size)
+        elif ext == '.traj':
+            modalities[name] = ('traj', TrajectoryReader(entry.path).n_frames, entry.stat().st_size)
+    return modalities
+
+
+def file_checksums(sample_path):
+    checksums = []
+    for root, dirs, files in os.walk(sample_path):
+        dirs[:] = sorted(d for d in dirs if not is_temporary(d))
+        for name in sorted(files):
+            if is_temporary(name):
+                continue
+            path = os.path.join(root, name)
+            sha1 = hashlib.sha1()
+            with open(path, mode='rb') as in_file:
+                for chunk in iter(lambda: in_file.read(1 << 20), b''):
+                    sha1.update(chunk)
+            checksums.append((os.path.relpath(path, sample_path), os.path.getsize(path), sha1.hexdigest()))
+    return checksums
+
+
+def count_rows(path):
+    with open(path, mode='rb') as csv_file:
+        return max(sum(1 for _ in csv_file) - 1, 0)
+
+
+def scan_sample(task):
+    """Returns the manifest entries of a sample or None if it did not change since known_mtime."""
+    hash_str, sample_path, expected_frames, known_mtime, checksums = task
+    if not os.path.isdir(sample_path):
+        return {'hash': hash_str, 'status': 'missing', 'frames': 0, 'problems': [], 'info': None, 'mtime_ns': None,
+                'modalities': {}, 'files': []}
+
+    mtime = sample_mtime(sample_path)
+    if mtime == known_mtime:
+        return None
+
+    modalities = scan_modalities(sample_path)
+    problems = []
+    info = None
+    info_path = os.path.join(sample_path, 'sample_info.yml')
+    if os.path.exists(info_path):
+        with open(info_path, mode='r') as yml_file:
+            info = yaml.safe_load(yml_file)
+        expected_frames = int(info['duration']) * int(info['fps'])
+        aborted = info.get('_aborted')
+        if aborted:
+            expected_frames = aborted['frames']
+        skipped = (info.get('_sensors') or {}).get('skipped_frames', 0)
+        skipped_captures = (info.get('_sensors') or {}).get('skipped_captures')
+        # modalities captured every n-th frame, see client.py --rate
+        periods = capture_periods(info['fps'], info.get('_rates'))
+
+        expected = {}  # name -> (captures, captures without the skipped frames)
+        for name in rig_outputs(rig_from_info(info)):
+            n_skipped = skipped if skipped_captures is None else skipped_captures.get(name, 0)
+            n_frames = n_captures(expected_frames, periods.get(os.path.basename(name), 1))
+            expected[name] = (n_frames, n_frames - n_skipped)
+        n_frames = n_captures(expected_frames, periods.get('actors', 1))
+        expected['actors'] = (n_frames, n_frames)
+        for name, (n_frames, n_saved) in sorted(expected.items()):
+            if name not in modalities:
+                problems.append('%s is missing' % name)
+            elif modalities[name][0] == 'npy':
+                # the raw arrays keep the rows of skipped frames, of an aborted sample the length of a complete one
+                if modalities[name][1] != n_frames and not aborted:
+                    problems.append('%s has %d of %d frames' % (name, modalities[name][1], n_frames))
+            elif modalities[name][1] != n_saved:
+                problems.append('%s has %d of %d frames' % (name, modalities[name][1], n_saved))
+        frame_info_path = os.path.join(sample_path, 'frame_info.csv')
+        n_rows = count_rows(frame_info_path) if os.path.exists(frame_info_path) else 0
+        if n_rows != expected_frames:
+            problems.append('frame_info.csv has %d of %d rows' % (n_rows, expected_frames))
+        status = 'corrupt' if problems else 'aborted' if aborted else 'complete'
+        frames = min([modalities[name][1] for name in expected if name in modalities] or [0])
+    else:
+        # frames of the last checkpoint, if the sample gets resumed
+        status = 'incomplete'
+        journal_path = os.path.join(sample_path, JOURNAL_NAME)
+        frames = 0
+        if os.path.exists(journal_path):
+            with open(journal_path, mode='r') as journal_file:
+                frames = json.load(journal_file)['frames']
+
+    return {
+        'hash': hash_str,
+        'status': status,
+        'expected_frames': expected_frames,
+        'frames': frames,
+        'problems': problems,
+        'info': info,
+        'mtime_ns': mtime,
+        'modalities': modalities,
+        'files': file_checksums(sample_path) if checksums and status != 'incomplete' else [],
+    }
+
+
+def update_manifest(dataset_path, db_path, jobs=None, checksums=False, full=False):
+    n_rows, params = get_params_data(os.path.join(dataset_path, 'params.csv'))
+    con = sqlite3.connect(db_path)
+    con.execute('PRAGMA journal_mode=WAL')  # readers see the last committed state while the manifest is updated
+    con.executescript(SCHEMA)
+    known = {hash_str: (mtime, has_checksums) for hash_str, mtime, has_checksums in con.execute('SELECT hash, mtime_ns, checksums FROM samples')}
+
+    tasks, rows = [], {}
+    for i in range(n_rows):
+        hash_str = params['hash'][i]
+        sample_path = os.path.join(dataset_path, params['split'][i], params['map'][i], hash_str)
+        mtime, has_checksums = known.get(hash_str, (None, 0))
+        if full or (checksums and not has_checksums):
+            mtime = None
+        rows[hash_str] = (params['split'][i], params['map'][i], sample_path)
+        tasks.append((hash_str, sample_path, int(params['duration'][i]) * int(params['fps'][i]), mtime, checksums))
+
+    n_scanned = 0
+    with ProcessPoolExecutor(jobs) as pool:
+        for result in pool.map(scan_sample, tasks, chunksize=8):
+            if result is None:
+                continue
+            n_scanned += 1
+            hash_str = result['hash']
+            split, map_name, sample_path = rows[hash_str]
+            con.execute('INSERT OR REPLACE INTO samples VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', (
+                hash_str, split, map_name, sample_path, result['status'], result.get('expected_frames'), result['frames'],
+                json.dumps(result['problems']), json.dumps(result['info']), result['mtime_ns'], int(checksums), time.time()))
+            con.execute('DELETE FROM modalities WHERE hash = ?', (hash_str,))
+            con.executemany('INSERT INTO modalities VALUES (?, ?, ?, ?, ?)',
+                            [(hash_str, name, *values) for name, values in sorted(result['modalities'].items())])
+            if checksums:
+                con.execute('DELETE FROM files WHERE hash = ?', (hash_str,))
+                con.executemany('INSERT INTO files VALUES (?, ?, ?, ?)', [(hash_str, *values) for values in result['files']])
+            if n_scanned % 100 == 0:
+                con.commit()
+
+    # samples that are not part of the params file anymore
+    con.execute('CREATE TEMP TABLE params_hashes (hash TEXT PRIMARY KEY)')
+    con.executemany('INSERT OR IGNORE INTO params_hashes VALUES (?)', [(h,) for h in rows])
+    for table in ['samples', 'modalities', 'files']:
+        con.execute('DELETE FROM %s WHERE hash NOT IN (SELECT hash FROM params_hashes)' % table)
+    con.commit()
+
+    summary = dict(con.execute('SELECT status, COUNT(*) FROM samples GROUP BY status'))
+    con.close()
+    return n_scanned, summary
+
+
+def main():
+    argparser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    argparser.add_argument('dataset_path', help='dataset folder that contains the params.csv, e.g. /mnt/dataset/default4')
+    argparser.add_argument(
+        '-o', '--output',
+        metavar='PATH',
+        default=None,
+        help='SQLite file of the manifest (default: <dataset_path>/manifest.sqlite)')
+    argparser.add_argument(
+        '-j', '--jobs',
+        metavar='N',
+        default=None,
+        type=int,
+        help='number of scanning processes (default: number of CPUs)')
+    argparser.add_argument(
+        '--checksums',
+        action='store_true',
+        help='store size and SHA-1 of every file of the finished samples')
+    argparser.add_argument(
+        '--full',
+        action='store_true',
+        help='scan every sample again, not only the changed ones')
+    args = argparser.parse_args()
+
+    start = time.time()
+    db_path = args.output or os.path.join(args.dataset_path, 'manifest.sqlite')
+    n_scanned, summary = update_manifest(args.dataset_path, db_path, args.jobs, args.checksums, args.full)
+    print('Scanned %d samples in %.1f s: %s' % (n_scanned, time.time() - start,
+                                               ', '.join('%d %s' % (n, status) for status, n in sorted(summary.items()))))
+
+
+if __name__ == '__main__':
+    main()
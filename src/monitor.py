@@ -0,0 +1,64 @@
+"""
+Detects samples whose ego vehicle got stuck, e.g. in a jam, behind a crashed car or in front of a traffic light that
+stays red, so client.py can stop simulating frames nobody wants:
+
+    python3 client.py --stuck-window 30 --stuck-action abort     # finish the sample early, the reason is in sample_info.yml
+    python3 client.py --stuck-window 30 --stuck-action resample  # start the sample over with a seed derived from its own
+"""
+import hashlib
+import collections
+
+import numpy as np
+
+
+class SampleStuck(RuntimeError):
+    """The ego vehicle of a sample got stuck and the sample gets generated again with another seed."""
+
+    def __init__(self, stuck):
+        super().__init__(stuck['reason'])
+        self.stuck = stuck  # reason, seed and frames of the attempt, see client.py
+
+
+class StuckMonitor:
+    """
+    The ego vehicle is stuck if it was slower than min_speed km/h or moved less than min_progress metres during the
+    last `window` seconds, or waited at a red light for longer than max_red_light seconds. Waiting at a red light
+    does not count towards the window.
+    """
+
+    def __init__(self, fps, window, min_progress=2.0, min_speed=1.0, max_red_light=60.0):
+        self.fps = fps
+        self.window_frames = max(1, round(window * fps))
+        self.min_progress = min_progress
+        self.min_speed = min_speed
+        self.max_red_frames = round(max_red_light * fps)
+        self._locations = collections.deque(maxlen=self.window_frames + 1)
+        self._slow_frames = 0
+        self._red_frames = 0
+
+    def update(self, traffic_light, speed, location):
+        """Adds a frame, returns why the ego vehicle is stuck or None."""
+        if str(traffic_light) == 'Red':
+            self._red_frames += 1
+            self._slow_frames = 0
+            self._locations.clear()
+            if self._red_frames > self.max_red_frames:
+                return 'waited at a red light for %.1f s' % (self._red_frames / self.fps)
+            return None
+        self._red_frames = 0
+
+        self._slow_frames = self._slow_frames + 1 if speed < self.min_speed else 0
+        if self._slow_frames >= self.window_frames:
+            return 'slower than %.1f km/h for %.1f s' % (self.min_speed, self._slow_frames / self.fps)
+        self._locations.append(np.array(location, dtype=np.float64))
+        if len(self._locations) > self.window_frames:
+            progress = np.linalg.norm(self._locations[-1] - self._locations[0])
+            if progress < self.min_progress:
+                return 'moved %.1f m in %.1f s' % (progress, self.window_frames / self.fps)
+        return None
+
+
+def resample_seed(seed, attempt):
+    # seed of the n-th restart of a sample, the same for every run, in the range generate_params.py uses
+    digest = hashlib.sha1(b'%d:%d' % (seed, attempt)).digest()
+    return int.from_bytes(digest[:8], 'little') % 999999 + 1
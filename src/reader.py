@@ -0,0 +1,287 @@
+"""
+Random access to the clips of a generated dataset, for every output backend of the client: image files of
+every codec of frame_codecs.py, tar shards, raw .npy arrays, actors.traj and per frame actor CSVs.
+
+    reader = DatasetReader('/mnt/dataset/default4', workers=8, cache_bytes=4 << 30)
+    clip = reader.get_clip(sample_hash, start_frame=0, length=16, modalities=['rgb', 'dep', 'actors'])
+    clip['rgb'].shape  # (16, H, W, 3)
+
+Frames are addressed by their index in the sample (0 is the first recorded frame). Images are decoded in a thread pool
+and kept in an LRU cache, .npy and .traj modalities are returned as views of memory maps without copying. The
+modalities of the cameras of a rig are called '<camera>/<modality>', e.g. 'left/rgb'. A modality captured at a lower
+rate (client.py --rate) has only every n-th frame, clips hold only these and SampleReader.capture_indices gives their
+indices:
+
+    clip = reader.get_clip(sample_hash, start_frame=0, length=25, modalities=['rgb', 'dep'])
+    clip['dep'].shape  # (5, H, W, 3) captured at 5 of 25 fps
+    reader.sample(sample_hash).capture_indices('dep', 0, 25)  # [0, 5, 10, 15, 20]
+
+The camera frames of ticks skipped because of missing sensor data (client.py --missing-frames skip) are flagged in the
+skipped column of frame_info.csv. They are left out of capture_indices and clips, reading them raises KeyError.
+
+Instance segmentation is decoded to the image of the other codecs (tag in R, instance id in G and B), whichever codec
+wrote it. SampleReader.read_instances splits a frame into its semantic tags and instance ids:
+
+    tags, ids = reader.sample(sample_hash).read_instances('isg', 0)
+    actor_id, type_id = reader.sample(sample_hash).instances[ids[y, x]]
+"""
+import io
+import os
+import csv
+import json
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import yaml
+
+from dataset import capture_periods, get_params_data
+from frame_codecs import decode_frame, split_instances
+from rig import rig_from_info, rig_outputs
+from trajectory import TrajectoryReader, STATIC_COLUMNS
+
+
+class SampleReader:
+    """Finds the storage of every modality of one sample and reads single frames."""
+
+    def __init__(self, sample_path, info=None):
+        # info: parameters of a sample that is not finished yet, read from sample_info.yml otherwise
+        self.path = sample_path
+        if info is None:
+            with open(os.path.join(sample_path, 'sample_info.yml'), mode='r') as yml_file:
+                info = yaml.safe_load(yml_file)
+        self.info = info
+        with open(os.path.join(sample_path, 'frame_info.csv'), mode='r', newline='') as csv_file:
+            header, *rows = list(csv.reader(csv_file))
+        self.frames = np.array([int(row[0]) for row in rows], dtype=np.int64)
+        # frames whose camera data is missing (client.py --missing-frames skip), their actor states are written
+        column = header.index('skipped') if 'skipped' in header else None
+        self.skipped = np.array([column is not None and row[column] == '1' for row in rows], dtype=bool)
+        self.frame_info = rows
+
+        periods = capture_periods(info['fps'], info.get('_rates'))
+        self.periods = {name: periods.get(os.path.basename(name), 1)
+                        for name in rig_outputs(rig_from_info(info)) + ['actors']}
+        self.arrays = {}  # modality -> memory map of shape [captured frame, ...]
+        self.shards = {}  # modality -> {frame: (tar path, offset, size)}
+        self.files = {}  # modality -> file extension
+        self._fds = {}
+        self._instances = None
+        self._lock = threading.Lock()
+        for name in rig_outputs(rig_from_info(self.info)) + ['actors']:
+            folder = os.path.join(sample_path, name)
+            if os.path.exists(os.path.join(sample_path, name + '.npy')):
+                self.arrays[name] = np.load(os.path.join(sample_path, name + '.npy'), mmap_mode='r')
+            elif name == 'actors' and os.path.exists(os.path.join(sample_path, 'actors.traj')):
+                self.trajectory = TrajectoryReader(os.path.join(sample_path, 'actors.traj'))
+                self.arrays[name] = self.trajectory.data
+            elif os.path.isdir(folder):
+                entries = [f for f in os.listdir(folder) if not f.startswith('.')]
+                indices = sorted(f for f in entries if f.endswith('.json'))
+                if indices:
+                    self.shards[name] = self._read_indices(folder, indices)
+                elif entries:
+                    self.files[name] = os.path.splitext(entries[0])[1][1:]
+
+    @property
+    def modalities(self):
+        return sorted([*self.arrays, *self.shards, *self.files])
+
+    def __len__(self):
+        return len(self.frames)
+
+    def capture_indices(self, name, start=0, stop=None):
+        """Indices of the frames in [start, stop) in which a modality was captured, without the skipped frames."""
+        period = self.periods.get(name, 1)
+        indices = np.arange(-(-start // period) * period, len(self) if stop is None else stop, period)
+        if name == 'actors':
+            return indices
+        return indices[~self.skipped[indices]]
+
+    def _capture_index(self, name, index):
+        # row of a frame in the storage of a modality, skipped frames keep their row
+        capture_index, rest = divmod(index, self.periods.get(name, 1))
+        if rest:
+            raise KeyError('%s was not captured in frame %d of %s' % (name, index, self.path))
+        if name != 'actors' and self.skipped[index]:
+            raise KeyError('%s is missing in the skipped frame %d of %s' % (name, index, self.path))
+        return capture_index
+
+    @staticmethod
+    def _read_indices(folder, indices):
+        members = {}
+        for index_name in indices:
+            with open(os.path.join(folder, index_name), mode='r') as index_file:
+                index = json.load(index_file)
+            tar_path = os.path.join(folder, index_name[:-len('.json')] + '.tar')
+            for frame, offset, size in zip(index['frames'], index['offsets'], index['sizes']):
+                members[frame] = (tar_path, offset, size)
+        return members
+
+    def read_bytes(self, name, index):
+        self._capture_index(name, index)
+        frame = int(self.frames[index])
+        if name in self.shards:
+            tar_path, offset, size = self.shards[name][frame]
+            with self._lock:
+                if tar_path not in self._fds:
+                    self._fds[tar_path] = os.open(tar_path, os.O_RDONLY)
+                fd = self._fds[tar_path]
+            return os.pread(fd, size, offset)
+        with open(os.path.join(self.path, name, '%08d.%s' % (frame, self.files[name])), mode='rb') as in_file:
+            return in_file.read()
+
+    def read_frame(self, name, index):
+        """
+        Decodes one frame, images of every codec as (H, W, 3) uint8 and actor CSVs as (actors, columns) float32.
+        read_instances returns the planes of instance segmentation.
+        """
+        if name in self.arrays:
+            return self.arrays[name][self._capture_index(name, index)]
+        payload = self.read_bytes(name, index)
+        if name == 'actors':
+            rows = list(csv.reader(io.StringIO(payload.decode('utf-8'))))[1:]
+            return np.array([row[len(STATIC_COLUMNS):] for row in rows], dtype=np.float32)
+        return decode_frame(payload)
+
+    def read_instances(self, name, index):
+        """
+        The semantic tags (H, W) uint8 and instance ids (H, W) uint16 of an instance segmentation frame, e.g. 'isg' or
+        'left/isg'. instances maps the ids to the actors.
+        """
+        return split_instances(self.read_frame(name, index))
+
+    @property
+    def instances(self):
+        """{instance id: (actor id, type id)} of the actors of the sample, to join the segmentation with actors."""
+        if self._instances is None:
+            with open(os.path.join(self.path, 'instances.csv'), mode='r', newline='') as csv_file:
+                self._instances = {int(row[0]): (int(row[1]), row[2]) for row in list(csv.reader(csv_file))[1:]}
+        return self._instances
+
+    def close(self):
+        with self._lock:
+            for fd in self._fds.values():
+                os.close(fd)
+            self._fds = {}
+
+
+class DatasetReader:
+    """
+    Reads clips of the samples of a dataset folder (the one with the params.csv) or of sample folders given by path.
+
+    Decoded frames are kept in an LRU cache of at most cache_bytes, frames that are requested while they are still
+    being decoded are decoded only once.
+    """
+
+    def __init__(self, dataset_path=None, workers=8, cache_bytes=1 << 30):
+        self.dataset_path = dataset_path
+        self.cache_bytes = cache_bytes
+        self._pool = ThreadPoolExecutor(workers)
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()  # (sample path, modality, index) -> array
+        self._cache_size = 0
+        self._pending = {}  # (sample path, modality, index) -> future
+        self._samples = {}
+        self._paths = {}
+        if dataset_path is not None:
+            n_rows, params = get_params_data(os.path.join(dataset_path, 'params.csv'))
+            self._paths = {params['hash'][i]: os.path.join(dataset_path, params['split'][i], params['map'][i], params['hash'][i])
+                           for i in range(n_rows)}
+
+    @property
+    def sample_hashes(self):
+        return sorted(self._paths)
+
+    def sample(self, sample):
+        """Returns the SampleReader of a sample hash of the dataset or of a sample folder."""
+        path = self._paths.get(sample, sample)
+        with self._lock:
+            if path not in self._samples:
+                self._samples[path] = SampleReader(path)
+            return self._samples[path]
+
+    def prefetch(self, sample, start_frame, length, modalities=None):
+        """Starts decoding a clip in the background, e.g. the next one of a data loader."""
+        reader = self.sample(sample)
+        for name in modalities or reader.modalities:
+            if name not in reader.arrays:
+                for index in reader.capture_indices(name, start_frame, start_frame + length):
+                    self._submit(reader, name, int(index))
+
+    def get_clip(self, sample, start_frame, length, modalities=None, stack=True):
+        """
+        Returns {modality: array of shape [length, ...], 'frame': frame ids}. Memory-mapped modalities are views,
+        stack=False returns the decoded frames as a list of the (read-only) cached arrays instead of a new array. Skipped
+        frames are left out, which makes the memory-mapped modalities copies.
+        Modalities captured at a lower rate hold only their frames of the clip, see SampleReader.capture_indices.
+        """
+        reader = self.sample(sample)
+        if start_frame < 0 or start_frame + length > len(reader):
+            raise IndexError('Frames [%d, %d) are out of range for %d frames' % (start_frame, start_frame + length, len(reader)))
+        modalities = modalities or reader.modalities
+
+        futures = {name: [self._submit(reader, name, int(index))
+                          for index in reader.capture_indices(name, start_frame, start_frame + length)]
+                   for name in modalities if name not in reader.arrays}
+        clip = {'frame': reader.frames[start_frame:start_frame + length]}
+        for name in modalities:
+            if name in reader.arrays:
+                rows = reader.capture_indices(name, start_frame, start_frame + length) // reader.periods.get(name, 1)
+                if len(rows) and rows[-1] - rows[0] + 1 != len(rows):
+                    # the rows of skipped frames are left out, a copy
+                    clip[name] = reader.arrays[name][rows]
+                else:
+                    clip[name] = reader.arrays[name][rows[0]:rows[-1] + 1] if len(rows) else reader.arrays[name][:0]
+            else:
+                frames = [future.result() for future in futures[name]]
+                clip[name] = np.stack(frames) if stack else frames
+        return clip
+
+    def _submit(self, reader, name, index):
+        key = (reader.path, name, index)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                future = _Done(self._cache[key])
+            elif key in self._pending:
+                future = self._pending[key]
+            else:
+                future = self._pending[key] = self._pool.submit(self._decode, reader, name, index, key)
+        return future
+
+    def _decode(self, reader, name, index, key):
+        try:
+            frame = reader.read_frame(name, index)
+            frame.flags.writeable = False  # shared by every clip that contains it
+            with self._lock:
+                self._cache[key] = frame
+                self._cache_size += frame.nbytes
+                while self._cache_size > self.cache_bytes and len(self._cache) > 1:
+                    _, evicted = self._cache.popitem(last=False)
+                    self._cache_size -= evicted.nbytes
+            return frame
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+
+    def close(self):
+        self._pool.shutdown()
+        for reader in self._samples.values():
+            reader.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args, **kwargs):
+        self.close()
+
+
+class _Done:
+    # future of a cached frame
+    def __init__(self, value):
+        self._value = value
+
+    def result(self):
+        return self._value
@@ -0,0 +1,71 @@
+"""
+Writes a sample at several resolutions from one render at the largest of them. Every resolution is a sample of its
+own in <dataset>_<W>x<H>/<split>/<map>/<hash>/ with the hash generate_params.py gives the row at that resolution and
+a params.csv of these rows, so the folder can be used like a dataset that was generated at this resolution.
+"""
+import os
+import shutil
+import collections
+
+from dataset import row_hash
+from rig import Camera
+
+# outputs that do not depend on the resolution, copied from the rendered sample
+SHARED_OUTPUTS = ['frame_info.csv', 'instances.csv', 'actors.traj', 'actors']
+
+
+class ResolutionOutput:
+    """Sink and raw arrays of one resolution of a sample, sizes maps the sensor names to their (img_h, img_w)."""
+
+    def __init__(self, sample_path, hash_str, img_h, img_w, rig, sink, raw_arrays=None):
+        self.sample_path = sample_path
+        self.hash = hash_str
+        self.img_h = img_h
+        self.img_w = img_w
+        self.rig = rig
+        self.sink = sink
+        self.raw_arrays = raw_arrays
+        self.sizes = {camera.output_name(modality): (camera.img_h, camera.img_w)
+                      for camera in rig for modality in camera.modalities}
+
+    def close(self):
+        self.sink.close()
+        if self.raw_arrays is not None:
+            self.raw_arrays.close()
+
+
+def resolution_dataset_path(dataset_path, img_w, img_h):
+    return '%s_%dx%d' % (dataset_path.rstrip(os.sep), img_w, img_h)
+
+
+def resized_params(params, img_w, img_h):
+    """The rows of a params file at another resolution, with the hashes generate_params.py would give them."""
+    n_rows = len(params['hash'])
+    resized = collections.OrderedDict((header, list(values)) for header, values in params.items())
+    resized['img_w'] = [str(img_w)] * n_rows
+    resized['img_h'] = [str(img_h)] * n_rows
+    resized['hash'] = [row_hash(params, i, img_w=str(img_w), img_h=str(img_h)) for i in range(n_rows)]
+    return resized
+
+
+def render_size(img_h, img_w, resolutions):
+    # the largest resolution, downscaling to another aspect ratio would distort the images
+    for w, h in resolutions:
+        if abs(h * img_w / img_h - w) > 1:
+            raise ValueError('%dx%d does not have the aspect ratio of %dx%d' % (w, h, img_w, img_h))
+    return max([(img_h, img_w)] + [(h, w) for w, h in resolutions])
+
+
+def scale_rig(rig, factor_h, factor_w):
+    return [Camera(**dict(camera.to_dict(), img_h=round(camera.img_h * factor_h), img_w=round(camera.img_w * factor_w)))
+            for camera in rig]
+
+
+def copy_shared_outputs(src_path, dst_path):
+    os.makedirs(dst_path, exist_ok=True)
+    for name in SHARED_OUTPUTS:
+        src, dst = os.path.join(src_path, name), os.path.join(dst_path, name)
+        if os.path.isdir(src):
+            shutil.copytree(src, dst, dirs_exist_ok=True)
+        elif os.path.exists(src):
+            shutil.copyfile(src, dst)
@@ -0,0 +1,87 @@
+import os
+
+import yaml
+
+MODALITIES = ['rgb', 'dep', 'isg', 'ofl']
+
+# keys of a camera in a rig file and in sample_info.yml, missing ones are taken from the params row
+CAMERA_KEYS = ['x', 'y', 'z', 'pitch', 'yaw', 'roll', 'fov', 'img_h', 'img_w']
+
+
+class Camera:
+    """
+    One camera of the rig attached to the ego vehicle. Its modalities are written to <sample>/<name>/<modality>,
+    the camera of the default rig has no name and writes to <sample>/<modality> like before.
+    """
+
+    def __init__(self, name, x, y, z, pitch, yaw, roll, fov, img_h, img_w, modalities=None):
+        self.name = name
+        self.x, self.y, self.z = float(x), float(y), float(z)
+        self.pitch, self.yaw, self.roll = float(pitch), float(yaw), float(roll)
+        self.fov = float(fov)
+        self.img_h, self.img_w = int(img_h), int(img_w)
+        self.modalities = list(MODALITIES if modalities is None else modalities)
+
+    def output_name(self, modality):
+        # name of the sensor in the sinks, the writers and the sensor buffer, e.g. 'rgb' or 'left/rgb'
+        return os.path.join(self.name, modality) if self.name else modality
+
+    def to_dict(self):
+        return {'name': self.name, **{key: getattr(self, key) for key in CAMERA_KEYS}, 'modalities': self.modalities}
+
+
+def default_rig(row):
+    return [Camera('', row['cam_x'], row['cam_y'], row['cam_z'], row['cam_pitch'], row['cam_yaw'], row['cam_roll'],
+                   row['fov'], row['img_h'], row['img_w'])]
+
+
+def load_rig(path, row):
+    """
+    Reads a rig file, e.g.
+
+        cameras:
+          - {name: front}
+          - {name: left, yaw: -90, modalities: [rgb, isg]}
+          - {name: rear, x: -2.0, yaw: 180, fov: 110, img_h: 256, img_w: 512, modalities: [rgb]}
+
+    Values that a camera does not set are taken from the camera columns of the params row.
+    """
+    with open(path, mode='r') as yml_file:
+        cameras = (yaml.safe_load(yml_file) or {}).get('cameras') or []
+    defaults = default_rig(row)[0].to_dict()
+
+    rig = []
+    for camera in cameras:
+        unknown = set(camera) - {'name', 'modalities', *CAMERA_KEYS}
+        if unknown:
+            raise ValueError('Unknown keys %s of a camera in %s' % (sorted(unknown), path))
+        rig.append(Camera(**dict(defaults, **camera)))
+    check_rig(rig, path)
+    return rig
+
+
+def check_rig(rig, source):
+    names = [camera.name for camera in rig]
+    if not rig:
+        raise ValueError('%s defines no cameras' % source)
+    if len(set(names)) != len(names):
+        raise ValueError('Camera names in %s are not unique: %s' % (source, names))
+    for camera in rig:
+        if len(rig) > 1 and not camera.name:
+            raise ValueError('Every camera of %s needs a name if there are several' % source)
+        if camera.name in MODALITIES or camera.name == 'actors' or os.sep in camera.name:
+            raise ValueError('%r in %s is not a valid camera name' % (camera.name, source))
+        if not camera.modalities or set(camera.modalities) - set(MODALITIES):
+            raise ValueError('Modalities %s of camera %r in %s must be a subset of %s' % (camera.modalities, camera.name, source, MODALITIES))
+
+
+def rig_outputs(rig):
+    """Output names of every camera sensor of the rig: 'rgb', ... for the default rig, 'left/rgb', ... otherwise."""
+    return [camera.output_name(modality) for camera in rig for modality in camera.modalities]
+
+
+def rig_from_info(info):
+    # rig of a generated sample, samples without _rig were generated with the default rig
+    if info.get('_rig'):
+        return [Camera(**camera) for camera in info['_rig']]
+    return default_rig(info)
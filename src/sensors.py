@@ -0,0 +1,96 @@
+import time
+import threading
+
+
+class SensorTimeout(RuntimeError):
+    def __init__(self, frame, missing):
+        super().__init__('No data of %s for frame %d' % (', '.join(missing), frame))
+        self.frame = frame
+        self.missing = missing
+
+
+class SensorBuffer:
+    """
+    Collects the data of several sensors keyed by frame, so waiting for all sensors of a frame is a single wait on
+    one condition variable.
+
+    Every sensor keeps at most `capacity` frames, the oldest ones get dropped. Data that arrives for a frame the
+    simulation already moved past is counted as late and discarded, a second delivery of a frame as duplicate.
+    """
+
+    def __init__(self, names, capacity=8):
+        self.names = list(names)
+        self.capacity = capacity
+        self._cond = threading.Condition()
+        self._frames = [{} for _ in self.names]  # per sensor: frame -> data
+        self._next_frame = None  # frames before it are not waited for anymore
+        self.dropped = dict.fromkeys(self.names, 0)
+        self.late = dict.fromkeys(self.names, 0)
+        self.duplicate = dict.fromkeys(self.names, 0)
+
+    def callback(self, name):
+        # for sensor.listen(), runs in the thread of the client library
+        index = self.names.index(name)
+        return lambda data: self._put(index, data)
+
+    def _put(self, index, data):
+        name = self.names[index]
+        with self._cond:
+            frames = self._frames[index]
+            if self._next_frame is not None and data.frame < self._next_frame:
+                self.late[name] += 1
+                return
+            if data.frame in frames:
+                self.duplicate[name] += 1
+                return
+            frames[data.frame] = data
+            while len(frames) > self.capacity:
+                del frames[min(frames)]
+                self.dropped[name] += 1
+            self._cond.notify_all()
+
+    def wait(self, frame, timeout, names=None):
+        """
+        Returns the data of the sensors for frame in the order of names, raises SensorTimeout. Only the given names
+        are waited for, the others get None.
+        """
+        deadline = time.monotonic() + timeout
+        wanted = [names is None or name in names for name in self.names]
+        with self._cond:
+            self._discard_before(frame)
+            while True:
+                missing = [name for name, frames, w in zip(self.names, self._frames, wanted) if w and frame not in frames]
+                if not missing:
+                    self._next_frame = frame + 1
+                    # data of the other sensors for frame is not needed, it does not count as dropped
+                    data = [frames.pop(frame, None) for frames in self._frames]
+                    return [d if w else None for d, w in zip(data, wanted)]
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise SensorTimeout(frame, missing)
+                self._cond.wait(remaining)
+
+    def skip(self, frame):
+        # gives up on frame, data still arriving for it counts as late
+        with self._cond:
+            self._discard_before(frame + 1)
+
+    def _discard_before(self, frame):
+        for name, frames in zip(self.names, self._frames):
+            old = [f for f in frames if f < frame]
+            for f in old:
+                del frames[f]
+            if self._next_frame is not None:
+                # frames before the first wait are from the setup ticks
+                self.dropped[name] += len(old)
+        self._next_frame = frame
+
+    def stats(self):
+        with self._cond:
+            return {
+                'dropped': sum(self.dropped.values()),
+                'late': sum(self.late.values()),
+                'duplicate': sum(self.duplicate.values()),
+                'per_sensor': {name: {'dropped': self.dropped[name], 'late': self.late[name], 'duplicate': self.duplicate[name]}
+                               for name in self.names},
+            }
@@ -0,0 +1,184 @@
+import io
+import os
+import json
+import tarfile
+
+import numpy as np
+
+from dataset import n_captures
+from writer import decode_depth, modality_of
+
+
+class FileSink:
+    """Writes one file per frame and modality: <sample>/<modality>/%08d.<ext>"""
+    direct = True  # writer processes can write the files themselves
+
+    def __init__(self, sample_path):
+        self.sample_path = sample_path
+
+    def path(self, name, frame, ext='png'):
+        return os.path.join(self.sample_path, name, '%08d.%s' % (frame, ext))
+
+    def expect(self, name, frame_index):
+        pass
+
+    def sync(self, n_frames):
+        pass
+
+    def write(self, name, frame_index, frame, payload, ext='png'):
+        path = self.path(name, frame, ext)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, mode='wb') as out_file:
+            out_file.write(payload)
+
+    def close(self):
+        pass
+
+
+class ShardSink:
+    """
+    Packs the frames of every modality into tar shards (WebDataset layout): <sample>/<modality>/%06d.tar holds the
+    frames with index [n * shard_size, (n + 1) * shard_size) as %08d.<ext> members. %06d.json next to it stores
+    frame, data offset and size of every member, so reading a frame needs one seek.
+
+    Shards are written as hidden .tmp files and renamed once all their frames arrived, index first.
+    """
+    direct = False
+
+    def __init__(self, sample_path, shard_size):
+        self.sample_path = sample_path
+        self.shard_size = shard_size
+        self._shards = {}  # (name, shard) -> _Shard
+        self._last_shard = {}  # name -> highest shard a frame was expected for
+
+    def expect(self, name, frame_index):
+        # called in frame order before the payload of the frame gets written
+        shard = frame_index // self.shard_size
+        self._get(name, shard).expected += 1
+        last = self._last_shard.get(name)
+        self._last_shard[name] = shard
+        if last is not None and last < shard:
+            self._finalize_done(name)
+
+    def write(self, name, frame_index, frame, payload, ext='png'):
+        shard = frame_index // self.shard_size
+        self._get(name, shard).add(frame, '%08d.%s' % (frame, ext), payload)
+        self._finalize_done(name)
+
+    def sync(self, n_frames):
+        # finalizes the complete shards of the frames [0, n_frames) for a checkpoint
+        for key in sorted(self._shards):
+            shard = self._shards[key]
+            if (key[1] + 1) * self.shard_size <= n_frames and shard.written == shard.expected:
+                self._shards.pop(key).finalize()
+
+    def close(self):
+        for key in sorted(self._shards):
+            self._shards.pop(key).finalize()
+
+    def _get(self, name, shard):
+        key = (name, shard)
+        if key not in self._shards:
+            self._shards[key] = _Shard(os.path.join(self.sample_path, name), shard)
+        return self._shards[key]
+
+    def _finalize_done(self, name):
+        # every shard before the current one is complete as soon as all expected frames were written
+        for key in sorted(self._shards):
+            shard = self._shards[key]
+            if key[0] == name and key[1] < self._last_shard[name] and shard.written == shard.expected:
+                self._shards.pop(key).finalize()
+
+
+class _Shard:
+    def __init__(self, path, shard):
+        os.makedirs(path, exist_ok=True)
+        self.tar_path = os.path.join(path, '%06d.tar' % shard)
+        self.index_path = os.path.join(path, '%06d.json' % shard)
+        self._tmp_path = os.path.join(path, '.%06d.tar.tmp' % shard)
+        self._tar = tarfile.open(self._tmp_path, mode='w', format=tarfile.USTAR_FORMAT)
+        self._index = []
+        self.expected = 0
+        self.written = 0
+
+    def add(self, frame, member_name, payload):
+        info = tarfile.TarInfo(member_name)
+        info.size = len(payload)
+        header_offset = self._tar.offset
+        self._tar.addfile(info, io.BytesIO(payload))
+        # ustar headers of short names are one block
+        self._index.append((frame, header_offset + tarfile.BLOCKSIZE, len(payload), member_name))
+        self.written += 1
+
+    def finalize(self):
+        self._tar.close()
+        self._index.sort()
+        index = {
+            'frames': [entry[0] for entry in self._index],
+            'offsets': [entry[1] for entry in self._index],
+            'sizes': [entry[2] for entry in self._index],
+            'names': [entry[3] for entry in self._index],
+        }
+        tmp_index_path = self.index_path + '.tmp'
+        with open(tmp_index_path, mode='w') as index_file:
+            json.dump(index, index_file)
+        os.replace(tmp_index_path, self.index_path)
+        os.replace(self._tmp_path, self.tar_path)
+
+
+class RawArrays:
+    """
+    Writes depth in metres and optical flow (u, v) of a sample into preallocated memory-mapped .npy files of shape
+    [frames, H, W, C] instead of PNGs: <sample>/[<camera>/]dep.npy and <sample>/[<camera>/]ofl.npy. Frame indices are
+    relative to the first recorded frame, frames that are never written stay zero. A modality captured every n-th frame
+    (periods) holds only these frames.
+    """
+
+    def __init__(self, sample_path, n_frames, rig, depth_dtype=None, flow=False, resume=False, periods=None):
+        self.depth_dtype = depth_dtype
+        self.arrays = {}
+        self.periods = {}
+        # a resumed sample keeps the frames written before
+        mode = 'r+' if resume else 'w+'
+        for camera in rig:
+            os.makedirs(os.path.join(sample_path, camera.name), exist_ok=True)
+            if depth_dtype is not None and 'dep' in camera.modalities:
+                name = camera.output_name('dep')
+                self.periods[name] = (periods or {}).get('dep', 1)
+                self.arrays[name] = self._open(os.path.join(sample_path, name + '.npy'), mode, depth_dtype,
+                                               (n_captures(n_frames, self.periods[name]), camera.img_h, camera.img_w, 1))
+            if flow and 'ofl' in camera.modalities:
+                name = camera.output_name('ofl')
+                self.periods[name] = (periods or {}).get('ofl', 1)
+                self.arrays[name] = self._open(os.path.join(sample_path, name + '.npy'), mode, np.float32,
+                                               (n_captures(n_frames, self.periods[name]), camera.img_h, camera.img_w, 2))
+
+    @staticmethod
+    def _open(path, mode, dtype, shape):
+        array = np.lib.format.open_memmap(path, mode=mode, dtype=dtype, shape=shape)
+        if array.shape != shape or array.dtype != dtype:
+            raise ValueError('%s has shape %s and dtype %s, expected %s and %s' % (path, array.shape, array.dtype, shape, np.dtype(dtype)))
+        return array
+
+    def handles(self, name):
+        return name in self.arrays
+
+    def write(self, name, frame_index, raw):
+        index = frame_index // self.periods[name]
+        if modality_of(name) == 'dep':
+            self.arrays[name][index, ..., 0] = decode_depth(raw, self.depth_dtype)
+        else:
+            self.arrays[name][index] = raw
+
+    def close(self):
+        for array in self.arrays.values():
+            array.flush()
+        self.arrays = {}
+
+
+def create_sink(backend, sample_path, shard_size=1000):
+    if backend == 'files':
+        return FileSink(sample_path)
+    if backend == 'shards':
+        return ShardSink(sample_path, shard_size)
+    raise ValueError('Unknown output backend %r' % backend)
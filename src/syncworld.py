@@ -2,13 +2,22 @@ import logging
 import carla
 import csv
 import os
-
-from queue import Queue
+import time
+import itertools
+import numpy as np
 
 from actors.Operator import Operator
-from actors.TrafficManager import TrafficManager
+from actors.TrafficManager import ACTIVE_DISTANCE, HYBRID_RADIUS, RESPAWN_LOWER_BOUND, TrafficManager
 from actors.Vehicle import Vehicle, get_random_vehicle_spawn_points
 from actors.Walker import Walker
+from assets import AssetCache, navigation_rng
+from geometry import rotation_vectors
+from rig import Camera
+from sensors import SensorBuffer, SensorTimeout
+from telemetry import StageTimer
+from sinks import FileSink
+from trajectory import STATE_COLUMNS
+from writer import modality_of
 
 WEATHER_PRESETS = {
     'Default': carla.WeatherParameters.Default,
@@ -29,8 +38,17 @@ WEATHER_PRESETS = {
 }
 
 
+def snapshot_values(s):
+    # rotation, location, velocity, acceleration and angular velocity of an actor snapshot, STATE_COLUMNS[9:]
+    tf = s.get_transform()
+    rot, loc = tf.rotation, tf.location
+    vel, acc, agv = s.get_velocity(), s.get_acceleration(), s.get_angular_velocity()
+    return (rot.pitch, rot.yaw, rot.roll, loc.x, loc.y, loc.z,
+            vel.x, vel.y, vel.z, acc.x, acc.y, acc.z, agv.x, agv.y, agv.z)
+
+
 class SyncWorld:
-    def __init__(self, client, dataset_path, map_name, seed, fps, img_h, img_w, fov, cam_transform, n_vehicles, n_walkers, weather_name, speed_diff, tm_port=8000):
+    def __init__(self, client, dataset_path, map_name, seed, fps, img_h, img_w, fov, cam_transform, n_vehicles, n_walkers, weather_name, speed_diff, tm_port=8000, writer=None):
         self.client = client
         self.map_name = map_name
         self.world = None
@@ -40,24 +58,57 @@ class SyncWorld:
         self.img_w = img_w
         self.fov = fov
         self.cam_transform = cam_transform
+        # cameras attached to the operator, the default rig is the single camera given here
+        loc, rot = cam_transform.location, cam_transform.rotation
+        self.rig = [Camera('', loc.x, loc.y, loc.z, rot.pitch, rot.yaw, rot.roll, fov, img_h, img_w)]
         self.tm = None
         self.tm_port = tm_port
+        self.hybrid_physics = False  # traffic manager options, see actors/TrafficManager.py
+        self.hybrid_radius = HYBRID_RADIUS
+        self.respawn_dormant = False
+        self.active_distance = ACTIVE_DISTANCE  # actors farther from the ego vehicle become dormant (large maps only)
         self.seed = seed
         self.dataset_path = dataset_path
         self.weather = WEATHER_PRESETS[weather_name]
         self.speed_diff = speed_diff
+        self.writer = writer
+        self.sink = FileSink(dataset_path)
+        self.raw_arrays = None  # sinks.RawArrays for depth and flow
+        self.outputs = []  # resolutions.ResolutionOutput of every resolution, if the cameras render at the largest one
+        self.resample = 'area'  # filter of rgb and depth if outputs are downscaled, 'area' or 'bilinear'
+        self.codecs = {}  # modality -> frame_codecs.Codec, PNG at the default level for the others
+        self.periods = {}  # modality or 'actors' -> frames between two captures, 1 for the others
+        self._stopped = set()  # cameras that do not listen until their next capture
+        self.timer = StageTimer()
+        self.assets = AssetCache(client)  # shared across samples by the client
 
         self.vehicles = []
         self.walkers = []
         self.op = None
-        self.meta_data = [[
+        self.meta_data_header = [
             'frame',
             'traffic_light',
             'speed_limit',
-            'speed'
-        ]]
-
-        self.queues = []
+            'speed',
+            'skipped'  # 1 if the camera frames of the tick are missing (missing_frames == 'skip'), the actors are kept
+        ]
+        self._frame_info = None  # frame_info.csv, written row by row
+        self.frame_offset = 0  # added to the frame ids of the server in all outputs, keeps the numbering of a resumed sample
+
+        self.sensors = None  # SensorBuffer of the cameras
+        self.sensor_capacity = 8  # frames buffered per camera
+        self.missing_frames = 'abort'  # 'retry', 'skip' or 'abort' the sample if a camera frame does not arrive
+        self.sensor_retries = 3
+        self.skipped_frames = 0
+        self.skipped_captures = {}  # camera -> frames skipped in which it was due
+
+        self.reuse_world = False  # reset instead of reload the world if the map is already loaded
+        self.world_reused = False
+        self.extraction = 'snapshot'  # 'snapshot' or 'actor'
+        self.actor_ids = []
+        self.actor_table = []
+        self.actor_boxes = None  # bounding box of every actor of the table, see AssetCache.bounding_boxes
+        self.actor_states = None
 
         self.running_factor = 0.5  # how many pedestrians will run
         self.standing_factor = 0.1  # how many pedestrians will stand
@@ -67,34 +118,97 @@ class SyncWorld:
         self._n_vehicles = n_vehicles
         self._n_walkers = n_walkers
 
-    def tick(self, timeout):
-        self.frame = self.world.tick()
+    def tick(self, timeout, frame_index=None):
+        # frame_index: index of a recorded frame, only the cameras due in it are waited for
+        with self.timer.measure('world_tick'):
+            self.frame = self.world.tick()
+        if frame_index == 0:
+            # the frame indices of the outputs count from here, even if the camera data of this frame is skipped
+            self.op.first_frame = self.frame + self.frame_offset
+        snapshot = self.world.get_snapshot()
         op = self.op.actor
         traffic_light = op.get_traffic_light().state if op.is_at_traffic_light() else 'None'
 
         meta_data = [
-            self.frame, traffic_light, op.get_speed_limit(), self.op.get_speed()
+            self.frame + self.frame_offset, traffic_light, op.get_speed_limit(), self.op.get_speed()
         ]
 
-        actor_data = [[
-            'id',
-            'type_id',
-            'attribs',
-            'fwd_x', 'fwd_y', 'fwd_z',
-            'rgt_x', 'rgt_y', 'rgt_z',
-            'upp_x', 'upp_y', 'upp_z',
-            'rot_p', 'rot_y', 'rot_r',
-            'loc_x', 'loc_y', 'loc_z',
-            'vel_x', 'vel_y', 'vel_z',
-            'acc_x', 'acc_y', 'acc_z',
-            'agv_x', 'agv_y', 'agv_z'
-        ]]
-
-        for actor in [self.op] + self.vehicles + self.walkers:
+        # the returned array is reused in the next tick
+        with self.timer.measure('extract_actors'):
+            self.read_actor_states(snapshot)
+
+        # None if the frame was skipped because of missing camera data, None for the cameras that were not due
+        with self.timer.measure('sensor_wait'):
+            due = None
+            if frame_index is not None and self.periods:
+                due = [cam_name for cam_name in self.sensors.names if self.is_due(modality_of(cam_name), frame_index)]
+            cam_data = self.retrieve_data(timeout, due)
+        meta_data.append(int(cam_data is None))
+        if frame_index is not None and self.periods:
+            self.update_listeners(frame_index + 1)
+
+        return meta_data, self.actor_states, cam_data, snapshot
+
+    def is_due(self, name, frame_index):
+        return frame_index % self.periods.get(name, 1) == 0
+
+    def update_listeners(self, frame_index):
+        # only the cameras due in the recorded frame frame_index listen while it is simulated, the others are not
+        # transferred (and not rendered by servers that skip sensors without listeners)
+        for cam_name, cam in zip(self.sensors.names, self.op.cams):
+            due = self.is_due(modality_of(cam_name), frame_index)
+            if due and cam_name in self._stopped:
+                cam.listen(self.sensors.callback(cam_name))
+                self._stopped.discard(cam_name)
+            elif not due and cam_name not in self._stopped:
+                cam.stop()
+                self._stopped.add(cam_name)
+
+    def fast_forward(self, n, callback=None):
+        """
+        Advances the simulation by n frames without rendering and without waiting for the cameras. The physics do
+        not depend on the rendering, so the following frames are the same as after n normal ticks.
+        """
+        target = self.world.get_snapshot().frame + n
+        for cam in self.op.cams:
+            cam.stop()
+        settings = self.world.get_settings()
+        settings.no_rendering_mode = True
+        self.world.apply_settings(settings)
+
+        def tick_until(frame):
+            while self.world.get_snapshot().frame < frame:
+                with self.timer.measure('world_tick'):
+                    self.frame = self.world.tick()
+                if callback is not None:
+                    callback()
+
+        # counted in frame ids since applying the settings may tick the world as well
+        tick_until(target - 1)
+        settings.no_rendering_mode = False
+        self.world.apply_settings(settings)
+        tick_until(target)
+        self.frame = self.world.get_snapshot().frame
+        if self.frame != target:
+            logging.warning('Fast forward overshot by %d frames' % (self.frame - target))
+
+        for cam_name, cam in zip(self.sensors.names, self.op.cams):
+            cam.listen(self.sensors.callback(cam_name))
+        self._stopped = set()
+        return self.frame
+
+    def get_actors(self):
+        return [self.op] + self.vehicles + self.walkers
+
+    def read_actor_states(self, snapshot):
+        if self.extraction == 'snapshot':
+            return self.extract_actor_states_snapshot(snapshot, self.actor_states)
+        return self.extract_actor_states(self.actor_states)
+
+    def extract_actor_states(self, out):
+        # one request per value and actor
+        for i, actor in enumerate(self.get_actors()):
             a = actor.actor
-            a_id = a.id
-            type_id = a.type_id
-            attribs = a.attributes
 
             tf = a.get_transform()
             fwd = tf.get_forward_vector()
@@ -106,34 +220,111 @@ class SyncWorld:
             acc = a.get_acceleration()
             agv = a.get_angular_velocity()
 
-            fwd = [fwd.x, fwd.y, fwd.z]
-            rgt = [rgt.x, rgt.y, rgt.z]
-            upp = [upp.x, upp.y, upp.z]
-            rot = [rot.pitch, rot.yaw, rot.roll]
-            loc = [loc.x, loc.y, loc.z]
-            vel = [vel.x, vel.y, vel.z]
-            acc = [acc.x, acc.y, acc.z]
-            agv = [agv.x, agv.y, agv.z]
-
-            actor_data.append([a_id, type_id, attribs, *fwd, *rgt, *upp, *rot, *loc, *vel, *acc, *agv])
-
-        cam_data = [self.retrieve_data(q, timeout) for q in self.queues]
-        assert all(x.frame == self.frame for x in cam_data)
-
-        return meta_data, actor_data, cam_data, self.world.get_snapshot()
-
-    def retrieve_data(self, sensor_queue, timeout):
-        while True:
-            data = sensor_queue.get(timeout=timeout)
-            if data.frame == self.frame:
-                return data
+            out[i] = [fwd.x, fwd.y, fwd.z,
+                      rgt.x, rgt.y, rgt.z,
+                      upp.x, upp.y, upp.z,
+                      rot.pitch, rot.yaw, rot.roll,
+                      loc.x, loc.y, loc.z,
+                      vel.x, vel.y, vel.z,
+                      acc.x, acc.y, acc.z,
+                      agv.x, agv.y, agv.z]
+        return out
+
+    def extract_actor_states_snapshot(self, snapshot, out):
+        # reads the states from the snapshot of the current frame in one pass in actor order, the vectors are computed
+        # for all actors at once
+        values = itertools.chain.from_iterable(map(snapshot_values, map(snapshot.find, self.actor_ids)))
+        out[:, 9:] = np.fromiter(values, dtype=out.dtype, count=len(self.actor_ids) * 15).reshape(-1, 15)
+        out[:, 0:3], out[:, 3:6], out[:, 6:9] = rotation_vectors(out[:, 9:12])
+        return out
+
+    def retrieve_data(self, timeout, names=None):
+        attempts = 1 + (self.sensor_retries if self.missing_frames == 'retry' else 0)
+        for attempt in range(attempts):
+            try:
+                return self.sensors.wait(self.frame, timeout, names)
+            except SensorTimeout as e:
+                error = e
+                if attempt + 1 < attempts:
+                    logging.warning('%s, waiting again (%d/%d)' % (e, attempt + 1, self.sensor_retries))
+
+        if self.missing_frames == 'skip':
+            logging.warning('%s, skipping the frame' % error)
+            self.sensors.skip(self.frame)
+            self.skipped_frames += 1
+            for cam_name in names or self.sensors.names:
+                self.skipped_captures[cam_name] = self.skipped_captures.get(cam_name, 0) + 1
+            return None
+        logging.error('%s, aborting the sample (sensor stats: %s)' % (error, self.sensors.stats()))
+        raise error
+
+    def open_frame_info(self, size=None):
+        # size: length in bytes of the rows written before, the rest is cut off
+        path = os.path.join(self.dataset_path, 'frame_info.csv')
+        if size is None:
+            self._frame_info = open(path, mode='w', newline='')
+            csv.writer(self._frame_info, delimiter=',').writerow(self.meta_data_header)
+        else:
+            self._frame_info = open(path, mode='r+', newline='')
+            self._frame_info.truncate(size)
+            self._frame_info.seek(size)
+        self._frame_info_writer = csv.writer(self._frame_info, delimiter=',')
+
+    def write_frame_info(self, meta_data):
+        if self._frame_info is None:
+            self.open_frame_info()
+        self._frame_info_writer.writerow(meta_data)
+
+    def flush_frame_info(self):
+        # returns the size of frame_info.csv
+        if self._frame_info is None:
+            self.open_frame_info()
+        self._frame_info.flush()
+        return self._frame_info.tell()
 
     def load_world(self):
-        self.world = self.client.load_world(self.map_name, reset_settings=False)
+        world = self.client.get_world()
+        if self.reuse_world and world.get_map().name.split('/')[-1] == self.map_name:
+            logging.info('Reusing already loaded %s' % self.map_name)
+            self.world = world
+            self.reset_world()
+            self.world_reused = True
+        else:
+            self.world = self.client.load_world(self.map_name, reset_settings=False)
+            self.world_reused = False
+        settings = self.world.get_settings()
+        if settings.actor_active_distance != self.active_distance:
+            settings.actor_active_distance = self.active_distance
+            self.world.apply_settings(settings)
         self.tm = TrafficManager(self)
 
         self.world.set_pedestrians_cross_factor(self.crossing_factor)
 
+    @property
+    def needs_hero(self):
+        # hybrid physics, respawning and dormant actors are centred on the vehicle with role_name hero
+        return self.hybrid_physics or self.respawn_dormant or self.active_distance != ACTIVE_DISTANCE
+
+    def traffic_settings(self):
+        # the traffic options of the sample, the active distance as the server applied it
+        return {
+            'hybrid_physics': self.hybrid_physics,
+            'hybrid_radius': self.hybrid_radius if self.hybrid_physics else None,
+            'respawn_dormant': self.respawn_dormant,
+            'respawn_bounds': [RESPAWN_LOWER_BOUND, self.active_distance] if self.respawn_dormant else None,
+            'actor_active_distance': float(self.world.get_settings().actor_active_distance),
+            'hero': self.needs_hero,
+        }
+
+    def reset_world(self):
+        # cheaper alternative to load_world if the map stays the same, the traffic manager gets reseeded afterwards
+        actors = [a for a in self.world.get_actors() if a.type_id.split('.')[0] in ('vehicle', 'walker', 'controller', 'sensor')]
+        if actors:
+            logging.warning('Destroying %d actors left over from a previous sample' % len(actors))
+            self.client.apply_batch_sync([carla.command.DestroyActor(a.id) for a in actors], True)
+        self.world.reset_all_traffic_lights()
+        self.world.tick()
+
     def spawn_op(self, spawn_point):
         self.op = Operator(self, spawn_point)
         spawn_cmd = self.op.get_spawn_cmd()
@@ -144,21 +335,24 @@ class SyncWorld:
         else:
             self.op.actor = self.world.get_actor(response.actor_id)
 
+        # the sensors of all cameras of the rig in one batch
         spawn_cam_cmds = self.op.get_spawn_cam_cmds()
         responses = self.client.apply_batch_sync(spawn_cam_cmds, True)
 
-        def make_queue(register_event):
-            q = Queue()
-            register_event(q.put)
-            self.queues.append(q)
-
-        for response in responses:
+        cam_names, cam_cc = [], []
+        for cam_name, cc, response in zip(self.op.cam_names, self.op._cam_cc, responses):
             if response.error:
-                logging.error(response.error + " (operator)")
+                logging.error(response.error + " (operator %s)" % cam_name)
             else:
-                cam = self.world.get_actor(response.actor_id)
-                self.op.cams.append(cam)
-                make_queue(cam.listen)
+                self.op.cams.append(self.world.get_actor(response.actor_id))
+                cam_names.append(cam_name)
+                cam_cc.append(cc)
+        # the sensor data arrives in the order of the spawned cameras
+        self.op.cam_names, self.op._cam_cc = cam_names, cam_cc
+
+        self.sensors = SensorBuffer(cam_names, self.sensor_capacity)
+        for cam_name, cam in zip(cam_names, self.op.cams):
+            cam.listen(self.sensors.callback(cam_name))
 
     def spawn_vehicles(self, spawn_points):
         temp_vehicles = [Vehicle(self, spawn_point) for spawn_point in spawn_points]
@@ -171,9 +365,13 @@ class SyncWorld:
                 self.vehicles.append(vehicle)
 
     def spawn_walkers(self):
-        # spawn walker actors
-        spawn_points = [carla.Transform(self.world.get_random_location_from_navigation()) for _ in range(self._n_walkers)]
-        temp_walkers = [Walker(self, spawn_point) for spawn_point in spawn_points]
+        # spawn walker actors, spawn points and destinations come from the cached navigation locations of the map
+        locations = self.assets.navigation_points(self.world, self.map_name, 2 * self._n_walkers)
+        self.world.set_pedestrians_seed(self.seed)
+        rng = navigation_rng(self.seed)
+        spawn_points = [carla.Transform(location) for location in rng.sample(locations, self._n_walkers)]
+        destinations = [rng.choice(locations) for _ in range(self._n_walkers)]
+        temp_walkers = [Walker(self, spawn_point, destination) for spawn_point, destination in zip(spawn_points, destinations)]
         spawn_cmds = [walker.get_spawn_cmd() for walker in temp_walkers]
         responses = self.client.apply_batch_sync(spawn_cmds, True)
 
@@ -195,42 +393,73 @@ class SyncWorld:
                 walker.controller = self.world.get_actor(response.actor_id)
                 self.walkers.append(walker)
 
-        # start walkers
-        for walker in self.walkers:
-            walker.start()
+        self.start_walkers()
+
+    def start_walkers(self):
+        # the client library has no batch commands for the walker controllers. start() adds a walker to the navigation
+        # of the client and turns off its physics and collisions on the server, the only round trips of the setup,
+        # the targets and speeds are then set in the client's navigation in one pass over all walkers
+        with self.timer.measure('start_walkers'):
+            for walker in self.walkers:
+                walker.controller.start()
+            for walker in self.walkers:
+                walker.controller.go_to_location(walker.destination)
+                walker.controller.set_max_speed(float(walker.speed))
 
     def __enter__(self):
-        self.load_world()
-        spawn_points = get_random_vehicle_spawn_points(self.world, self._n_vehicles)
-        self.spawn_op(spawn_points[0])
-        self.world.tick()
-        self.spawn_vehicles(spawn_points[1:])
-        self.world.tick()
-        for vehicle in [*self.vehicles, self.op]:
-            self.tm.tm.update_vehicle_lights(vehicle.actor, True)
-        self.spawn_walkers()
+        start = time.perf_counter()
+        with self.timer.measure('load_world'):
+            self.load_world()
+        spawn_points = get_random_vehicle_spawn_points(self.assets.spawn_points(self.world, self.map_name), self._n_vehicles)
+        with self.timer.measure('spawn_op'):
+            self.spawn_op(spawn_points[0])
+            self.world.tick()
+        with self.timer.measure('spawn_vehicles'):
+            self.spawn_vehicles(spawn_points[1:])
+            self.world.tick()
+            for vehicle in [*self.vehicles, self.op]:
+                self.tm.tm.update_vehicle_lights(vehicle.actor, True)
+        with self.timer.measure('spawn_walkers'):
+            self.spawn_walkers()
         self.world.set_weather(self.weather)
+
+        actors = [actor.actor for actor in self.get_actors()]
+        self.actor_ids = [a.id for a in actors]
+        self.actor_table = [(a.id, a.type_id, a.attributes) for a in actors]
+        self.actor_boxes = self.assets.bounding_boxes(actors)
+        self.actor_states = np.empty((len(actors), len(STATE_COLUMNS)), dtype=np.float32)
         logging.info('Spawned %d vehicles and %d walkers, press Ctrl+C to exit.' % (len(self.vehicles), len(self.walkers)))
+        self.timer.add('setup', time.perf_counter() - start)
 
         return self
 
     def __exit__(self, *args, **kwargs):
-        # destroy vehicles
-        logging.info('Destroying %d vehicles' % len(self.vehicles))
-        for vehicle in self.vehicles:
-            vehicle.stop()
-
-        # destroy walkers
-        logging.info('Destroying %d walkers' % len(self.walkers))
+        start = time.perf_counter()
+        # the walker controllers can only be stopped one by one, everything else is destroyed in one batch
         for walker in self.walkers:
-            walker.stop()
+            walker.controller.stop()
+        logging.info('Destroying %d vehicles and %d walkers' % (len(self.vehicles), len(self.walkers)))
+        actors = [w.controller for w in self.walkers] + [w.actor for w in self.walkers] + [v.actor for v in self.vehicles]
+        self.client.apply_batch_sync([carla.command.DestroyActor(a.id) for a in actors], False)
 
         # destroy operator
         logging.info('Destroying op with cams')
         self.op.stop()
 
-        logging.info('Writing metadata')
-        # write meta_data to csv
-        with open(os.path.join(self.dataset_path, 'frame_info.csv'), mode='w') as csv_file:
-            csv_writer = csv.writer(csv_file, delimiter=',')
-            csv_writer.writerows(self.meta_data)
+        self.timer.add('teardown', time.perf_counter() - start)
+
+        if self.writer is not None:
+            logging.info('Waiting for writers to finish')
+            with self.timer.measure('writer_flush'):
+                self.writer.flush()
+        self.sink.close()
+        if self.raw_arrays is not None:
+            self.raw_arrays.close()
+        for output in self.outputs:
+            if output.sink is not self.sink:
+                output.close()
+
+        if self._frame_info is None:
+            self.open_frame_info()
+        self._frame_info.close()
+        self._frame_info = None
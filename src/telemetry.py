@@ -0,0 +1,152 @@
+import os
+import time
+import bisect
+from contextlib import contextmanager
+
+# upper bounds of the histogram buckets in seconds, 10 per decade from 1us to 1000s
+BUCKETS = [10 ** (e / 10) for e in range(-60, 31)]
+
+
+class StageTimer:
+    """
+    Collects the durations of the stages of a sample in fixed log-spaced histograms.
+
+    Adding a duration costs one bisect, so the timer can stay enabled in the hot path. Percentiles are
+    reported as the upper bound of the bucket they fall into (at most 26% too high).
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self._counts = {}
+        self._totals = {}
+        self._max = {}
+
+    def add(self, stage, seconds):
+        counts = self._counts.get(stage)
+        if counts is None:
+            counts = self._counts[stage] = [0] * (len(BUCKETS) + 1)
+            self._totals[stage] = 0.0
+            self._max[stage] = 0.0
+        counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self._totals[stage] += seconds
+        if seconds > self._max[stage]:
+            self._max[stage] = seconds
+
+    @contextmanager
+    def measure(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start)
+
+    def percentile(self, stage, q):
+        counts = self._counts[stage]
+        rank = q / 100 * sum(counts)
+        cumulative = 0
+        for i, count in enumerate(counts):
+            cumulative += count
+            if cumulative >= rank and count:
+                return min(BUCKETS[i] if i < len(BUCKETS) else self._max[stage], self._max[stage])
+        return self._max[stage]
+
+    def summary(self):
+        return {stage: {
+            'count': sum(counts),
+            'total_s': round(self._totals[stage], 3),
+            'p50_ms': round(self.percentile(stage, 50) * 1000, 3),
+            'p95_ms': round(self.percentile(stage, 95) * 1000, 3),
+            'max_ms': round(self._max[stage] * 1000, 3),
+        } for stage, counts in sorted(self._counts.items())}
+
+
+class RunStatus:
+    """
+    Keeps a Prometheus textfile (https://github.com/prometheus/node_exporter#textfile-collector) with the progress
+    of a run up to date. The file is replaced atomically at most every `interval` seconds.
+    """
+
+    def __init__(self, path, samples_total, ticks_total, worker='', interval=5.0):
+        self.path = path
+        self.samples_total = samples_total
+        self.samples_done = 0
+        self.samples_skipped = 0
+        self.samples_stuck = 0
+        self.saved_sim_seconds = 0.0
+        self.ticks_total = ticks_total
+        self.ticks_done = 0
+        self.worker = worker
+        self.interval = interval
+        self.timer = None
+        self._start = time.time()
+        self._last_write = 0.0
+        self._window = (self._start, 0)
+        self._fps = 0.0
+
+    def sample_done(self, ticks, skipped=False):
+        self.samples_done += 1
+        if skipped:
+            self.samples_skipped += 1
+            self.ticks_total -= ticks  # skipped samples do not count for the throughput
+        self.update(force=True)
+
+    def sample_stuck(self, saved_sim_seconds):
+        self.samples_stuck += 1
+        self.saved_sim_seconds += saved_sim_seconds
+
+    def tick(self):
+        self.ticks_done += 1
+        self.update()
+
+    def update(self, force=False):
+        now = time.time()
+        if not force and now - self._last_write < self.interval:
+            return
+
+        window_start, window_ticks = self._window
+        if now > window_start:
+            self._fps = (self.ticks_done - window_ticks) / (now - window_start)
+        self._window = (now, self.ticks_done)
+        self._last_write = now
+        self.write(now)
+
+    def write(self, now):
+        ticks_per_s = self.ticks_done / max(now - self._start, 1e-9)
+        eta = (self.ticks_total - self.ticks_done) / ticks_per_s if ticks_per_s > 0 else -1
+        labels = '{worker="%s"}' % self.worker
+        lines = [
+            '# HELP carla_generator_frames_per_second Simulated frames per second since the last update.',
+            '# TYPE carla_generator_frames_per_second gauge',
+            'carla_generator_frames_per_second%s %f' % (labels, self._fps),
+            '# HELP carla_generator_samples_done Samples finished or skipped by this worker.',
+            '# TYPE carla_generator_samples_done gauge',
+            'carla_generator_samples_done%s %d' % (labels, self.samples_done),
+            'carla_generator_samples_skipped%s %d' % (labels, self.samples_skipped),
+            'carla_generator_samples_total%s %d' % (labels, self.samples_total),
+            '# HELP carla_generator_stuck_samples Samples whose ego vehicle got stuck, aborted or generated again.',
+            '# TYPE carla_generator_stuck_samples gauge',
+            'carla_generator_stuck_samples%s %d' % (labels, self.samples_stuck),
+            '# HELP carla_generator_saved_sim_seconds Simulation time not spent on the rest of stuck samples.',
+            '# TYPE carla_generator_saved_sim_seconds gauge',
+            'carla_generator_saved_sim_seconds%s %f' % (labels, self.saved_sim_seconds),
+            '# HELP carla_generator_eta_seconds Estimated time until all samples of the params file are done.',
+            '# TYPE carla_generator_eta_seconds gauge',
+            'carla_generator_eta_seconds%s %f' % (labels, eta),
+            'carla_generator_ticks_done%s %d' % (labels, self.ticks_done),
+            'carla_generator_ticks_total%s %d' % (labels, self.ticks_total),
+            'carla_generator_last_update_timestamp_seconds%s %f' % (labels, now),
+        ]
+        if self.timer is not None:
+            lines.append('# HELP carla_generator_stage_seconds Duration of the stages of the current sample.')
+            lines.append('# TYPE carla_generator_stage_seconds gauge')
+            for stage, stats in self.timer.summary().items():
+                for q in ['p50', 'p95', 'max']:
+                    lines.append('carla_generator_stage_seconds{worker="%s",stage="%s",quantile="%s"} %f' % (
+                        self.worker, stage, q, stats[q + '_ms'] / 1000))
+
+        tmp_path = '%s.%d.tmp' % (self.path, os.getpid())
+        with open(tmp_path, mode='w') as prom_file:
+            prom_file.write('\n'.join(lines) + '\n')
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,178 @@
+import os
+import csv
+import json
+import struct
+import argparse
+
+import numpy as np
+
+MAGIC = b'CDGTRAJ1'
+ALIGNMENT = 64
+
+STATIC_COLUMNS = ['id', 'type_id', 'attribs']
+STATE_COLUMNS = [
+    'fwd_x', 'fwd_y', 'fwd_z',
+    'rgt_x', 'rgt_y', 'rgt_z',
+    'upp_x', 'upp_y', 'upp_z',
+    'rot_p', 'rot_y', 'rot_r',
+    'loc_x', 'loc_y', 'loc_z',
+    'vel_x', 'vel_y', 'vel_z',
+    'acc_x', 'acc_y', 'acc_z',
+    'agv_x', 'agv_y', 'agv_z'
+]
+
+
+class TrajectoryWriter:
+    """
+    Writes the actor states of one sample into a single file.
+
+    Layout: MAGIC, uint64 header length, JSON header (static actor table with the bounding boxes, first frame, frame
+    step), padding to ALIGNMENT bytes and then float32 data of shape [frame, actor, len(STATE_COLUMNS)], appended
+    frame by frame.
+    """
+
+    def __init__(self, path, actors, frame_step=1, boxes=None):
+        self.path = path
+        self.actors = [{'id': int(a_id), 'type_id': type_id, 'attribs': dict(attribs)} for a_id, type_id, attribs in actors]
+        if boxes is not None:
+            # center (x, y, z) and extent (x, y, z) relative to the actor
+            for actor, box in zip(self.actors, boxes):
+                actor['bbox'] = [float(x) for x in box]
+        self.frame_step = frame_step
+        self.n_frames = 0
+        self._next_frame = None
+        self._file = None
+
+    def append(self, frame, states):
+        states = np.ascontiguousarray(states, dtype='<f4')
+        if states.shape != (len(self.actors), len(STATE_COLUMNS)):
+            raise ValueError('Expected actor states of shape %s, got %s' % ((len(self.actors), len(STATE_COLUMNS)), states.shape))
+
+        if self._file is None:
+            self._open(frame)
+        elif frame != self._next_frame:
+            raise ValueError('Expected frame %d, got %d' % (self._next_frame, frame))
+
+        self._file.write(states.tobytes())
+        self.n_frames += 1
+        self._next_frame = frame + self.frame_step
+
+    def resume(self, n_frames):
+        """Continues an existing file after its first n_frames frames, later frames are cut off."""
+        reader = TrajectoryReader(self.path)
+        if len(reader.actors) != len(self.actors):
+            raise ValueError('%s has %d actors, expected %d' % (self.path, len(reader.actors), len(self.actors)))
+        if reader.n_frames < n_frames:
+            raise ValueError('%s has %d frames, expected at least %d' % (self.path, reader.n_frames, n_frames))
+
+        self._file = open(self.path, mode='r+b')
+        self._file.truncate(reader.offset + n_frames * reader.frame_size)
+        self._file.seek(0, os.SEEK_END)
+        self.frame_step = reader.frame_step
+        self.n_frames = n_frames
+        self._next_frame = reader.frame_start + n_frames * reader.frame_step
+
+    def flush(self):
+        if self._file is not None:
+            self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _open(self, frame_start):
+        header = json.dumps({
+            'columns': STATE_COLUMNS,
+            'actors': self.actors,
+            'frame_start': frame_start,
+            'frame_step': self.frame_step,
+            'dtype': '<f4',
+        }).encode('utf-8')
+        header += b' ' * (-(len(MAGIC) + 8 + len(header)) % ALIGNMENT)
+
+        self._file = open(self.path, mode='wb')
+        self._file.write(MAGIC + struct.pack('<Q', len(header)) + header)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args, **kwargs):
+        self.close()
+
+
+class TrajectoryReader:
+    def __init__(self, path):
+        self.path = path
+        with open(path, mode='rb') as traj_file:
+            if traj_file.read(len(MAGIC)) != MAGIC:
+                raise ValueError('%s is not a trajectory file' % path)
+            header_len, = struct.unpack('<Q', traj_file.read(8))
+            header = json.loads(traj_file.read(header_len).decode('utf-8'))
+
+        self.columns = header['columns']
+        self.actors = header['actors']
+        self.frame_start = header['frame_start']
+        self.frame_step = header['frame_step']
+        self.actor_ids = np.array([actor['id'] for actor in self.actors], dtype=np.int64)
+        self._actor_index = {a_id: i for i, a_id in enumerate(self.actor_ids.tolist())}
+        # [actors, 6] center and extent of the bounding boxes, None for files written without them
+        self.boxes = np.array([actor['bbox'] for actor in self.actors], dtype=np.float32).reshape(len(self.actors), 6) \
+            if all('bbox' in actor for actor in self.actors) else None
+
+        self.offset = offset = len(MAGIC) + 8 + header_len
+        self.frame_size = frame_size = len(self.actors) * len(self.columns) * 4
+        # a partially written last frame is ignored
+        self.n_frames = (os.path.getsize(path) - offset) // frame_size if frame_size else 0
+        self.data = np.memmap(path, dtype=header['dtype'], mode='r', offset=offset,
+                              shape=(self.n_frames, len(self.actors), len(self.columns))) if self.n_frames else \
+            np.zeros((0, len(self.actors), len(self.columns)), dtype=header['dtype'])
+
+    @property
+    def frames(self):
+        return self.frame_start + self.frame_step * np.arange(self.n_frames)
+
+    def frame_index(self, frame):
+        index, rest = divmod(frame - self.frame_start, self.frame_step)
+        if rest or not 0 <= index < self.n_frames:
+            raise KeyError('Frame %d is not part of %s' % (frame, self.path))
+        return index
+
+    def read(self, start_frame=None, end_frame=None, actor_ids=None):
+        """
+        Returns the states of the frames in [start_frame, end_frame) as a memory-mapped view of shape
+        [frame, actor, column]. Only the requested pages are read from disk.
+        """
+        start = 0 if start_frame is None else max(0, -(-(start_frame - self.frame_start) // self.frame_step))
+        end = self.n_frames if end_frame is None else min(self.n_frames, max(0, -(-(end_frame - self.frame_start) // self.frame_step)))
+        data = self.data[start:end]
+
+        if actor_ids is not None:
+            data = data[:, [self._actor_index[int(a_id)] for a_id in actor_ids]]
+        return data
+
+    def export_csv(self, path):
+        """Writes the states in the former one CSV per frame layout."""
+        os.makedirs(path, exist_ok=True)
+        header = STATIC_COLUMNS + self.columns
+        static = [[actor['id'], actor['type_id'], actor['attribs']] for actor in self.actors]
+        for frame, states in zip(self.frames.tolist(), self.data):
+            with open(os.path.join(path, '%08d.csv' % frame), mode='w') as csv_file:
+                csv_writer = csv.writer(csv_file, delimiter=',')
+                csv_writer.writerow(header)
+                csv_writer.writerows(row + values for row, values in zip(static, states.tolist()))
+
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser(description='Converts the actors.traj file of a sample to one CSV per frame')
+    argparser.add_argument('sample_path', nargs='+', help='sample folder(s) that contain an actors.traj file')
+    argparser.add_argument(
+        '-o', '--output',
+        metavar='O',
+        default='actors',
+        type=str,
+        help='name of the CSV folder inside the sample folder (default: actors)')
+    args = argparser.parse_args()
+
+    for sample_path in args.sample_path:
+        TrajectoryReader(os.path.join(sample_path, 'actors.traj')).export_csv(os.path.join(sample_path, args.output))
@@ -0,0 +1,293 @@
+import os
+import time
+import queue
+import logging
+import multiprocessing as mp
+from multiprocessing import shared_memory
+
+import numpy as np
+from PIL import Image
+
+from frame_codecs import PngCodec
+
+
+def modality_of(cam_name):
+    # sensors of named rig cameras are called '<camera>/<modality>'
+    return cam_name.rsplit('/', 1)[-1]
+
+
+def sensor_array(cam_name, data):
+    # zero-copy view of the raw sensor buffer
+    if modality_of(cam_name) == 'ofl':
+        return np.frombuffer(data.raw_data, dtype=np.dtype('float32')).reshape((data.height, data.width, 2))
+    return np.frombuffer(data.raw_data, dtype=np.dtype('uint8')).reshape((data.height, data.width, 4))
+
+
+# numpy port of carla.ColorConverter.Depth
+# https://github.com/carla-simulator/carla/blob/0.9.13/LibCarla/source/carla/image/ColorConverter.h#L28-L42
+def depth_to_gray(raw):
+    bgra = raw.astype(np.float32)
+    depth = bgra[..., 2] + bgra[..., 1] * 256 + bgra[..., 0] * (256 * 256)
+    normalized = depth / np.float32(256 * 256 * 256 - 1)
+    gray = (np.float32(255.0) * normalized).astype(np.uint8)
+    return np.repeat(gray[..., None], 3, axis=2)
+
+
+# https://carla.readthedocs.io/en/0.9.13/ref_sensors/#depth-camera
+def decode_depth(raw, dtype=np.float32):
+    # depth in metres, the camera encodes 0 to 1000m in the 24 bits of the R, G and B channels
+    bgra = raw.astype(np.float32)
+    normalized = (bgra[..., 2] + bgra[..., 1] * 256 + bgra[..., 0] * (256 * 256)) / np.float32(256 * 256 * 256 - 1)
+    return (normalized * np.float32(1000.0)).astype(dtype)
+
+
+# numpy port of carla.OpticalFlowImage.get_color_coded_flow
+# https://github.com/carla-simulator/carla/blob/0.9.13/PythonAPI/carla/source/libcarla/SensorData.cpp
+def flow_to_color(raw):
+    vx = raw[..., 0].astype(np.float32)
+    vy = raw[..., 1].astype(np.float32)
+
+    angle = np.float32(180.0) + np.arctan2(vy, vx) * np.float32(360.0 / (2.0 * 3.1415))
+    angle = np.where(angle < 0, angle + np.float32(360.0), angle)
+    angle = np.fmod(angle, np.float32(360.0))
+
+    norm = np.sqrt(vx * vx + vy * vy)
+    a = np.float32(1.0) / np.log(np.float32(0.1 + 0.999))
+    v = np.clip(a * np.log(norm + np.float32(0.999)), 0.0, 1.0).astype(np.float32)
+
+    h_60 = angle * np.float32(1.0 / 60.0)
+    c = v
+    x = c * (np.float32(1.0) - np.abs(np.fmod(h_60, np.float32(2.0)) - np.float32(1.0)))
+    m = v - c
+    zero = np.zeros_like(v)
+    one = np.ones_like(v)
+
+    case = h_60.astype(np.uint32)
+    cases = [case == i for i in range(6)]
+    r = np.select(cases, [c, x, zero, zero, x, c], one)
+    g = np.select(cases, [x, c, c, x, zero, zero], one)
+    b = np.select(cases, [zero, zero, x, c, c, x], one)
+
+    rgb = np.stack([r + m, g + m, b + m], axis=-1) * np.float32(255.0)
+    return rgb.astype(np.uint8)
+
+
+def resize_frame(cam_name, raw, img_h, img_w, resample='area'):
+    """
+    Downscales a raw sensor buffer. RGB and depth are filtered (area or bilinear), segmentation and flow are sampled
+    nearest neighbour, so instance colors stay valid. The flow is stored relative to the image size, see
+    https://carla.readthedocs.io/en/0.9.13/ref_sensors/#optical-flow-camera, so the sampled vectors are already scaled
+    to the new resolution.
+    """
+    if raw.shape[:2] == (img_h, img_w):
+        return raw
+    name = modality_of(cam_name)
+    if name in ('isg', 'ofl'):
+        rows = ((np.arange(img_h) + 0.5) * (raw.shape[0] / img_h)).astype(np.intp)
+        cols = ((np.arange(img_w) + 0.5) * (raw.shape[1] / img_w)).astype(np.intp)
+        return raw[rows[:, None], cols]
+
+    resample = Image.BOX if resample == 'area' else Image.BILINEAR
+    if name == 'dep':
+        # the 24 bit depth code gets filtered as a number and encoded again
+        code = raw[..., 2].astype(np.uint32) + (raw[..., 1].astype(np.uint32) << 8) + (raw[..., 0].astype(np.uint32) << 16)
+        code = Image.fromarray(code.astype(np.float32), mode='F').resize((img_w, img_h), resample)
+        code = np.rint(np.asarray(code)).astype(np.uint32)
+        out = np.empty((img_h, img_w, 4), dtype=np.uint8)
+        out[..., 0], out[..., 1], out[..., 2], out[..., 3] = code >> 16, (code >> 8) & 255, code & 255, 255
+        return out
+    # BGRA, the channels are filtered independently
+    return np.asarray(Image.fromarray(np.ascontiguousarray(raw), mode='RGBA').resize((img_w, img_h), resample))
+
+
+def frame_image(cam_name, raw):
+    # the (H, W, 3) RGB image of a raw sensor buffer that the codecs encode
+    if modality_of(cam_name) == 'dep':
+        return depth_to_gray(raw)
+    elif modality_of(cam_name) == 'ofl':
+        return flow_to_color(raw)
+    return np.ascontiguousarray(raw[..., 2::-1])  # BGRA2RGB
+
+
+def encode_frame(cam_name, raw, codec=None):
+    # codec: frame_codecs.Codec, PNG at the default level if None. That default PNG is the file the inline writer saves,
+    # byte for byte: depth is the RGBA image of carla.Image.save_to_disk with ColorConverter.Depth
+    if codec is None and modality_of(cam_name) == 'dep':
+        gray = depth_to_gray(raw)
+        return PngCodec().encode(np.dstack([gray, np.full(gray.shape[:2], 255, dtype=np.uint8)]))
+    return (codec or PngCodec()).encode(frame_image(cam_name, raw))
+
+
+def _encoder_loop(task_queue, done_queue):
+    segments = {}
+    generation = None
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+
+        slot, task_generation, shm_name, cam_name, shape, dtype, path, resize, codec = task
+        if task_generation != generation:
+            # slots were reallocated, drop mappings of the old ones
+            for shm in segments.values():
+                shm.close()
+            segments = {}
+            generation = task_generation
+        if shm_name not in segments:
+            segments[shm_name] = shared_memory.SharedMemory(name=shm_name)
+
+        start = time.perf_counter()
+        error = None
+        payload = None
+        try:
+            raw = np.ndarray(shape, dtype=dtype, buffer=segments[shm_name].buf)
+            if resize is not None:
+                raw = resize_frame(cam_name, raw, *resize)
+            payload = encode_frame(cam_name, raw, codec)
+            del raw
+            if path is not None:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, mode='wb') as out_file:
+                    out_file.write(payload)
+                payload = None
+        except Exception as e:
+            error = '%s %s: %r' % (cam_name, path, e)
+        # without a path the payload goes back to the main process, e.g. to be packed into shards
+        done_queue.put((slot, cam_name, time.perf_counter() - start, error, payload))
+
+    for shm in segments.values():
+        shm.close()
+
+
+class AsyncFrameWriter:
+    """
+    Encodes and saves camera frames in a pool of worker processes.
+
+    Raw sensor buffers are copied once into a fixed ring of shared memory slots. submit() blocks while all
+    slots are in use, so a slow disk slows down the simulation instead of filling up the memory.
+    """
+
+    def __init__(self, n_workers, n_slots=None):
+        self.n_workers = n_workers
+        self.n_slots = n_slots or 4 * n_workers
+        self._ctx = mp.get_context('spawn')
+        self._task_queue = self._ctx.Queue()
+        self._done_queue = self._ctx.Queue()
+        self._workers = [self._ctx.Process(target=_encoder_loop, args=(self._task_queue, self._done_queue), daemon=True)
+                         for _ in range(n_workers)]
+        for worker in self._workers:
+            worker.start()
+
+        self._slots = []
+        self._slot_size = 0
+        self._generation = 0
+        self._free = []
+        self._pending = {}
+        self._errors = []
+        self.reset_stats()
+
+    def reset_stats(self, timer=None):
+        # the encode latencies of every modality get added to timer
+        self.timer = timer
+        self._latencies = []
+        self._depths = []
+        self._blocked = 0.0
+
+    def stats(self):
+        stats = {
+            'writers': self.n_workers,
+            'slots': self.n_slots,
+            'frames': len(self._latencies),
+            'blocked_s': round(self._blocked, 3),
+        }
+        if self._depths:
+            stats['queue_depth_mean'] = round(float(np.mean(self._depths)), 2)
+            stats['queue_depth_max'] = int(np.max(self._depths))
+        if self._latencies:
+            latencies = np.array(self._latencies) * 1000
+            stats['encode_ms_p50'] = round(float(np.percentile(latencies, 50)), 3)
+            stats['encode_ms_p95'] = round(float(np.percentile(latencies, 95)), 3)
+            stats['encode_ms_max'] = round(float(np.max(latencies)), 3)
+        return stats
+
+    def submit(self, cam_name, frame_index, frame, raw, sink, resize=None, codec=None):
+        # resize: (img_h, img_w, resample) to downscale the frame in the worker, see resize_frame
+        # codec: frame_codecs.Codec, PNG at the default level if None
+        if raw.nbytes > self._slot_size:
+            self._allocate(raw.nbytes)
+
+        if not self._free:
+            start = time.perf_counter()
+            while not self._free:
+                self._collect(block=True)
+            self._blocked += time.perf_counter() - start
+        self._collect(block=False)
+
+        slot = self._free.pop()
+        shm = self._slots[slot]
+        np.ndarray(raw.shape, dtype=raw.dtype, buffer=shm.buf)[...] = raw
+        self._depths.append(self.n_slots - len(self._free))
+        ext = codec.ext if codec is not None else 'png'
+        path = sink.path(cam_name, frame, ext) if sink.direct else None
+        self._pending[slot] = (sink, frame_index, frame, ext)
+        self._task_queue.put((slot, self._generation, shm.name, cam_name, raw.shape, raw.dtype.str, path, resize, codec))
+
+    def flush(self):
+        while len(self._free) < len(self._slots):
+            self._collect(block=True)
+        self._raise_errors()
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            for _ in self._workers:
+                self._task_queue.put(None)
+            for worker in self._workers:
+                worker.join()
+            self._release_slots()
+
+    def _collect(self, block):
+        while True:
+            try:
+                slot, cam_name, latency, error, payload = self._done_queue.get(block=block, timeout=60.0 if block else None)
+            except queue.Empty:
+                if not block:
+                    break
+                if not all(worker.is_alive() for worker in self._workers):
+                    raise RuntimeError('An encoder process died')
+                continue
+            sink, frame_index, frame, ext = self._pending.pop(slot)
+            self._free.append(slot)
+            if payload is not None:
+                sink.write(cam_name, frame_index, frame, payload, ext)
+            self._latencies.append(latency)
+            if self.timer is not None:
+                self.timer.add('encode_' + cam_name, latency)
+            if error is not None:
+                self._errors.append(error)
+            block = False
+        self._raise_errors()
+
+    def _raise_errors(self):
+        if self._errors:
+            errors, self._errors = self._errors, []
+            raise RuntimeError('Failed to encode %d frames, first error: %s' % (len(errors), errors[0]))
+
+    def _allocate(self, nbytes):
+        # wait until the workers are done with the old slots
+        self.flush()
+        self._release_slots()
+        self._generation += 1
+        self._slot_size = nbytes
+        self._slots = [shared_memory.SharedMemory(create=True, size=nbytes) for _ in range(self.n_slots)]
+        self._free = list(range(self.n_slots))
+        logging.info('Allocated %d shared memory slots with %d bytes each' % (self.n_slots, nbytes))
+
+    def _release_slots(self):
+        for shm in self._slots:
+            shm.close()
+            shm.unlink()
+        self._slots = []
+        self._free = []
+        self._slot_size = 0
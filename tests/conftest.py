@@ -0,0 +1,27 @@
+import os
+import sys
+
+import pytest
+
+# the modules of src/ and the offline CARLA stand-in instead of the client library
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+sys.path.insert(0, SRC)
+sys.path.insert(0, os.path.join(SRC, 'fake_carla'))
+
+import carla  # noqa: E402
+from syncworld import SyncWorld  # noqa: E402
+
+
+@pytest.fixture
+def sync_world(tmp_path):
+    client = carla.Client('localhost', 2000)
+    world = client.get_world()
+    settings = world.get_settings()
+    settings.synchronous_mode = True
+    settings.fixed_delta_seconds = 1.0 / 25
+    world.apply_settings(settings)
+    cam_transform = carla.Transform(carla.Location(x=1.5, z=2.4), carla.Rotation())
+    sync_world = SyncWorld(client, str(tmp_path), 'Town01_Opt', 1, 25, 32, 32, 90.0, cam_transform, 30, 30,
+                           'ClearNoon', 0.0)
+    with sync_world:
+        yield sync_world
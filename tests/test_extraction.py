@@ -0,0 +1,20 @@
+import numpy as np
+
+
+def test_snapshot_extraction_matches_actor_queries(sync_world):
+    for _ in range(10):
+        sync_world.tick(10.0)
+        snapshot = sync_world.world.get_snapshot()
+        from_snapshot = sync_world.extract_actor_states_snapshot(snapshot, np.empty_like(sync_world.actor_states))
+        from_actors = sync_world.extract_actor_states(np.empty_like(sync_world.actor_states))
+        assert from_snapshot.shape == (len(sync_world.actor_ids), 24)
+        np.testing.assert_allclose(from_snapshot, from_actors, rtol=1e-5, atol=1e-4)
+
+
+def test_snapshot_extraction_follows_actor_order(sync_world):
+    sync_world.tick(10.0)
+    snapshot = sync_world.world.get_snapshot()
+    states = sync_world.extract_actor_states_snapshot(snapshot, np.empty_like(sync_world.actor_states))
+    for row, actor in zip(states, sync_world.get_actors()):
+        location = actor.actor.get_transform().location
+        np.testing.assert_allclose(row[12:15], [location.x, location.y, location.z], rtol=1e-5, atol=1e-4)
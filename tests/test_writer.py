@@ -0,0 +1,27 @@
+import os
+
+from actors.Operator import Operator
+from sinks import FileSink
+from writer import AsyncFrameWriter, sensor_array
+
+
+def test_writer_pool_matches_save_to_disk(sync_world, tmp_path):
+    # the files of --writers N are byte for byte the ones of the inline writer (carla.Image.save_to_disk for depth)
+    inline, pooled = FileSink(str(tmp_path / 'inline')), FileSink(str(tmp_path / 'pooled'))
+    writer = AsyncFrameWriter(1)
+    try:
+        for frame_index in range(3):
+            _, _, cam_data, _ = sync_world.tick(10.0)
+            op = sync_world.op
+            for cam_name, cam_cc, data in zip(op.cam_names, op._cam_cc, cam_data):
+                Operator.save_image(cam_name, cam_cc, data, inline.path(cam_name, frame_index))
+                writer.submit(cam_name, frame_index, frame_index, sensor_array(cam_name, data), pooled)
+        writer.flush()
+    finally:
+        writer.close()
+
+    for cam_name in sync_world.op.cam_names:
+        for frame_index in range(3):
+            with open(inline.path(cam_name, frame_index), 'rb') as f, open(pooled.path(cam_name, frame_index), 'rb') as g:
+                assert f.read() == g.read(), '%s frame %d differs' % (cam_name, frame_index)
+    assert sorted(os.listdir(tmp_path / 'inline')) == sorted(os.listdir(tmp_path / 'pooled'))